@@ -4,11 +4,21 @@ Calculates Sharpe Ratio, Sortino Ratio, Max Drawdown, Win Rate, etc.
 """
 
 import argparse
+import itertools
 import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import numpy as np
 import pandas as pd
 from datetime import datetime
 
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from scripts.monte_carlo import bootstrap_metrics, format_table, trade_returns
+from scripts.signal_store import read_signals, SIDE_CODES, STATUS_CODES
+
 
 def calculate_sharpe_ratio(returns, risk_free_rate=0.0):
     """
@@ -29,7 +39,7 @@ def calculate_sortino_ratio(returns, risk_free_rate=0.0):
         return 0.0
     excess_returns = returns - risk_free_rate
     downside_returns = returns[returns < 0]
-    if len(downside_returns) == 0 or downside_returns.std() == 0:
+    if len(downside_returns) < 2 or downside_returns.std() == 0:
         return 0.0
     return np.sqrt(252) * excess_returns.mean() / downside_returns.std()
 
@@ -61,8 +71,7 @@ def calculate_win_rate(trades):
     """
     if len(trades) == 0:
         return 0.0
-    winning_trades = sum(1 for t in trades if t > 0)
-    return winning_trades / len(trades)
+    return float((np.asarray(trades) > 0).mean())
 
 
 def calculate_profit_factor(trades):
@@ -71,8 +80,9 @@ def calculate_profit_factor(trades):
     """
     if len(trades) == 0:
         return 0.0
-    gross_profit = sum(t for t in trades if t > 0)
-    gross_loss = abs(sum(t for t in trades if t < 0))
+    trades = np.asarray(trades)
+    gross_profit = trades[trades > 0].sum()
+    gross_loss = abs(trades[trades < 0].sum())
     if gross_loss == 0:
         return float('inf') if gross_profit > 0 else 0.0
     return gross_profit / gross_loss
@@ -93,8 +103,9 @@ def calculate_risk_reward_ratio(trades):
     """
     if len(trades) == 0:
         return 0.0
-    winning_trades = [t for t in trades if t > 0]
-    losing_trades = [t for t in trades if t < 0]
+    trades = np.asarray(trades)
+    winning_trades = trades[trades > 0]
+    losing_trades = trades[trades < 0]
 
     if len(winning_trades) == 0 or len(losing_trades) == 0:
         return 0.0
@@ -108,108 +119,449 @@ def calculate_risk_reward_ratio(trades):
     return avg_win / avg_loss
 
 
-def load_signals_history(history_dir):
+def compute_metrics(trade_log, initial_balance=10000, risk_per_trade=0.02):
     """
-    Завантажує історичні сигнали
+    Метрики звіту по трейд-логу simulate_trades. Усі рахуються з тієї ж серії дохідностей
+    на трейд (profit / баланс перед трейдом), що й bootstrap (monte_carlo.trade_returns),
+    тож точкові оцінки звіту та bootstrap збігаються.
     """
-    import os
-    signals = []
-    for date_folder in sorted(os.listdir(history_dir)):
-        signal_path = os.path.join(history_dir, date_folder, "signals.json")
-        if os.path.exists(signal_path):
-            with open(signal_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                signals.append({
-                    'date': date_folder,
-                    'signals': data.get('signals', [])
-                })
-    return signals
+    returns = pd.Series(trade_returns(trade_log, risk_per_trade))
+    equity_curve = initial_balance * np.cumprod(np.concatenate([[1.0], 1 + returns.to_numpy()]))
+    max_dd = calculate_max_drawdown(equity_curve)
+    return {
+        "total_return_pct": float(100 * (equity_curve[-1] / initial_balance - 1)),
+        "sharpe_ratio": float(calculate_sharpe_ratio(returns)),
+        "sortino_ratio": float(calculate_sortino_ratio(returns)),
+        "max_drawdown_pct": float(max_dd * 100),
+        "calmar_ratio": float(calculate_calmar_ratio(returns, max_dd)),
+        "win_rate_pct": float(calculate_win_rate(returns) * 100),
+        "profit_factor": float(calculate_profit_factor(returns)),
+        "expectancy": float(calculate_expectancy(trade_log['profit'])),
+        "avg_risk_reward_ratio": float(calculate_risk_reward_ratio(returns)),
+    }
 
 
-def simulate_trades(signals_history, initial_balance=10000, risk_per_trade=0.02):
+def load_signals_history(store_dir, start=None, end=None):
+    """
+    Завантажує історичні сигнали зі сховища (одна строка на сигнал)
+    """
+    return read_signals(store_dir, start=start, end=end,
+                        columns=["date", "symbol", "tf", "side", "status", "confidence", "entry", "sl", "tp1", "tp2"])
+
+
+SAME_BAR_RULES = ("sl", "tp", "open")
+
+
+def load_bars(data_dir, symbol, tf):
+    """OHLC arrays of data/{symbol}_{tf}.csv (None if the file is missing)."""
+    path = os.path.join(data_dir, f"{symbol}_{tf}.csv")
+    if not os.path.exists(path):
+        return None
+    df = pd.read_csv(path, usecols=["time", "Open", "High", "Low", "Close"], parse_dates=["time"])
+    return {
+        "time": df["time"].to_numpy(),
+        "open": df["Open"].to_numpy(dtype=np.float64),
+        "high": df["High"].to_numpy(dtype=np.float64),
+        "low": df["Low"].to_numpy(dtype=np.float64),
+        "close": df["Close"].to_numpy(dtype=np.float64),
+    }
+
+
+def entry_bars(bars, dates):
+    """
+    Index of the first bar a signal can trade in: the first bar opening at or after its stamp.
+    Stamps are the time the signal became known, and every store scores only bars closed by
+    then (bar-level signals are stamped with the bar close, daily ones score the last bar
+    closed by 00:00), so the first bar simulated is never part of the scored window.
+    """
+    return np.searchsorted(bars["time"], dates, side="left")
+
+
+def _first_touch(running_max, level):
+    """Index of the first bar whose running max reaches `level`; the window length if never."""
+    # Rows are non-decreasing, so counting the bars below the level is a row-wise searchsorted
+    return (running_max < level[:, None]).sum(axis=1)
+
+
+def _bar_windows(bars, side, start, max_bars):
+    """
+    Long-space bars of the max_bars bars from `start` for a chunk of signals: bar indices,
+    last in-data position per row (-1 if none), opens and running max of highs / -lows.
+    """
+    n_bars = len(bars["time"])
+    d = side[:, None]
+    idx = start[:, None] + np.arange(max_bars)
+    in_data = idx < n_bars
+    idx = np.minimum(idx, n_bars - 1)
+    # Beyond the data a bar can never touch a level
+    fav = np.where(in_data, np.where(d > 0, bars["high"][idx], -bars["low"][idx]), -np.inf)
+    adv = np.where(in_data, np.where(d > 0, -bars["low"][idx], bars["high"][idx]), -np.inf)
+    last = in_data.sum(axis=1) - 1
+    return idx, last, d * bars["open"][idx], np.maximum.accumulate(fav, axis=1), np.maximum.accumulate(adv, axis=1)
+
+
+def simulate_exits(bars, signals, max_bars=500, same_bar="sl", tp1_share=0.5, chunk=4096):
+    """
+    Exit of every signal of one (symbol, tf) against its bars, in two legs: tp1_share of the
+    position closes at TP1, the rest at TP2, and both at SL. A trade enters at the signal's entry
+    price and is followed over the `max_bars` bars from the first one opening at or after the
+    signal stamp (see entry_bars). Prices are mirrored for shorts ("long space"), so a level is
+    touched where the running max of highs (targets) or of negated lows (stop) first reaches it.
+    same_bar decides a bar that touches both SL and a target: "sl" (pessimistic), "tp"
+    (optimistic) or "open" (the level nearer to the bar open is hit first). A level gapped
+    through is filled at the bar open. Legs still open after max_bars exit at the last close
+    ("timeout"), or at the last bar in the data ("open").
+    Returns a frame aligned with `signals`: exit_time, exit_price, reason, r_multiple.
     """
-    Симулює трейди на основі історичних сигналів
+    legs = exit_legs(bars, signals, max_bars, same_bar, chunk)
+    n = len(signals)
+    exit_idx, exit_ls, reason = legs["exit_idx"], legs["exit_ls"], legs["reason"]
+    r_multiple = legs["leg_r"] @ np.array([tp1_share, 1 - tp1_share])
+    final_leg = np.argmax(exit_idx, axis=1)
+    final_idx = exit_idx[np.arange(n), final_leg]
+    entered = legs["entered"]
+    return pd.DataFrame({
+        "exit_time": np.where(entered, bars["time"][np.maximum(final_idx, 0)], np.datetime64("NaT")),
+        "exit_price": legs["side"] * exit_ls[np.arange(n), final_leg],
+        "reason": np.where(reason[:, 0] == reason[:, 1], reason[:, 0], reason[:, 0] + "+" + reason[:, 1]),
+        "r_multiple": np.where(entered, r_multiple, np.nan),
+    }, index=signals.index)
+
+
+def exit_legs(bars, signals, max_bars=500, same_bar="sl", chunk=4096):
     """
-    balance = initial_balance
-    equity_curve = [balance]
-    trades = []
-    trade_log = []
+    Per-leg exits behind simulate_exits (leg 0 targets TP1, leg 1 TP2) as arrays aligned with
+    `signals`: side (+1/-1), start (index of the entry bar), exit_idx and exit_ls (exit bar and
+    long-space fill per leg), reason, leg_r (R multiple per leg) and entered.
+    """
+    n_bars = len(bars["time"])
+    side = np.where(signals["side"].to_numpy() == SIDE_CODES["LONG"], 1.0, -1.0)
+    entry = side * signals["entry"].to_numpy(dtype=np.float64)
+    sl = side * signals["sl"].to_numpy(dtype=np.float64)
+    targets = [side * signals["tp1"].to_numpy(dtype=np.float64), side * signals["tp2"].to_numpy(dtype=np.float64)]
+    start = entry_bars(bars, signals["date"].to_numpy())
+
+    n = len(signals)
+    exit_idx = np.full((n, 2), -1, dtype=np.int64)
+    exit_ls = np.full((n, 2), np.nan)
+    reason = np.full((n, 2), "", dtype=object)
+
+    for lo in range(0, n, chunk):
+        rows = slice(lo, min(lo + chunk, n))
+        idx, last, open_ls, fav_max, adv_max = _bar_windows(bars, side[rows], start[rows], max_bars)
+        t_sl = _first_touch(adv_max, -sl[rows])
+        row_ids = np.arange(len(t_sl))
+        for leg, target in enumerate(targets):
+            t_tp = _first_touch(fav_max, target[rows])
+            hit_sl = t_sl < t_tp
+            same = (t_sl == t_tp) & (t_sl < max_bars)
+            if same_bar == "sl":
+                hit_sl |= same
+            elif same_bar == "open":
+                bar_open = open_ls[row_ids, np.minimum(t_sl, max_bars - 1)]
+                hit_sl |= same & (bar_open - sl[rows] <= target[rows] - bar_open)
+            t_exit = np.where(hit_sl, t_sl, t_tp)
+            touched = t_exit < max_bars
+            bar = np.minimum(t_exit, max_bars - 1)
+            bar_open = open_ls[row_ids, bar]
+            level_fill = np.where(hit_sl, np.minimum(bar_open, sl[rows]), np.maximum(bar_open, target[rows]))
+            last_close = side[rows] * bars["close"][idx[row_ids, np.maximum(last, 0)]]
+
+            exit_idx[rows, leg] = np.where(touched, idx[row_ids, bar], idx[row_ids, np.maximum(last, 0)])
+            exit_ls[rows, leg] = np.where(touched, level_fill, last_close)
+            reason[rows, leg] = np.where(touched, np.where(hit_sl, "sl", f"tp{leg + 1}"),
+                                         np.where(last == max_bars - 1, "timeout", "open"))
+
+    risk = entry - sl
+    # Signals with no bar after them never entered
+    return {"side": side, "start": start, "exit_idx": exit_idx, "exit_ls": exit_ls, "reason": reason,
+            "leg_r": (exit_ls - entry[:, None]) / risk[:, None], "entered": (start < n_bars) & (risk > 0)}
+
+
+def simulate_trades(signals_history, initial_balance=10000, risk_per_trade=0.02, data_dir="data",
+                    max_bars=500, same_bar="sl", tp1_share=0.5):
+    """
+    Симулює трейди ACTIVE сигналів на реальних барах data/{symbol}_{tf}.csv (див. simulate_exits).
+    Кожен трейд ризикує risk_per_trade від балансу на момент виходу; баланс рахується в порядку
+    часу виходу. Повертає (equity_curve, trades, trade_log)
+    """
+    active_signals = signals_history[
+        (signals_history['status'] == STATUS_CODES['ACTIVE']) & signals_history['sl'].notna()
+    ].reset_index(drop=True)
+
+    exits = []
+    for (symbol, tf), group in active_signals.groupby(['symbol', 'tf'], sort=False):
+        bars = load_bars(data_dir, symbol, tf)
+        if bars is None:
+            print(f"[WARN] No price data for {symbol} {tf}; skipping {len(group)} signals")
+            continue
+        exits.append(simulate_exits(bars, group, max_bars, same_bar, tp1_share))
+
+    if not exits:
+        return np.array([initial_balance]), [], pd.DataFrame()
+    trade_log = active_signals.join(pd.concat(exits), how='inner')
+    trade_log = trade_log[trade_log['r_multiple'].notna()].sort_values(['exit_time', 'date'], kind='stable')
+    trade_log['side'] = np.where(trade_log['side'] == SIDE_CODES['LONG'], "LONG", "SHORT")
+
+    growth = 1 + risk_per_trade * trade_log['r_multiple'].to_numpy()
+    balance = initial_balance * np.cumprod(growth)
+    trade_log['profit'] = np.diff(balance, prepend=initial_balance)
+    trade_log['balance'] = balance
+    trade_log = trade_log.drop(columns=['status']).reset_index(drop=True)
 
-    for day_data in signals_history:
-        date = day_data['date']
-        daily_signals = day_data['signals']
+    return np.concatenate([[initial_balance], balance]), trade_log['profit'].tolist(), trade_log
 
-        # Filter ACTIVE signals
-        active_signals = [s for s in daily_signals if s['signal']['decision']['status'] == 'ACTIVE']
 
-        for signal in active_signals:
-            # Simplified trade simulation
-            # В реальності треба враховувати TP/SL та реальні ціни
-            confidence = signal['signal']['decision']['confidence']
-            side = signal['signal']['primary']['side']
+# --- Parameter sweep -------------------------------------------------------------------
+# thresholds.prob decides which stored signals are ACTIVE and sl/tp multipliers set their
+# levels around the stored price and ATR, so the whole grid is evaluated from one set of
+# signals and bars. Excursions are measured in ATR from the entry, which turns every
+# multiplier into one more row-wise count over the same running max arrays.
 
-            # Simple random outcome based on confidence (для демонстрації)
-            # В реальному бектесті треба використовувати історичні ціни
-            outcome = np.random.choice([1, -1], p=[confidence, 1-confidence])
+SWEEP_COLUMNS = ["date", "symbol", "tf", "side", "confidence", "trend_up", "price", "atr"]
+SWEEP_METRICS = ["sharpe_ratio", "max_drawdown_pct", "profit_factor", "win_rate_pct", "expectancy_r",
+                 "total_return_pct"]
 
-            risk_amount = balance * risk_per_trade
-            if side == "LONG":
-                profit = risk_amount * 1.5 if outcome > 0 else -risk_amount
-            else:
-                profit = risk_amount * 1.5 if outcome < 0 else -risk_amount
 
-            balance += profit
-            equity_curve.append(balance)
-            trades.append(profit)
-            trade_log.append({
-                'date': date,
-                'symbol': signal['symbol'],
-                'side': side,
-                'confidence': confidence,
-                'profit': profit,
-                'balance': balance
-            })
+def parse_grid(spec):
+    """'0.5,0.6' or 'start:stop:step' (stop included) -> sorted float values."""
+    if ":" in spec:
+        start, stop, step = (float(v) for v in spec.split(":"))
+        return sorted(set(np.round(np.arange(start, stop + step / 2, step), 10).tolist()))
+    return sorted({float(v) for v in spec.split(",")})
 
-    return np.array(equity_curve), trades, trade_log
+
+def _sweep_legs(bars, signals, sl_mult, tp_mults, max_bars=500, same_bar="sl", chunk=4096):
+    """
+    R multiple and exit bar of a leg with stop sl_mult x ATR and target m x ATR, for every
+    m in tp_mults: two (signals, len(tp_mults)) arrays. Same rules as simulate_exits.
+    """
+    side = np.where(signals["side"].to_numpy() == SIDE_CODES["LONG"], 1.0, -1.0)
+    entry = side * signals["price"].to_numpy(dtype=np.float64)
+    atr = signals["atr"].to_numpy(dtype=np.float64)
+    # Without an ATR there are no levels, so like a zero-risk signal in exit_legs it never enters
+    has_atr = atr > 0
+    atr = np.where(has_atr, atr, 1.0)
+    start = entry_bars(bars, signals["date"].to_numpy())
+    n = len(signals)
+    r_multiple = np.full((n, len(tp_mults)), np.nan)
+    exit_idx = np.full((n, len(tp_mults)), -1, dtype=np.int64)
+
+    for lo in range(0, n, chunk):
+        rows = slice(lo, min(lo + chunk, n))
+        idx, last, open_ls, fav_max, adv_max = _bar_windows(bars, side[rows], start[rows], max_bars)
+        scale = atr[rows, None]
+        fav_x = (fav_max - entry[rows, None]) / scale
+        adv_x = (adv_max + entry[rows, None]) / scale
+        open_x = (open_ls - entry[rows, None]) / scale
+        row_ids = np.arange(len(last))
+        close_x = (side[rows] * bars["close"][idx[row_ids, np.maximum(last, 0)]] - entry[rows]) / atr[rows]
+
+        t_sl = _first_touch(adv_x, np.full(len(last), sl_mult))
+        for k, tp_mult in enumerate(tp_mults):
+            t_tp = _first_touch(fav_x, np.full(len(last), tp_mult))
+            hit_sl = t_sl < t_tp
+            same = (t_sl == t_tp) & (t_sl < max_bars)
+            if same_bar == "sl":
+                hit_sl |= same
+            elif same_bar == "open":
+                bar_open = open_x[row_ids, np.minimum(t_sl, max_bars - 1)]
+                hit_sl |= same & (bar_open + sl_mult <= tp_mult - bar_open)
+            t_exit = np.where(hit_sl, t_sl, t_tp)
+            touched = t_exit < max_bars
+            bar = np.minimum(t_exit, max_bars - 1)
+            bar_open = open_x[row_ids, bar]
+            fill = np.where(hit_sl, np.minimum(bar_open, -sl_mult), np.maximum(bar_open, tp_mult))
+            r_multiple[rows, k] = np.where(touched, fill, close_x) / sl_mult
+            exit_idx[rows, k] = np.where(touched, idx[row_ids, bar], idx[row_ids, np.maximum(last, 0)])
+        r_multiple[rows][last < 0] = np.nan
+    r_multiple[~has_atr] = np.nan
+    return r_multiple, exit_idx
+
+
+def sweep_metrics(r_multiple, risk_per_trade=0.02):
+    """
+    Ranking metrics of one trade sequence (R multiples in exit order), with fixed-fraction sizing.
+    Every key is always present; with fewer than 2 trades the metrics are NaN.
+    """
+    n = len(r_multiple)
+    if n < 2:
+        return {"trades": n, **dict.fromkeys(SWEEP_METRICS, float("nan"))}
+    returns = risk_per_trade * r_multiple
+    equity = np.cumprod(np.concatenate([[1.0], 1 + returns]))
+    std = returns.std(ddof=1)
+    gross_loss = -returns[returns < 0].sum()
+    gross_profit = returns[returns > 0].sum()
+    return {
+        "trades": n,
+        "sharpe_ratio": float(np.sqrt(252) * returns.mean() / std) if std > 0 else 0.0,
+        "max_drawdown_pct": float(100 * (1 - equity / np.maximum.accumulate(equity)).max()),
+        "profit_factor": float(gross_profit / gross_loss) if gross_loss > 0 else (float('inf') if gross_profit > 0 else 0.0),
+        "win_rate_pct": float(100 * (r_multiple > 0).mean()),
+        "expectancy_r": float(r_multiple.mean()),
+        "total_return_pct": float(100 * (equity[-1] - 1)),
+    }
+
+
+# Per-process sweep state: the signals and their bars, loaded once per worker
+_sweep = {}
+
+def init_sweep(store_dir, data_dir):
+    signals = read_signals(store_dir, columns=SWEEP_COLUMNS)
+    groups = []
+    for (symbol, tf), group in signals.groupby(['symbol', 'tf'], sort=False):
+        bars = load_bars(data_dir, symbol, tf)
+        if bars is not None:
+            groups.append((symbol, tf, bars, group.reset_index(drop=True)))
+    _sweep.update(groups=groups)
+
+
+def sweep_task(sl_mult, prob_grid, tp1_grid, tp2_grid, tp1_share, max_bars, same_bar, risk_per_trade):
+    """Metrics of every (prob, tp1, tp2) point with one sl_mult, overall and per timeframe."""
+    started = time.time()
+    tp_mults = sorted(set(tp1_grid) | set(tp2_grid))
+    col = {m: k for k, m in enumerate(tp_mults)}
+    parts = [(_sweep_legs(bars, group, sl_mult, tp_mults, max_bars, same_bar), bars, group)
+             for _, _, bars, group in _sweep["groups"]]
+    r_leg = np.concatenate([legs[0] for legs, _, _ in parts])
+    exit_time = np.concatenate([bars["time"][np.maximum(legs[1], 0)] for legs, bars, _ in parts])
+    signals = pd.concat([group for _, _, group in parts], ignore_index=True)
+
+    side_long = signals["side"].to_numpy() == SIDE_CODES["LONG"]
+    trend_pass = side_long == (signals["trend_up"].to_numpy() == 1)
+    confidence = signals["confidence"].to_numpy()
+    tf = signals["tf"].to_numpy()
+    groups = [("ALL", None)] + [(name, tf == name) for name in sorted(set(tf))]
+
+    rows = []
+    for tp1, tp2 in itertools.product(tp1_grid, tp2_grid):
+        if tp2 <= tp1:
+            continue
+        a, b = col[tp1], col[tp2]
+        r_multiple = tp1_share * r_leg[:, a] + (1 - tp1_share) * r_leg[:, b]
+        order = np.argsort(np.maximum(exit_time[:, a], exit_time[:, b]), kind="stable")
+        entered = ~np.isnan(r_multiple[order])
+        for prob in prob_grid:
+            active = entered & trend_pass[order] & (confidence[order] >= prob)
+            for name, in_group in groups:
+                mask = active if in_group is None else active & in_group[order]
+                rows.append({"tf": name, "prob": prob, "sl_mult": sl_mult, "tp1_mult": tp1, "tp2_mult": tp2,
+                             **sweep_metrics(r_multiple[order][mask], risk_per_trade)})
+    return rows, time.time() - started
+
+
+def rank_sweep(results, min_trades=30):
+    """
+    Orders the sweep by the mean of its Sharpe (high), max drawdown (low) and profit factor
+    (high) ranks within each timeframe group; points with fewer than min_trades come last.
+    """
+    table = pd.DataFrame(results)
+    enough = table["trades"] >= min_trades
+    ranks = pd.DataFrame({
+        "sharpe": table["sharpe_ratio"].where(enough).groupby(table["tf"]).rank(ascending=False),
+        "drawdown": table["max_drawdown_pct"].where(enough).groupby(table["tf"]).rank(ascending=True),
+        "profit_factor": table["profit_factor"].where(enough).groupby(table["tf"]).rank(ascending=False),
+    })
+    table["rank_score"] = ranks.mean(axis=1)
+    return table.sort_values(["tf", "rank_score", "prob", "sl_mult", "tp1_mult", "tp2_mult"],
+                             na_position="last").reset_index(drop=True)
+
+
+def run_sweep(args):
+    prob_grid, sl_grid = parse_grid(args.prob_grid), parse_grid(args.sl_grid)
+    tp1_grid, tp2_grid = parse_grid(args.tp1_grid), parse_grid(args.tp2_grid)
+    n_points = len(prob_grid) * len(sl_grid) * sum(1 for a in tp1_grid for b in tp2_grid if b > a)
+    print(f"[INFO] Sweeping {n_points} grid points "
+          f"({len(prob_grid)} prob x {len(sl_grid)} sl x tp1/tp2 pairs) over {args.store}...")
+
+    started = time.time()
+    task_args = [(sl_mult, prob_grid, tp1_grid, tp2_grid, args.tp1_share, args.max_bars, args.same_bar,
+                  args.risk_per_trade) for sl_mult in sl_grid]
+    workers = max(1, min(args.workers, len(task_args)))
+    results = []
+    if workers == 1:
+        init_sweep(args.store, args.data_dir)
+        outputs = (sweep_task(*a) for a in task_args)
+    else:
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=init_sweep, initargs=(args.store, args.data_dir))
+        outputs = (f.result() for f in as_completed([pool.submit(sweep_task, *a) for a in task_args]))
+    try:
+        for rows, seconds in outputs:
+            results.extend(rows)
+            print(f"[SWEEP] sl_mult={rows[0]['sl_mult'] if rows else '?'}: {len(rows)} results ({seconds:.1f}s)")
+    finally:
+        if workers > 1:
+            pool.shutdown(cancel_futures=True)
+
+    table = rank_sweep(results, args.min_trades)
+    os.makedirs(os.path.dirname(args.sweep_output) or ".", exist_ok=True)
+    table.to_csv(args.sweep_output, index=False)
+
+    cols = ["prob", "sl_mult", "tp1_mult", "tp2_mult", "trades", "sharpe_ratio", "max_drawdown_pct",
+            "profit_factor", "win_rate_pct", "expectancy_r"]
+    for name, group in table.groupby("tf", sort=False):
+        print(f"\n{'='*60}\nTOP {args.top} ({name})\n{'='*60}")
+        print(group.head(args.top)[cols].to_string(index=False, float_format=lambda v: f"{v:.3f}"))
+    print(f"\n[OK] {len(table)} sweep results saved to {args.sweep_output} ({time.time() - started:.1f}s)")
 
 
 def main():
     parser = argparse.ArgumentParser(description="Evaluate backtest with financial metrics")
-    parser.add_argument("--history-dir", default="outputs/history", help="Directory with historical signals")
+    parser.add_argument("--store", default="outputs/signal_store", help="Signal store with historical signals (outputs/bar_signal_store replays bar-level signals)")
     parser.add_argument("--initial-balance", type=float, default=10000, help="Initial account balance")
     parser.add_argument("--risk-per-trade", type=float, default=0.02, help="Risk per trade as % of balance")
     parser.add_argument("--output", default="outputs/backtest_report.json", help="Output report file")
+    parser.add_argument("--data-dir", default="data", help="Directory with {symbol}_{tf}.csv price bars")
+    parser.add_argument("--max-bars", type=int, default=500, help="Bars a trade may stay open before it is closed")
+    parser.add_argument("--same-bar", choices=SAME_BAR_RULES, default="sl",
+                        help="Bar touching both SL and a TP: sl (pessimistic), tp (optimistic), open (nearer level first)")
+    parser.add_argument("--trade-log", default="outputs/backtest_trades.csv", help="Full trade log (CSV)")
+    parser.add_argument("--tp1-share", type=float, default=0.5, help="Share of the position closed at TP1")
+    parser.add_argument("--bootstrap-paths", type=int, default=0,
+                        help="Block-bootstrap paths for metric confidence intervals (0 to disable)")
+    parser.add_argument("--bootstrap-block", type=int, default=0, help="Bootstrap block length in trades (0: n^(1/3))")
+    # Parameter sweep
+    parser.add_argument("--sweep", action="store_true",
+                        help="Evaluate a grid of thresholds.prob and sl/tp multipliers instead of one backtest")
+    parser.add_argument("--prob-grid", default="0.4:0.7:0.05", help="thresholds.prob values ('a,b,c' or 'start:stop:step')")
+    parser.add_argument("--sl-grid", default="0.8:1.6:0.2", help="sl_mult values")
+    parser.add_argument("--tp1-grid", default="1.0:2.0:0.2", help="tp1_mult values")
+    parser.add_argument("--tp2-grid", default="1.6:3.2:0.4", help="tp2_mult values (only pairs with tp2 > tp1)")
+    parser.add_argument("--workers", type=int, default=1, help="Sweep processes (one task per sl_mult value)")
+    parser.add_argument("--min-trades", type=int, default=30, help="Sweep points with fewer trades are ranked last")
+    parser.add_argument("--top", type=int, default=10, help="Sweep points printed per timeframe")
+    parser.add_argument("--sweep-output", default="outputs/backtest_sweep.csv", help="Full ranked sweep table (CSV)")
     args = parser.parse_args()
 
+    if args.sweep:
+        run_sweep(args)
+        return
+
     print("[INFO] Loading signals history...")
-    signals_history = load_signals_history(args.history_dir)
-    print(f"[INFO] Loaded {len(signals_history)} days of signals")
+    signals_history = load_signals_history(args.store)
+    print(f"[INFO] Loaded {len(signals_history)} signals over {signals_history['date'].dt.normalize().nunique()} days")
 
     print("[INFO] Running backtest simulation...")
     equity_curve, trades, trade_log = simulate_trades(
         signals_history,
         initial_balance=args.initial_balance,
-        risk_per_trade=args.risk_per_trade
+        risk_per_trade=args.risk_per_trade,
+        data_dir=args.data_dir,
+        max_bars=args.max_bars,
+        same_bar=args.same_bar,
+        tp1_share=args.tp1_share
     )
 
     if len(trades) == 0:
         print("[WARN] No trades executed. Cannot calculate metrics.")
         return
 
-    # Calculate returns
-    returns = pd.Series(trades) / args.initial_balance
-
-    # Calculate metrics
+    # Calculate metrics (from the same per-trade returns as the bootstrap below)
+    returns = trade_returns(trade_log, args.risk_per_trade)
+    metrics = compute_metrics(trade_log, args.initial_balance, args.risk_per_trade)
     final_balance = equity_curve[-1]
-    total_return = (final_balance - args.initial_balance) / args.initial_balance
-    sharpe = calculate_sharpe_ratio(returns)
-    sortino = calculate_sortino_ratio(returns)
-    max_dd = calculate_max_drawdown(equity_curve)
-    calmar = calculate_calmar_ratio(returns, max_dd)
-    win_rate = calculate_win_rate(trades)
-    profit_factor = calculate_profit_factor(trades)
-    expectancy = calculate_expectancy(trades)
-    risk_reward = calculate_risk_reward_ratio(trades)
+    total_return = metrics.pop("total_return_pct") / 100
 
     # Create report
     report = {
@@ -218,19 +570,11 @@ def main():
         "final_balance": float(final_balance),
         "total_return_pct": float(total_return * 100),
         "total_trades": len(trades),
-        "winning_trades": int(sum(1 for t in trades if t > 0)),
-        "losing_trades": int(sum(1 for t in trades if t < 0)),
-        "metrics": {
-            "sharpe_ratio": float(sharpe),
-            "sortino_ratio": float(sortino),
-            "max_drawdown_pct": float(max_dd * 100),
-            "calmar_ratio": float(calmar),
-            "win_rate_pct": float(win_rate * 100),
-            "profit_factor": float(profit_factor),
-            "expectancy": float(expectancy),
-            "avg_risk_reward_ratio": float(risk_reward),
-        },
-        "trade_log": trade_log[-100:]  # Last 100 trades
+        "winning_trades": int((returns > 0).sum()),
+        "losing_trades": int((returns < 0).sum()),
+        "metrics": metrics,
+        "exit_reasons": trade_log['reason'].value_counts().to_dict(),
+        "trade_log": json.loads(trade_log.tail(100).to_json(orient='records', date_format='iso'))  # Last 100 trades
     }
 
     # Print summary
@@ -241,23 +585,35 @@ def main():
     print(f"Final Balance:      ${final_balance:,.2f}")
     print(f"Total Return:       {total_return*100:+.2f}%")
     print(f"Total Trades:       {len(trades)}")
-    print(f"Win Rate:           {win_rate*100:.2f}%")
+    print(f"Win Rate:           {metrics['win_rate_pct']:.2f}%")
     print("\nPERFORMANCE METRICS")
     print("-"*60)
-    print(f"Sharpe Ratio:       {sharpe:.3f}")
-    print(f"Sortino Ratio:      {sortino:.3f}")
-    print(f"Max Drawdown:       {max_dd*100:.2f}%")
-    print(f"Calmar Ratio:       {calmar:.3f}")
-    print(f"Profit Factor:      {profit_factor:.3f}")
-    print(f"Expectancy:         ${expectancy:.2f}")
-    print(f"Risk/Reward Ratio:  {risk_reward:.3f}")
+    print(f"Sharpe Ratio:       {metrics['sharpe_ratio']:.3f}")
+    print(f"Sortino Ratio:      {metrics['sortino_ratio']:.3f}")
+    print(f"Max Drawdown:       {metrics['max_drawdown_pct']:.2f}%")
+    print(f"Calmar Ratio:       {metrics['calmar_ratio']:.3f}")
+    print(f"Profit Factor:      {metrics['profit_factor']:.3f}")
+    print(f"Expectancy:         ${metrics['expectancy']:.2f}")
+    print(f"Risk/Reward Ratio:  {metrics['avg_risk_reward_ratio']:.3f}")
     print("="*60)
 
+    if args.bootstrap_paths > 0 and len(trades) > 1:
+        # Resampled equity paths: is the result distinguishable from luck?
+        bootstrap = bootstrap_metrics(returns, args.bootstrap_paths,
+                                      args.bootstrap_block or None)
+        report["bootstrap"] = bootstrap
+        print(f"\nBOOTSTRAP ({args.bootstrap_paths} paths, 95% CI)")
+        print("-"*60)
+        print(format_table(bootstrap, 0.95))
+        print("="*60)
+
     # Save report
     with open(args.output, 'w', encoding='utf-8') as f:
         json.dump(report, f, indent=2, ensure_ascii=False)
+    trade_log.to_csv(args.trade_log, index=False)
 
     print(f"\n[OK] Report saved to {args.output}")
+    print(f"[OK] Trade log ({len(trade_log)} trades) saved to {args.trade_log}")
 
 
 if __name__ == "__main__":
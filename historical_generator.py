@@ -1,19 +1,27 @@
 
 import argparse
+import hashlib
 import json
+import multiprocessing
 import os
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime, timedelta
 
 import numpy as np
 import pandas as pd
 import tensorflow as tf
 import yaml
-from tqdm import tqdm
+from numpy.lib.stride_tricks import sliding_window_view
 
 # Add current directory to path for imports
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
-from scripts.utils import make_features
+from scripts.utils import make_features, load_features_tail, ema_warmup, FEATURE_MAX_EMA_SPAN, TF_MINUTES
+from scripts.signal_store import (append_signals, drop_stale_signals, read_signals, LEGACY_VERSION, SIDE_CODES,
+                                  STATUS_CODES)
+from scripts.currency_strength import load_price_data
+from scripts.meta_dataset import MetaFeatureMatrix, SIGNAL_FIELDS, attach_labels, save_meta_dataset
 
 # --- Helper Functions (adapted from infer_signals.py) ---
 
@@ -21,152 +29,329 @@ def load_cfg(path):
     with open(path, "r", encoding="utf-8") as f:
         return yaml.safe_load(f)
 
-def build_trade(side: str, price: float, atr_value: float, params: dict, rounder: int, confidence: float):
-    sl_mult = params["sl_mult"]
-    tp1_mult = params["tp1_mult"]
-    tp2_mult = params["tp2_mult"]
-    if side == "LONG":
-        entry = price
-        sl = entry - sl_mult * atr_value
-        tp1 = entry + tp1_mult * atr_value
-        tp2 = entry + tp2_mult * atr_value
-    else:
-        entry = price
-        sl = entry + sl_mult * atr_value
-        tp1 = entry - tp1_mult * atr_value
-        tp2 = entry - tp2_mult * atr_value
-    return {
-        "side": side,
-        "entry": round(entry, rounder),
-        "sl": round(sl, rounder),
-        "tp1": round(tp1, rounder),
-        "tp2": round(tp2, rounder),
+def signals_frame(symbol, tf_name, prob_th, params, proba, price, atr_values, trend_up, stamps, version=""):
+    """
+    Vectorized counterpart of infer_signals.infer_one: the same side, status and trade
+    levels for a whole batch of predictions, as rows in the signal store layout.
+    """
+    p_short, p_no, p_long = proba[:, 0], proba[:, 1], proba[:, 2]
+    trend_up = trend_up.astype(bool)
+    long_side = p_long >= p_short
+    confidence = np.where(long_side, p_long, p_short)
+    trend_pass = np.where(long_side, trend_up, ~trend_up)
+    active = (confidence >= prob_th) & trend_pass
+
+    rounder = 3 if symbol.endswith("JPY") else 5
+    sign = np.where(long_side, 1.0, -1.0)
+    return pd.DataFrame({
+        "date": stamps,
+        "symbol": symbol,
+        "tf": tf_name,
+        "p_short": p_short,
+        "p_no": p_no,
+        "p_long": p_long,
+        "trend_up": trend_up.astype(np.int8),
+        "side": np.where(long_side, SIDE_CODES["LONG"], SIDE_CODES["SHORT"]),
+        "status": np.where(active, STATUS_CODES["ACTIVE"], STATUS_CODES["WATCHLIST"]),
         "confidence": confidence,
-    }
+        "price": np.round(price, rounder),
+        "atr": np.round(atr_values, rounder),
+        "entry": np.round(price, rounder),
+        "sl": np.round(price - sign * params["sl_mult"] * atr_values, rounder),
+        "tp1": np.round(price + sign * params["tp1_mult"] * atr_values, rounder),
+        "tp2": np.round(price + sign * params["tp2_mult"] * atr_values, rounder),
+        "model_version": version,
+    })
 
-def infer_one_historical(symbol, tf_name, prob_th, params, full_df, current_date):
+def load_series(symbol, tf_name, full_df=None, since=None):
     """
-    Generates a signal for a given symbol/timeframe for a specific historical date.
+    Features, feature columns, seq_len, model path and the first usable window end for one
+    pair, or None if untrained. With `since` and no `full_df`, only the bars needed to cover
+    `since` onwards are read (see scripts.utils.load_features_tail).
     """
     meta_path = f"data/{symbol}_{tf_name}_meta.json"
     model_path = f"models/{symbol}_{tf_name}_lstm.h5"
     if not (os.path.exists(meta_path) and os.path.exists(model_path)):
         return None
 
-    # Filter data up to the current historical date
-    df = full_df[full_df['time'] <= current_date].copy()
-    if df.empty:
-        return None
-
-    feat = make_features(df)
     with open(meta_path, "r", encoding="utf-8") as f:
         meta = json.load(f)
-    cols = meta["features"]
     seq_len = meta["seq_len"]
-    
-    if len(feat) < seq_len + 1:
+
+    if full_df is not None:
+        feat = make_features(full_df)
+    elif since is not None:
+        # Calendar bars are an upper bound on traded bars; +2 absorbs broker clock offsets
+        minutes = (datetime.now() - pd.Timestamp(since)).total_seconds() / 60
+        extra_rows = int(np.ceil(max(minutes, 0) / TF_MINUTES[tf_name])) + 2
+        feat = load_features_tail(f"data/{symbol}_{tf_name}.csv", seq_len, extra_rows=extra_rows)
+    else:
+        feat = make_features(pd.read_csv(f"data/{symbol}_{tf_name}.csv", parse_dates=["time"]))
+
+    # A prefix needs seq_len + 1 rows; a tail also needs its EMAs to have converged
+    min_end = seq_len + (ema_warmup(FEATURE_MAX_EMA_SPAN) if feat.attrs.get("tail") else 0)
+    return feat, meta["features"], seq_len, model_path, min_end
+
+def score_windows(symbol, tf_name, prob_th, params, series, ends, stamps, version="",
+                  batch_size=1024, chunk_size=8192):
+    """
+    Scores the seq_len window ending at each bar index in `ends`.
+    Every feature in make_features is causal, so features are computed once over the whole
+    series and the windows are gathered from a strided view, chunk by chunk to bound memory,
+    with one batched predict per chunk and a single model load.
+    """
+    feat, cols, seq_len, model_path, _ = series
+    values = feat[cols].to_numpy(dtype=np.float32)
+    windows = sliding_window_view(values, seq_len, axis=0)  # (bars - seq_len + 1, features, seq_len)
+
+    if len(ends) == 0:
+        proba = np.zeros((0, 3), dtype=np.float32)
+    else:
+        model = tf.keras.models.load_model(model_path)
+        proba = np.concatenate([
+            model.predict(windows[ends[i:i + chunk_size] - seq_len + 1].transpose(0, 2, 1),
+                          batch_size=batch_size, verbose=0)
+            for i in range(0, len(ends), chunk_size)
+        ])
+
+    return signals_frame(
+        symbol, tf_name, prob_th, params, proba,
+        feat["Close"].to_numpy(dtype=np.float64)[ends],
+        feat["ATR14"].to_numpy(dtype=np.float64)[ends],
+        feat["TrendUp"].to_numpy()[ends],
+        stamps, version,
+    )
+
+def closed_bar_ends(times, tf_name, stamps):
+    """
+    Index of the last bar closed by each stamp (-1 if none). A bar opening at the stamp is
+    still forming then, so its close is never part of a signal stamped with that time.
+    """
+    closes = times + np.timedelta64(TF_MINUTES[tf_name], "m")
+    return np.searchsorted(closes, np.array(stamps, dtype=times.dtype), side="right") - 1
+
+def backfill_signals(symbol, tf_name, prob_th, params, full_df, dates, version=""):
+    """
+    Signals as of 00:00 of every date in `dates` (the window ends at the last bar closed by
+    then), stamped with the date. Dates without enough history are left out.
+    Without `full_df` only the tail of the CSV covering `dates` is read.
+    """
+    # The first window ends at the bar closing at the earliest date, one bar before it
+    since = pd.Timestamp(min(dates)) - pd.Timedelta(minutes=TF_MINUTES[tf_name])
+    series = load_series(symbol, tf_name, full_df, since=since)
+    if series is None:
         return None
+    ends = closed_bar_ends(series[0]["time"].to_numpy(), tf_name, dates)
+    valid = ends >= series[4]
+    return score_windows(symbol, tf_name, prob_th, params, series, ends[valid],
+                         np.array(dates, dtype="datetime64[s]")[valid], version)
 
-    X = feat[cols].values[-seq_len:].astype(np.float32)[None, ...]
-    model = tf.keras.models.load_model(model_path)
-    proba = model.predict(X, verbose=0)[0]
-    p_short, p_no, p_long = float(proba[0]), float(proba[1]), float(proba[2])
+def backfill_bar_signals(symbol, tf_name, prob_th, params, full_df, start, version="", skip=()):
+    """
+    One signal per closed bar whose close falls on or after `start`, stamped with the bar
+    close time so replaying them never looks ahead. Stamps in `skip` are left out, and
+    without `full_df` only bars after the latest skipped stamp are read.
+    """
+    since = max(pd.Timestamp(start), pd.Timestamp(max(skip))) if len(skip) else start
+    series = load_series(symbol, tf_name, full_df, since=since)
+    if series is None:
+        return None
+    stamps = series[0]["time"].to_numpy() + np.timedelta64(TF_MINUTES[tf_name], "m")
+    ends = np.arange(len(stamps))
+    # The final row can still be forming, so it is never scored
+    keep = (ends >= series[4]) & (ends < len(stamps) - 1) & (stamps >= np.datetime64(start))
+    if len(skip):
+        keep &= ~np.isin(stamps.astype("datetime64[s]"), np.asarray(skip, dtype="datetime64[s]"))
+    return score_windows(symbol, tf_name, prob_th, params, series, ends[keep],
+                         stamps[keep].astype("datetime64[s]"), version)
 
-    last = feat.iloc[-1]
-    price = float(last["Close"])
-    atr_value = float(last["ATR14"])
-    trend_up = int(last["TrendUp"]) == 1
+def model_version(symbol, tf_name):
+    """Short content hash of the model and its feature meta; changes whenever either is retrained."""
+    h = hashlib.sha1()
+    for path in (f"models/{symbol}_{tf_name}_lstm.h5", f"data/{symbol}_{tf_name}_meta.json"):
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                h.update(f.read())
+    return h.hexdigest()[:16]
 
-    primary_side = "LONG" if p_long >= p_short else "SHORT"
-    alt_side = "SHORT" if primary_side == "LONG" else "LONG"
-    primary_conf = p_long if primary_side == "LONG" else p_short
-    alt_conf = p_short if alt_side == "SHORT" else p_long
+def current_rows(stored, versions):
+    """
+    Mask of the stored rows made by the current model of their pair (`versions` maps
+    "SYMBOL_TF" to model_version()). Legacy rows migrated from the JSON history carry no
+    version and count as current; drop_stale_signals keeps them too.
+    """
+    current = (stored["symbol"] + "_" + stored["tf"]).map(versions)
+    return ((stored["model_version"] == current) | (stored["model_version"] == LEGACY_VERSION)).to_numpy()
 
-    rounder = 3 if symbol.endswith("JPY") else 5
-    primary_trade = build_trade(primary_side, price, atr_value, params, rounder, primary_conf)
-    alternative_trade = build_trade(alt_side, price, atr_value, params, rounder, alt_conf)
-
-    prob_pass = primary_conf >= prob_th
-    trend_pass = (primary_side == "LONG" and trend_up) or (primary_side == "SHORT" and not trend_up)
-    status = "ACTIVE" if prob_pass and trend_pass else "WATCHLIST"
-    issues = []
-    if not prob_pass:
-        issues.append("низька впевненість")
-    if not trend_pass:
-        issues.append("тренд проти сигналу")
-    comment = "Фільтри пройдено, сигнал активний." if status == "ACTIVE" else "Очікуємо: " + ", ".join(issues)
-
-    return {
-        "symbol": symbol,
-        "tf": tf_name,
-        "time": current_date.isoformat() + "Z",
-        "price": round(price, rounder),
-        "atr": round(atr_value, rounder),
-        "signal": {
-            "decision": {
-                "side": primary_side,
-                "status": status,
-                "confidence": primary_conf,
-                "probability_pass": prob_pass,
-                "trend_pass": trend_pass,
-                "comment": comment,
-            },
-            "primary": primary_trade,
-            "alternative": alternative_trade,
-            "trend_up": trend_up,
-            "probabilities": {"short": p_short, "no": p_no, "long": p_long},
-        },
-    }
+def init_worker(tf_threads):
+    """Caps TensorFlow's thread pools so parallel workers don't oversubscribe the CPU."""
+    os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
+    tf.get_logger().setLevel('ERROR')
+    tf.config.threading.set_intra_op_parallelism_threads(tf_threads)
+    tf.config.threading.set_inter_op_parallelism_threads(tf_threads)
+
+def backfill_shard(symbol, tf_name, tf_cfg, prob_th, version, dates=None, bars_from=None, skip=()):
+    """One (symbol, tf) unit of work; safe to run in a worker process."""
+    started = time.time()
+    if bars_from is not None:
+        frame = backfill_bar_signals(symbol, tf_name, prob_th, tf_cfg, None, bars_from, version, skip)
+    else:
+        frame = backfill_signals(symbol, tf_name, prob_th, tf_cfg, None, dates, version)
+    return symbol, tf_name, frame, time.time() - started
+
+def run_shards(shards, args, store, unit, matrix=None):
+    """Runs shards in-process or on a spawn pool, flushing finished frames to the store."""
+    pending = []
+
+    def flush():
+        if pending and not args.no_store:
+            append_signals(store, pd.concat(pending, ignore_index=True))
+            pending.clear()
+
+    tf_threads = args.tf_threads or max(1, (os.cpu_count() or 1) // max(1, args.workers))
+    started = time.time()
+    last_flush = started
+    try:
+        if args.workers > 1:
+            # spawn: TensorFlow is not fork-safe, and it matches the Windows default
+            ctx = multiprocessing.get_context("spawn")
+            pool = ProcessPoolExecutor(max_workers=args.workers, mp_context=ctx,
+                                       initializer=init_worker, initargs=(tf_threads,))
+            completed = as_completed([pool.submit(backfill_shard, **shard) for shard in shards])
+        else:
+            pool = None
+            init_worker(tf_threads)
+            completed = (backfill_shard(**shard) for shard in shards)
+
+        for finished, item in enumerate(completed, 1):
+            symbol, tf_name, frame, shard_seconds = item.result() if pool else item
+            rows = 0 if frame is None else len(frame)
+            if rows:
+                pending.append(frame)
+                if matrix is not None:
+                    matrix.add(frame)
+            elapsed = time.time() - started
+            eta = elapsed / finished * (len(shards) - finished)
+            print(f"[{finished}/{len(shards)}] {symbol} {tf_name}: {rows} {unit} "
+                  f"in {shard_seconds:.1f}s | elapsed {timedelta(seconds=int(elapsed))}, "
+                  f"ETA {timedelta(seconds=int(eta))}")
+            if time.time() - last_flush >= args.flush_every:
+                flush()
+                last_flush = time.time()
+    finally:
+        if pool:
+            pool.shutdown(cancel_futures=True)
+        flush()
 
 def main():
     ap = argparse.ArgumentParser(description="Generate historical signals for backtesting.")
     ap.add_argument("--config", required=True, help="Path to config.yaml")
     ap.add_argument("--days", type=int, default=365, help="Number of past days to generate data for.")
-    ap.add_argument("--outdir", default="outputs/history", help="Directory to save historical signal files.")
+    ap.add_argument("--store", default=None,
+                    help="Signal store directory to write into "
+                         "(default: outputs/signal_store, or outputs/bar_signal_store with --bars).")
+    ap.add_argument("--bars", action="store_true",
+                    help="Generate a signal at every closed bar instead of once a day at 00:00.")
+    ap.add_argument("--timeframes", default=None,
+                    help="Comma-separated timeframes to process (default: all; intraday only with --bars).")
+    ap.add_argument("--workers", type=int, default=1, help="Worker processes; work is sharded by (symbol, tf).")
+    ap.add_argument("--tf-threads", type=int, default=0,
+                    help="TensorFlow threads per worker (default: CPU count / workers).")
+    ap.add_argument("--force", action="store_true", help="Recompute days that are already up to date.")
+    ap.add_argument("--flush-every", type=float, default=60.0,
+                    help="Seconds between writes of finished shards, so an interrupted run can resume.")
+    ap.add_argument("--meta-dataset", default=None,
+                    help="Also build the labeled meta-model dataset in-process and write it here "
+                         "(.npz for columnar, .csv otherwise).")
+    ap.add_argument("--no-store", action="store_true",
+                    help="Do not read or write the signal store (needs --meta-dataset); every day is recomputed.")
     args = ap.parse_args()
+    if args.meta_dataset and args.bars:
+        ap.error("--meta-dataset builds one row per day and cannot be combined with --bars")
+    if args.no_store and not args.meta_dataset:
+        ap.error("--no-store needs --meta-dataset, otherwise the signals would be discarded")
 
     cfg = load_cfg(args.config)
     prob_th = cfg["thresholds"]["prob"]
-    
-    # Pre-load all dataframes into memory to avoid repeated reads
-    print("Pre-loading all historical data...")
-    all_data = {}
-    for symbol in cfg["symbols"]:
-        for tf_name in cfg["timeframes"].keys():
-            path = f"data/{symbol}_{tf_name}.csv"
-            if os.path.exists(path):
-                all_data[(symbol, tf_name)] = pd.read_csv(path, parse_dates=["time"])
+    store = args.store or ("outputs/bar_signal_store" if args.bars else "outputs/signal_store")
+    if args.timeframes:
+        timeframes = args.timeframes.split(",")
+    elif args.bars:
+        timeframes = [tf_name for tf_name in cfg["timeframes"] if TF_MINUTES[tf_name] < TF_MINUTES["D1"]]
+    else:
+        timeframes = list(cfg["timeframes"])
 
     end_date = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
     start_date = end_date - timedelta(days=args.days)
     
     date_range = [start_date + timedelta(days=x) for x in range(args.days)]
 
-    print(f"Generating historical signals from {start_date.date()} to {end_date.date()}...")
-    for current_date in tqdm(date_range, desc="Generating daily signals"):
-        output = {
-            "date": current_date.strftime("%Y-%m-%d"),
-            "timezone": "UTC",
-            "generated_at": datetime.now().isoformat() + "Z",
-            "signals": [],
-        }
-
-        for symbol in cfg["symbols"]:
-            for tf_name, tf_cfg in cfg["timeframes"].items():
-                if (symbol, tf_name) in all_data:
-                    full_df = all_data[(symbol, tf_name)]
-                    result = infer_one_historical(symbol, tf_name, prob_th, tf_cfg, full_df, current_date)
-                    if result:
-                        output["signals"].append(result)
-        
-        # Save the output for the current day
-        day_out_dir = os.path.join(args.outdir, current_date.strftime("%Y-%m-%d"))
-        os.makedirs(day_out_dir, exist_ok=True)
-        out_path = os.path.join(day_out_dir, "signals.json")
-        with open(out_path, "w", encoding="utf-8") as f:
-            json.dump(output, f, ensure_ascii=False, indent=2)
-
-    print(f"\n[DONE] Historical data generation complete. Files saved in {args.outdir}")
+    pairs = [(symbol, tf_name) for symbol in cfg["symbols"] for tf_name in timeframes
+             if os.path.exists(f"data/{symbol}_{tf_name}.csv")]
+    versions = {f"{symbol}_{tf_name}": model_version(symbol, tf_name) for symbol, tf_name in pairs}
+
+    # Every stored row carries the version of the model that produced it; a (symbol, tf)
+    # shard only covers the stamps that are missing or were made by an older model.
+    done = {}
+    stale = []
+    stored = None
+    if not (args.force or args.no_store):
+        stored = read_signals(store, start_date, None if args.bars else end_date,
+                              columns=["date", "symbol", "tf", "model_version"]
+                              + (SIGNAL_FIELDS if args.meta_dataset else []))
+        fresh = current_rows(stored, versions)
+        for (symbol, tf_name), group in stored[fresh].groupby(["symbol", "tf"]):
+            done[(symbol, tf_name)] = group["date"].to_numpy()
+        # A retrained model invalidates that pair's whole history, not just the requested window
+        old = stored.loc[~fresh, ["symbol", "tf"]].drop_duplicates()
+        stale = sorted(pair for pair in zip(old["symbol"], old["tf"]) if f"{pair[0]}_{pair[1]}" in versions)
+
+    shards = []
+    for symbol, tf_name in pairs:
+        key = f"{symbol}_{tf_name}"
+        stamps_done = done.get((symbol, tf_name), np.array([], dtype="datetime64[s]"))
+        shard = {"symbol": symbol, "tf_name": tf_name, "tf_cfg": cfg["timeframes"][tf_name],
+                 "prob_th": prob_th, "version": versions[key]}
+        if args.bars:
+            # Which bars are new is only known once the worker has read the series
+            shard.update(bars_from=start_date, skip=stamps_done)
+        else:
+            done_dates = set(stamps_done.astype("datetime64[s]").tolist())
+            todo = [d for d in date_range if d not in done_dates]
+            if not todo:
+                continue
+            shard.update(dates=todo)
+        shards.append(shard)
+
+    for symbol, tf_name in stale:
+        removed = drop_stale_signals(store, symbol, tf_name, versions[f"{symbol}_{tf_name}"])
+        print(f"[INFO] {symbol} {tf_name}: model changed, dropped {removed} stale signals")
+
+    unit = "bars" if args.bars else "days"
+    print(f"Generating historical signals ({unit}) from {start_date.date()} to {end_date.date()}...")
+    print(f"{len(shards)} (symbol, tf) shards to run, {len(versions) - len(shards)} already up to date")
+
+    # Backfilled frames are scattered straight into the meta feature matrix as shards finish;
+    # days that were already stored with the current model are taken from the store.
+    matrix = MetaFeatureMatrix(date_range, sorted(versions)) if args.meta_dataset else None
+    if matrix is not None and stored is not None:
+        matrix.add(stored[fresh])
+
+    if shards:
+        run_shards(shards, args, store, unit, matrix)
+        print("\n[DONE] Historical data generation complete.")
+    else:
+        print("\n[DONE] Nothing to do.")
+    if not args.no_store:
+        print(f"Signals are in {store}")
+
+    if matrix is not None:
+        strength_cfg = cfg.get("strength", {})
+        horizon_hours = strength_cfg.get("horizon_hours", 24)
+        price_data = load_price_data("data", cfg["symbols"], strength_cfg.get("price_tf", "D1"))
+        dataset = attach_labels(matrix.to_frame(), price_data, horizon_hours)
+        save_meta_dataset(dataset, args.meta_dataset)
+        print(f"[OK] Meta dataset with {len(dataset)} rows and {len(dataset.columns)} columns saved to {args.meta_dataset}")
 
 if __name__ == "__main__":
     # This is a long-running script, suppress TensorFlow warnings for cleaner output
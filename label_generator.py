@@ -1,45 +1,50 @@
 
 import argparse
-import json
 import os
+import sys
+import numpy as np
 import pandas as pd
-from tqdm import tqdm
+import yaml
 from datetime import timedelta
 
-def flatten_signals(signals: list) -> dict:
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from scripts.signal_store import read_signals
+from scripts.currency_strength import load_price_data
+from scripts.meta_dataset import attach_labels, save_meta_dataset
+
+def signals_to_features(signals: pd.DataFrame) -> pd.DataFrame:
     """
-    Flattens the list of signal objects into a single dictionary (one row).
-    Each feature is prefixed with its symbol and timeframe.
-    Example: {'EURUSD_D1_p_short': 0.1, 'EURUSD_D1_trend_up': 1, ...}
+    Pivots stored signals into the meta-model feature layout: one row per date and one
+    column per {symbol}_{tf}_{p_short|p_no|p_long|trend_up}, in first-seen (symbol, tf) order.
+    Matches scripts.meta_service.flatten_signals for the live signals.json.
     """
-    flat_row = {}
-    for signal_item in signals:
-        symbol = signal_item['symbol']
-        tf = signal_item['tf']
-        prefix = f"{symbol}_{tf}"
-        
-        signal_data = signal_item['signal']
-        flat_row[f"{prefix}_p_short"] = signal_data['probabilities']['short']
-        flat_row[f"{prefix}_p_no"] = signal_data['probabilities']['no']
-        flat_row[f"{prefix}_p_long"] = signal_data['probabilities']['long']
-        flat_row[f"{prefix}_trend_up"] = 1 if signal_data['trend_up'] else 0
-        
-    return flat_row
-
-def calculate_currency_strength_labels(current_date: pd.Timestamp, price_data: dict, all_symbols: list, lookahead_hours: int = 24) -> dict:
+    fields = ["p_short", "p_no", "p_long", "trend_up"]
+    signals = signals.assign(date=signals["date"].dt.normalize(), prefix=signals["symbol"] + "_" + signals["tf"])
+    wide = signals.pivot_table(index="date", columns="prefix", values=fields, aggfunc="last")
+    prefixes = list(dict.fromkeys(signals["prefix"]))
+    wide.columns = [f"{prefix}_{field}" for field, prefix in wide.columns]
+    ordered = [f"{prefix}_{field}" for prefix in prefixes for field in fields]
+    return wide[[c for c in ordered if c in wide.columns]].astype("float64")
+
+def calculate_currency_strength_labels(dates, price_data: dict, all_symbols: list, lookahead_hours: int = 24) -> pd.DataFrame:
     """
-    Calculates the future return for each major currency to use as a label.
-    This is a simplified approach using the currency's pair with USD as a proxy.
+    Calculates the future return of each major currency for every date in `dates`, to use
+    as labels. This is a simplified approach using the currency's pair with USD as a proxy.
+    Each date is priced at the last close at or before it and the first close at or after
+    date + lookahead_hours; both are located for all dates at once by binary search over the
+    sorted bar times. Returns one {currency}_target column per currency, NaN where missing.
     """
-    labels = {}
-    future_date = current_date + timedelta(hours=lookahead_hours)
-    
+    dates = pd.DatetimeIndex(dates)
+    query = dates.to_numpy()
+    future = (dates + timedelta(hours=lookahead_hours)).to_numpy()
+
     unique_currencies = set()
     for s in all_symbols:
         unique_currencies.add(s[:3])
         unique_currencies.add(s[3:])
 
-    for currency in unique_currencies:
+    labels = {}
+    for currency in sorted(unique_currencies):
         if currency == 'USD':
             continue
 
@@ -55,89 +60,65 @@ def calculate_currency_strength_labels(current_date: pd.Timestamp, price_data: d
         if df is None:
             continue
 
-        try:
-            current_price_rows = df[df['time'] <= current_date]
-            if current_price_rows.empty:
-                raise IndexError("No data on or before current_date")
-            current_price = current_price_rows.iloc[-1]['Close']
-
-            future_price_rows = df[df['time'] >= future_date]
-            if future_price_rows.empty:
-                raise IndexError("No data on or after future_date")
-            future_price = future_price_rows.iloc[0]['Close']
-            
-            if current_price > 0:
-                return_pct = (future_price - current_price) / current_price
-                if inverse:
-                    return_pct = -return_pct
-                labels[f"{currency}_target"] = return_pct
-            else:
-                labels[f"{currency}_target"] = 0
-
-        except IndexError:
-            labels[f"{currency}_target"] = None # Use None for missing data
-            
-    return labels
+        times = df['time'].to_numpy()
+        closes = df['Close'].to_numpy(dtype="float64")
+        now_idx = np.searchsorted(times, query, side="right") - 1
+        future_idx = np.searchsorted(times, future, side="left")
+        valid = (now_idx >= 0) & (future_idx < len(times))
+
+        current_price = closes[np.clip(now_idx, 0, len(closes) - 1)]
+        future_price = closes[np.clip(future_idx, 0, len(closes) - 1)]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return_pct = np.where(current_price > 0, (future_price - current_price) / current_price, 0.0)
+        if inverse:
+            return_pct = -return_pct
+        labels[f"{currency}_target"] = np.where(valid, return_pct, np.nan)
+
+    return pd.DataFrame(labels, index=dates)
 
 def main():
     parser = argparse.ArgumentParser(description="Generate labels for historical signal data.")
-    parser.add_argument("--history-dir", default="outputs/history", help="Directory with historical signal files.")
+    parser.add_argument("--config", default="config.yaml", help="Path to config.yaml (symbols and strength settings).")
+    parser.add_argument("--store", default="outputs/signal_store", help="Signal store written by historical_generator.")
     parser.add_argument("--data-dir", default="data", help="Directory with historical price CSVs.")
-    parser.add_argument("--outfile", default="meta_dataset.csv", help="Output CSV file for the dataset.")
+    parser.add_argument("--outfile", default="meta_dataset.csv", help="Output file for the dataset (.csv, or .npz for columnar).")
+    parser.add_argument("--labels", choices=["strength", "usd"], default="strength",
+                        help="strength: least-squares currency strength from all pairs; "
+                             "usd: return of each currency's USD pair.")
+    parser.add_argument("--horizon-hours", type=float, default=None,
+                        help="Label/feature horizon in hours (default: strength.horizon_hours from config, or 24).")
     args = parser.parse_args()
 
-    print("Pre-loading all D1 price data...")
-    price_data = {}
-    all_symbols = []
-    for filename in os.listdir(args.data_dir):
-        if filename.endswith("_D1.csv"):
-            symbol = filename.replace("_D1.csv", '')
-            all_symbols.append(symbol)
-            df = pd.read_csv(os.path.join(args.data_dir, filename), parse_dates=['time'])
-            price_data[symbol] = df
-    
-    all_rows = []
-    history_dates = sorted([d for d in os.listdir(args.history_dir) if os.path.isdir(os.path.join(args.history_dir, d))])
-    
-    print(f"Generating features and labels for {len(history_dates)} days...")
-    for date_str in tqdm(history_dates, desc="Processing historical data"):
-        signal_file_path = os.path.join(args.history_dir, date_str, "signals.json")
-        
-        if not os.path.exists(signal_file_path):
-            continue
-            
-        with open(signal_file_path, 'r', encoding='utf-8') as f:
-            try:
-                daily_signals = json.load(f)
-            except json.JSONDecodeError:
-                continue
-
-        if not daily_signals.get('signals'):
-            continue
-
-        features = flatten_signals(daily_signals['signals'])
-        if not features:
-            continue
-        
-        current_date = pd.to_datetime(date_str)
-        labels = calculate_currency_strength_labels(current_date, price_data, all_symbols)
-        
-        combined_row = {'date': date_str, **features, **labels}
-        all_rows.append(combined_row)
-
-    if not all_rows:
-        print("No data was processed. Exiting.")
+    strength_cfg = {}
+    config_symbols = None
+    if os.path.exists(args.config):
+        with open(args.config, "r", encoding="utf-8") as f:
+            cfg = yaml.safe_load(f)
+        strength_cfg = cfg.get("strength", {})
+        config_symbols = cfg.get("symbols")
+    horizon_hours = args.horizon_hours or strength_cfg.get("horizon_hours", 24)
+    price_tf = strength_cfg.get("price_tf", "D1")
+
+    print(f"Pre-loading all {price_tf} price data...")
+    suffix = f"_{price_tf}.csv"
+    all_symbols = config_symbols or [f[:-len(suffix)] for f in sorted(os.listdir(args.data_dir)) if f.endswith(suffix)]
+    price_data = load_price_data(args.data_dir, all_symbols, price_tf)
+    all_symbols = list(price_data)
+
+    signals = read_signals(args.store, columns=["date", "symbol", "tf", "p_short", "p_no", "p_long", "trend_up"])
+    if signals.empty:
+        print(f"No signals found in {args.store}. Run historical_generator.py "
+              f"(or migrate old folders with: python -m scripts.signal_store --migrate outputs/history). Exiting.")
         return
+    features_df = signals_to_features(signals)
 
-    final_df = pd.DataFrame(all_rows)
-    final_df['date'] = pd.to_datetime(final_df['date'])
-    final_df = final_df.set_index('date').sort_index()
-    
-    # Drop rows where all labels are missing, which happens at the end of the dataset
-    label_cols = [col for col in final_df.columns if '_target' in col]
-    final_df.dropna(subset=label_cols, how='all', inplace=True)
+    print(f"Generating labels for {len(features_df)} days...")
+    labels_df = None
+    if args.labels == "usd":
+        labels_df = calculate_currency_strength_labels(features_df.index, price_data, all_symbols, horizon_hours)
+    final_df = attach_labels(features_df, price_data, horizon_hours, labels_df)
 
-    final_df.to_csv(args.outfile)
+    save_meta_dataset(final_df, args.outfile)
     print(f"\n[DONE] Meta dataset created successfully at {args.outfile}")
     print(f"Dataset has {len(final_df)} rows and {len(final_df.columns)} columns.")
 
@@ -1,51 +1,58 @@
-from fastapi import FastAPI
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi import FastAPI, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
+import asyncio
 import os
-import json
 from datetime import datetime
 import requests
 
+from scripts.json_cache import JsonFileCache, cached_json, json_response
+from scripts.push_hub import PushHub
+
 app = FastAPI(title="LSTM Forex Signals API")
+# Local fallback files are parsed once per file version and answered with 304 while unchanged
+json_cache = JsonFileCache()
+# One fan-out of price ticks and new signal versions to every open dashboard
+push_hub = PushHub()
+g_prices = {}
 
 SIGNALS_FILE = "/home/aiagent1/LSTMC/outputs/signals.json"
 META_SIGNAL_FILE = "/home/aiagent1/LSTMC/outputs/meta_signal.json"
 WINDOWS_API = os.getenv("WINDOWS_API", "http://84.247.166.52:5000")
 
 @app.get("/api/signals")
-def get_signals():
+async def get_signals(request: Request):
     """Proxy signals from Windows server OR read local file as fallback"""
     try:
         # Try Windows API first
-        response = requests.get(f"{WINDOWS_API}/api/signals", timeout=5)
+        response = await run_in_threadpool(requests.get, f"{WINDOWS_API}/api/signals", timeout=5)
         if response.status_code == 200:
             return response.json()
     except Exception as e:
         print(f"Windows API unavailable: {e}")
 
     # Fallback to local file
-    if os.path.exists(SIGNALS_FILE):
-        with open(SIGNALS_FILE) as f:
-            data = json.load(f)
-        return data
+    entry = await run_in_threadpool(json_cache.file, SIGNALS_FILE)
+    if entry is not None:
+        return json_response(request, entry)
 
     return {"error": "no signals yet", "signals": []}
 
 @app.get("/api/meta-signal")
-def get_meta_signal():
+async def get_meta_signal(request: Request):
     """Proxy meta-signal from Windows server OR read local file as fallback"""
     try:
         # Try Windows API first
-        response = requests.get(f"{WINDOWS_API}/api/meta-signal", timeout=5)
+        response = await run_in_threadpool(requests.get, f"{WINDOWS_API}/api/meta-signal", timeout=5)
         if response.status_code == 200:
             return response.json()
     except Exception as e:
         print(f"Windows API unavailable: {e}")
 
     # Fallback to local file
-    if os.path.exists(META_SIGNAL_FILE):
-        with open(META_SIGNAL_FILE) as f:
-            data = json.load(f)
-        return data
+    entry = await run_in_threadpool(json_cache.file, META_SIGNAL_FILE)
+    if entry is not None:
+        return json_response(request, entry)
 
     return {"error": "no meta-signal yet"}
 
@@ -60,6 +67,57 @@ def get_prices():
     except Exception as e:
         return {"error": str(e)}
 
+@app.get("/api/stream")
+def stream():
+    """Server-sent events: prices (changed ticks), signals and meta-signal (each new version)."""
+    return StreamingResponse(push_hub.stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def latest_entry(route, path, etag, default):
+    """
+    Newest version of a Windows endpoint (a conditional GET: None if unchanged since etag)
+    or, when Windows is unreachable, of the local file.
+    """
+    try:
+        response = requests.get(f"{WINDOWS_API}/api/{route}", headers={"If-None-Match": etag} if etag else None,
+                                timeout=5)
+        if response.status_code == 304:
+            return None
+        if response.status_code == 200:
+            return cached_json(response.json())
+    except Exception:
+        pass
+    return json_cache.file(path) or cached_json(default)
+
+async def windows_poller():
+    """Polls the Windows API once every 2 s for all push subscribers instead of once per open browser."""
+    etags = {}
+    while True:
+        try:
+            response = await run_in_threadpool(requests.get, f"{WINDOWS_API}/api/prices", timeout=5)
+            prices = response.json() if response.status_code == 200 else {}
+            changed = {symbol: quote for symbol, quote in prices.items() if g_prices.get(symbol) != quote}
+            if changed and "error" not in prices:
+                g_prices.update(changed)
+                push_hub.publish("prices", cached_json(changed).body, state=cached_json(g_prices).body)
+        except Exception:
+            pass  # prices resume with the next successful poll
+
+        for route, path, default in (("signals", SIGNALS_FILE, {"error": "no signals yet", "signals": []}),
+                                     ("meta-signal", META_SIGNAL_FILE, {"error": "no meta-signal yet"})):
+            try:
+                entry = await run_in_threadpool(latest_entry, route, path, etags.get(route), default)
+                if entry is not None and entry.etag != etags.get(route):
+                    etags[route] = entry.etag
+                    push_hub.publish(route, entry.body)
+            except Exception as e:
+                print(f"Error pushing {route}: {e}")
+        await asyncio.sleep(2)
+
+@app.on_event("startup")
+async def startup_event():
+    asyncio.create_task(windows_poller())
+
 @app.get("/api/health")
 def health():
     signals_exist = os.path.exists(SIGNALS_FILE)
@@ -112,9 +170,7 @@ def index():
       return filters.join(', ');
     }
 
-    async function loadMetaSignal() {
-        const response = await fetch('/api/meta-signal');
-        const meta = await response.json();
+    function renderMetaSignal(meta) {
         const container = document.getElementById('meta-signal-summary');
         let html = `<h2>Головний Сигнал</h2>`;
 
@@ -134,9 +190,7 @@ def index():
         container.innerHTML = html;
     }
 
-    async function loadSignals() {
-      const response = await fetch('/api/signals');
-      const payload = await response.json();
+    function renderSignals(payload) {
       const container = document.getElementById('signals');
       const generatedAt = document.getElementById('generated_at');
 
@@ -171,13 +225,13 @@ def index():
       }
     }
 
-    async function loadPrices() {
-        const response = await fetch('/api/prices');
-        const prices = await response.json();
+    const prices = {};
+
+    function renderPrices(error) {
         const tableBody = document.getElementById('price-table-body');
 
-        if (prices.error) {
-            tableBody.innerHTML = `<tr><td colspan="4" style="text-align:center;color:#f44336;">${prices.error}</td></tr>`;
+        if (error) {
+            tableBody.innerHTML = `<tr><td colspan="4" style="text-align:center;color:#f44336;">${error}</td></tr>`;
             return;
         }
 
@@ -189,7 +243,23 @@ def index():
         }
     }
 
+    const loadMetaSignal = async () => renderMetaSignal(await (await fetch('/api/meta-signal')).json());
+    const loadSignals = async () => renderSignals(await (await fetch('/api/signals')).json());
+    const loadPrices = async () => {
+        const payload = await (await fetch('/api/prices')).json();
+        if (!payload.error) Object.assign(prices, payload);
+        renderPrices(payload.error);
+    };
+
     window.addEventListener('load', () => {
+        if (window.EventSource) {
+            // The server pushes changed ticks and every new signal version; EventSource reconnects by itself
+            const stream = new EventSource('/api/stream');
+            stream.addEventListener('prices', (e) => { Object.assign(prices, JSON.parse(e.data)); renderPrices(); });
+            stream.addEventListener('signals', (e) => renderSignals(JSON.parse(e.data)));
+            stream.addEventListener('meta-signal', (e) => renderMetaSignal(JSON.parse(e.data)));
+            return;
+        }
         loadMetaSignal();
         loadSignals();
         loadPrices();
@@ -0,0 +1,308 @@
+"""
+Portfolio-level backtest of the signal store.
+evaluate_backtest follows every ACTIVE signal on its own and compounds the trades one after
+another. Here all symbols share one bar clock: a signal becomes a position only if the
+portfolio has room for it (concurrent positions, positions per symbol, net risk per
+currency), positions are sized off the realized balance at entry, and equity is marked to
+market on every bar of the clock.
+
+    python portfolio_backtest.py --store outputs/bar_signal_store --max-positions 6
+"""
+import argparse
+import heapq
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from evaluate_backtest import SAME_BAR_RULES, exit_legs, load_bars, load_signals_history
+from scripts.signal_store import STATUS_CODES
+from scripts.utils import TF_MINUTES
+
+SKIP_REASONS = ("max_positions", "max_per_symbol", "currency_risk")
+
+
+def build_candidates(signals_history, data_dir="data", max_bars=500, same_bar="sl"):
+    """
+    Every ACTIVE signal that enters a trade, with its exits already resolved on its own bars
+    (exits do not depend on the rest of the portfolio). Exits are timed at the close of their
+    bar, when the bar is known to have hit the level. Returns (candidates frame, {series: bars}).
+    """
+    active = signals_history[
+        (signals_history['status'] == STATUS_CODES['ACTIVE']) & signals_history['sl'].notna()
+    ].reset_index(drop=True)
+
+    frames, series = [], {}
+    for (symbol, tf), group in active.groupby(['symbol', 'tf'], sort=False):
+        bars = load_bars(data_dir, symbol, tf)
+        if bars is None:
+            print(f"[WARN] No price data for {symbol} {tf}; skipping {len(group)} signals")
+            continue
+        # Bars are stamped with their open; a D1 bar's outcome is only known at its close
+        bars["close_time"] = bars["time"] + np.timedelta64(TF_MINUTES[tf], "m")
+        legs = exit_legs(bars, group, max_bars, same_bar)
+        entered = legs["entered"]
+        exit_idx = legs["exit_idx"][entered]
+        sid = len(series)
+        series[sid] = bars
+        frames.append(pd.DataFrame({
+            "series": sid,
+            "date": group["date"].to_numpy()[entered],
+            "symbol": symbol,
+            "tf": tf,
+            "side": legs["side"][entered],
+            "confidence": group["confidence"].to_numpy()[entered],
+            "entry": group["entry"].to_numpy(dtype=np.float64)[entered],
+            "sl": group["sl"].to_numpy(dtype=np.float64)[entered],
+            "bar_start": legs["start"][entered],
+            "bar_exit1": exit_idx[:, 0],
+            "bar_exit2": exit_idx[:, 1],
+            "entry_time": bars["time"][legs["start"][entered]],
+            "exit1_time": bars["close_time"][exit_idx[:, 0]],
+            "exit_time": bars["close_time"][exit_idx.max(axis=1)],
+            "r1": legs["leg_r"][entered, 0],
+            "r2": legs["leg_r"][entered, 1],
+            "reason": np.where(legs["reason"][entered, 0] == legs["reason"][entered, 1], legs["reason"][entered, 0],
+                               legs["reason"][entered, 0] + "+" + legs["reason"][entered, 1]),
+        }))
+    if not frames:
+        return pd.DataFrame(), series
+    # Entry order; simultaneous entries compete by confidence
+    candidates = pd.concat(frames, ignore_index=True)
+    return candidates.sort_values(["entry_time", "confidence"], ascending=[True, False], kind="stable",
+                                  ignore_index=True), series
+
+
+def admit_positions(candidates, initial_balance=10000, risk_per_trade=0.02, tp1_share=0.5, max_positions=0,
+                    max_per_symbol=1, max_currency_risk=0.0):
+    """
+    Event loop over the candidates in entry order. Before each entry, every leg whose exit bar
+    closed by the time the entry bar opens is booked into the balance and frees its position. A candidate
+    is skipped when the portfolio is at max_positions, its symbol at max_per_symbol, or the
+    trade would push the net risk of its base or quote currency beyond max_currency_risk
+    (long EURUSD: +risk EUR, -risk USD); 0 disables a limit. A taken trade risks
+    risk_per_trade of the realized balance.
+    Returns (risk amount per candidate, NaN if skipped; skip reason per candidate; peak open positions).
+    """
+    n = len(candidates)
+    amount = np.full(n, np.nan)
+    skipped = np.full(n, "", dtype=object)
+
+    entry_t = candidates["entry_time"].to_numpy().view(np.int64).tolist()
+    exit1_t = candidates["exit1_time"].to_numpy().view(np.int64).tolist()
+    exit_t = candidates["exit_time"].to_numpy().view(np.int64).tolist()
+    r1 = candidates["r1"].tolist()
+    r2 = candidates["r2"].tolist()
+    side = candidates["side"].tolist()
+    symbols, symbol_ids = np.unique(candidates["symbol"].to_numpy(), return_inverse=True)
+    currencies = sorted({s[:3] for s in symbols} | {s[3:6] for s in symbols})
+    base_ids = [currencies.index(s[:3]) for s in symbols]
+    quote_ids = [currencies.index(s[3:6]) for s in symbols]
+    symbol_ids = symbol_ids.tolist()
+
+    # Compact portfolio state: counters indexed by symbol / currency id
+    open_per_symbol = [0] * len(symbols)
+    exposure = [0.0] * len(currencies)
+    pending = []  # heap of (exit time, seq, booked pnl, candidate to release or -1)
+    balance, open_count, peak_open = float(initial_balance), 0, 0
+    cap = max_currency_risk + 1e-12
+
+    for i in range(n):
+        t = entry_t[i]
+        while pending and pending[0][0] <= t:
+            _, _, pnl, released = heapq.heappop(pending)
+            balance += pnl
+            if released >= 0:
+                s = symbol_ids[released]
+                open_count -= 1
+                open_per_symbol[s] -= 1
+                exposure[base_ids[s]] -= side[released] * risk_per_trade
+                exposure[quote_ids[s]] += side[released] * risk_per_trade
+
+        s = symbol_ids[i]
+        signed = side[i] * risk_per_trade
+        if max_positions and open_count >= max_positions:
+            skipped[i] = "max_positions"
+        elif max_per_symbol and open_per_symbol[s] >= max_per_symbol:
+            skipped[i] = "max_per_symbol"
+        elif max_currency_risk and (abs(exposure[base_ids[s]] + signed) > cap or
+                                    abs(exposure[quote_ids[s]] - signed) > cap):
+            skipped[i] = "currency_risk"
+        else:
+            risk_amount = balance * risk_per_trade
+            amount[i] = risk_amount
+            open_count += 1
+            peak_open = max(peak_open, open_count)
+            open_per_symbol[s] += 1
+            exposure[base_ids[s]] += signed
+            exposure[quote_ids[s]] -= signed
+            heapq.heappush(pending, (exit1_t[i], 2 * i, risk_amount * tp1_share * r1[i], -1))
+            heapq.heappush(pending, (exit_t[i], 2 * i + 1, risk_amount * (1 - tp1_share) * r2[i], i))
+    return amount, skipped, peak_open
+
+
+def mark_to_market(candidates, amount, series, initial_balance=10000, tp1_share=0.5, chunk=4096):
+    """
+    Portfolio equity on the union of the bar close times of all series: realized legs are
+    booked at the close of their exit bar, open legs are valued at every bar close in between. Every taken trade
+    adds its per-bar equity changes to one array over the clock, so the curve is a cumsum.
+    Returns (clock, equity, open positions per clock bar).
+    """
+    clock = np.unique(np.concatenate([bars["close_time"] for bars in series.values()]))
+    delta = np.zeros(len(clock))
+    opened = np.zeros(len(clock))
+    taken = candidates[~np.isnan(amount)].assign(amount=amount[~np.isnan(amount)])
+
+    for sid, group in taken.groupby("series", sort=False):
+        bars = series[sid]
+        pos = np.searchsorted(clock, bars["close_time"])
+        close = bars["close"]
+        for lo in range(0, len(group), chunk):
+            g = group.iloc[lo:lo + chunk]
+            start = g["bar_start"].to_numpy()
+            e1, e2 = g["bar_exit1"].to_numpy()[:, None], g["bar_exit2"].to_numpy()[:, None]
+            side = g["side"].to_numpy()[:, None]
+            entry = side * g["entry"].to_numpy()[:, None]
+            risk = entry - side * g["sl"].to_numpy()[:, None]
+            risk_amount = g["amount"].to_numpy()[:, None]
+
+            idx = start[:, None] + np.arange(int((e2[:, 0] - start).max()) + 1)
+            live = idx <= e2
+            idx = np.minimum(idx, len(close) - 1)
+            bar_r = (side * close[idx] - entry) / risk
+            # Value of the legs still open at each bar close; a leg is booked on its exit bar
+            unrealized = risk_amount * bar_r * (tp1_share * (idx < e1) + (1 - tp1_share) * (idx < e2))
+            unrealized = np.where(live, unrealized, 0.0)
+            change = np.diff(unrealized, axis=1, prepend=0.0)
+            delta += np.bincount(pos[idx[live]], weights=change[live], minlength=len(clock))
+
+            booked = risk_amount[:, 0]
+            delta += np.bincount(pos[e1[:, 0]], weights=booked * tp1_share * g["r1"].to_numpy(), minlength=len(clock))
+            delta += np.bincount(pos[e2[:, 0]], weights=booked * (1 - tp1_share) * g["r2"].to_numpy(),
+                                 minlength=len(clock))
+            opened += np.bincount(pos[start], minlength=len(clock)) - np.bincount(pos[e2[:, 0]], minlength=len(clock))
+
+    return clock, initial_balance + np.cumsum(delta), np.cumsum(opened)
+
+
+def portfolio_metrics(clock, equity, profits, initial_balance):
+    """Metrics of the marked-to-market equity curve (Sharpe and Sortino on daily closes) and the trades."""
+    peak = np.maximum.accumulate(np.concatenate([[initial_balance], equity]))[1:]
+    daily = pd.Series(equity, index=pd.DatetimeIndex(clock)).resample("D").last().dropna()
+    returns = daily.pct_change().fillna(daily.iloc[0] / initial_balance - 1).to_numpy()
+    std = returns.std(ddof=1) if len(returns) > 1 else 0.0
+    downside = returns[returns < 0]
+    downside_std = downside.std(ddof=1) if len(downside) > 1 else 0.0
+    gross_profit = profits[profits > 0].sum()
+    gross_loss = -profits[profits < 0].sum()
+    return {
+        "final_equity": float(equity[-1]),
+        "total_return_pct": float(100 * (equity[-1] / initial_balance - 1)),
+        "sharpe_ratio": float(np.sqrt(252) * returns.mean() / std) if std > 0 else 0.0,
+        "sortino_ratio": float(np.sqrt(252) * returns.mean() / downside_std) if downside_std > 0 else 0.0,
+        "max_drawdown_pct": float(100 * (1 - equity / peak).max()),
+        "win_rate_pct": float(100 * (profits > 0).mean()) if len(profits) else 0.0,
+        "profit_factor": float(gross_profit / gross_loss) if gross_loss > 0 else (float('inf') if gross_profit > 0 else 0.0),
+    }
+
+
+def run_portfolio(signals_history, initial_balance=10000, risk_per_trade=0.02, data_dir="data", max_bars=500,
+                  same_bar="sl", tp1_share=0.5, max_positions=0, max_per_symbol=1, max_currency_risk=0.0):
+    """Full portfolio simulation. Returns (report dict, trade log, equity curve frame)."""
+    candidates, series = build_candidates(signals_history, data_dir, max_bars, same_bar)
+    if len(candidates) == 0:
+        return None, pd.DataFrame(), pd.DataFrame()
+    amount, skipped, peak_open = admit_positions(candidates, initial_balance, risk_per_trade, tp1_share,
+                                                 max_positions, max_per_symbol, max_currency_risk)
+    clock, equity, open_positions = mark_to_market(candidates, amount, series, initial_balance, tp1_share)
+
+    taken = ~np.isnan(amount)
+    trade_log = candidates[taken].assign(
+        side=np.where(candidates.loc[taken, "side"] > 0, "LONG", "SHORT"),
+        risk_amount=amount[taken],
+        r_multiple=tp1_share * candidates.loc[taken, "r1"] + (1 - tp1_share) * candidates.loc[taken, "r2"],
+    )
+    trade_log["profit"] = trade_log["risk_amount"] * trade_log["r_multiple"]
+    trade_log = trade_log.drop(columns=["series", "bar_start", "bar_exit1", "bar_exit2", "r1", "r2"])
+    trade_log = trade_log.sort_values(["exit_time", "entry_time"], kind="stable").reset_index(drop=True)
+
+    report = {
+        "generated_at": datetime.now().isoformat(),
+        "initial_balance": initial_balance,
+        "candidates": len(candidates),
+        "trades": int(taken.sum()),
+        "skipped": {reason: int((skipped == reason).sum()) for reason in SKIP_REASONS},
+        "peak_open_positions": int(peak_open),
+        "avg_open_positions": float(open_positions.mean()),
+        "metrics": portfolio_metrics(clock, equity, trade_log["profit"].to_numpy(), initial_balance),
+        "exit_reasons": trade_log["reason"].value_counts().to_dict(),
+    }
+    return report, trade_log, pd.DataFrame({"time": clock, "equity": equity, "open_positions": open_positions})
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Portfolio backtest: all symbols on one bar clock with exposure limits.")
+    ap.add_argument("--store", default="outputs/signal_store", help="Signal store with historical signals")
+    ap.add_argument("--start", default=None, help="First signal date")
+    ap.add_argument("--end", default=None, help="Last signal date")
+    ap.add_argument("--data-dir", default="data", help="Directory with {symbol}_{tf}.csv price bars")
+    ap.add_argument("--initial-balance", type=float, default=10000)
+    ap.add_argument("--risk-per-trade", type=float, default=0.02, help="Risk per trade as a fraction of balance")
+    ap.add_argument("--max-positions", type=int, default=6, help="Max concurrent positions (0: no limit)")
+    ap.add_argument("--max-per-symbol", type=int, default=1, help="Max concurrent positions per symbol (0: no limit)")
+    ap.add_argument("--max-currency-risk", type=float, default=0.06,
+                    help="Max net risk per currency as a fraction of balance (0: no limit)")
+    ap.add_argument("--max-bars", type=int, default=500, help="Bars a trade may stay open before it is closed")
+    ap.add_argument("--same-bar", choices=SAME_BAR_RULES, default="sl",
+                    help="Bar touching both SL and a TP: sl (pessimistic), tp (optimistic), open (nearer level first)")
+    ap.add_argument("--tp1-share", type=float, default=0.5, help="Share of the position closed at TP1")
+    ap.add_argument("--output", default="outputs/portfolio_report.json")
+    ap.add_argument("--trade-log", default="outputs/portfolio_trades.csv")
+    ap.add_argument("--equity-curve", default=None, help="Save the per-bar equity curve (CSV)")
+    args = ap.parse_args()
+
+    started = time.time()
+    signals_history = load_signals_history(args.store, start=args.start, end=args.end)
+    print(f"[INFO] Loaded {len(signals_history)} signals")
+    report, trade_log, curve = run_portfolio(signals_history, args.initial_balance, args.risk_per_trade,
+                                             args.data_dir, args.max_bars, args.same_bar, args.tp1_share,
+                                             args.max_positions, args.max_per_symbol, args.max_currency_risk)
+    if report is None:
+        print("[WARN] No trades executed. Cannot calculate metrics.")
+        return
+    report["settings"] = vars(args)
+
+    metrics = report["metrics"]
+    print("\n" + "="*60)
+    print("PORTFOLIO BACKTEST RESULTS")
+    print("="*60)
+    print(f"Candidates:         {report['candidates']}")
+    print(f"Trades taken:       {report['trades']}")
+    print(f"Skipped:            " + ", ".join(f"{k} {v}" for k, v in report["skipped"].items()))
+    print(f"Open positions:     peak {report['peak_open_positions']}, avg {report['avg_open_positions']:.2f}")
+    print(f"Final Equity:       ${metrics['final_equity']:,.2f}")
+    print(f"Total Return:       {metrics['total_return_pct']:+.2f}%")
+    print(f"Sharpe Ratio:       {metrics['sharpe_ratio']:.3f}")
+    print(f"Sortino Ratio:      {metrics['sortino_ratio']:.3f}")
+    print(f"Max Drawdown (MTM): {metrics['max_drawdown_pct']:.2f}%")
+    print(f"Win Rate:           {metrics['win_rate_pct']:.2f}%")
+    print(f"Profit Factor:      {metrics['profit_factor']:.3f}")
+    print("="*60)
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False, default=str)
+    trade_log.to_csv(args.trade_log, index=False)
+    if args.equity_curve:
+        curve.to_csv(args.equity_curve, index=False)
+    print(f"\n[OK] Report saved to {args.output}, {len(trade_log)} trades to {args.trade_log} "
+          f"({time.time() - started:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -54,6 +54,11 @@ def main():
         action="store_true",
         help="Використовувати LightGBM + XGBoost ensemble для meta-моделі"
     )
+    parser.add_argument(
+        "--meta-update",
+        action="store_true",
+        help="Дотренувати поточні meta-моделі на нових рядках замість навчання з нуля"
+    )
     parser.add_argument(
         "--cv-folds",
         type=int,
@@ -106,6 +111,7 @@ def main():
     print(f"Час початку: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     print(f"Тип моделі: {args.model_type}")
     print(f"Meta-ensemble: {'ТАК' if args.meta_ensemble else 'НІ'}")
+    print(f"Meta-оновлення: {'інкрементальне' if args.meta_update else 'з нуля'}")
     print(f"Data augmentation: {'НІ' if args.no_augment else 'ТАК'}")
     print(f"Focal loss: {'НІ' if args.no_focal_loss else 'ТАК'}")
     print(f"Cross-validation folds: {args.cv_folds}")
@@ -152,43 +158,39 @@ def main():
 
     # STEP 4: Generate Base Signals
     total_steps += 1
+    infer_cmd = [sys.executable, "scripts/infer_signals.py", "--config", config_file, "--out", "outputs/signals.json"]
+    if args.model_type == "ensemble":
+        infer_cmd.append("--ensemble")
     if run_cmd(
-        [sys.executable, "scripts/infer_signals.py", "--config", config_file, "--out", "outputs/signals.json"],
+        infer_cmd,
         "КРОК 4: Генерація базових торгових сигналів"
     ):
         success_count += 1
 
-    # STEP 5: Historical Signal Generation (Optional)
+    # STEP 5-6: Historical Signal Generation + Labeled Dataset (Optional, one in-process pass)
     if not args.skip_history:
         total_steps += 1
         if run_cmd(
-            [sys.executable, "historical_generator.py", "--config", config_file, "--days", str(args.history_days)],
-            f"КРОК 5: Генерація історичних сигналів ({args.history_days} днів)"
+            [sys.executable, "historical_generator.py", "--config", config_file, "--days", str(args.history_days),
+             "--meta-dataset", "meta_dataset.npz"],
+            f"КРОК 5-6: Генерація історичних сигналів і labeled dataset ({args.history_days} днів)"
         ):
             success_count += 1
     else:
         print("\n⏭️  Пропущено: Генерація історичних сигналів")
 
-    # STEP 6: Label Generation
-    if not args.skip_history:
-        total_steps += 1
-        if run_cmd(
-            [sys.executable, "label_generator.py"],
-            "КРОК 6: Створення labeled dataset для meta-моделі"
-        ):
-            success_count += 1
-
     # STEP 7: Train Meta-Model
     if not args.skip_history:
         total_steps += 1
 
-        # Clean old meta-models
-        print("\n🗑️  Видалення старих meta-моделей...")
-        for f in glob.glob("models/meta_model_*.joblib"):
-            os.remove(f)
-            print(f"   Видалено: {f}")
+        meta_cmd = [sys.executable, "train_meta_model.py", "--dataset", "meta_dataset.npz"]
 
-        meta_cmd = [sys.executable, "train_meta_model.py", "--dataset", "meta_dataset.csv"]
+        if not args.meta_update:
+            # Clean old meta-models (попередні версії лишаються в models/meta_versions для rollback)
+            print("\n🗑️  Видалення старих meta-моделей...")
+            for f in glob.glob("models/meta_model_*.joblib"):
+                os.remove(f)
+                print(f"   Видалено: {f}")
 
         if args.meta_ensemble:
             meta_cmd.append("--ensemble")
@@ -196,7 +198,10 @@ def main():
         else:
             description = "КРОК 7: Навчання LightGBM meta-моделі"
 
-        if args.cv_folds > 0:
+        if args.meta_update:
+            meta_cmd.append("--update")
+            description = "КРОК 7: Інкрементальне оновлення meta-моделей"
+        elif args.cv_folds > 0:
             meta_cmd.extend(["--cv-folds", str(args.cv_folds)])
             description += f" з {args.cv_folds}-fold CV"
 
@@ -216,7 +221,7 @@ def main():
     if not args.skip_history:
         total_steps += 1
         if run_cmd(
-            [sys.executable, "evaluate_backtest.py", "--history-dir", "outputs/history", "--initial-balance", "10000"],
+            [sys.executable, "evaluate_backtest.py", "--store", "outputs/signal_store", "--initial-balance", "10000"],
             "КРОК 9: Оцінка результатів з фінансовими метриками"
         ):
             success_count += 1
@@ -236,7 +241,7 @@ def main():
         if not args.skip_history:
             print("   - Meta-сигнали: outputs/meta_signal.json")
             print("   - Backtest звіт: outputs/backtest_report.json")
-            print("   - Історія: outputs/history/")
+            print("   - Історія: outputs/signal_store/")
 
         print("\n🌐 Для перегляду дашборду запустіть:")
         print("   codex run web")
@@ -0,0 +1,117 @@
+"""
+Per-currency strength from every configured pair, crosses included.
+A pair's log-return is modelled as strength(base) - strength(quote); stacking all pairs gives
+an overdetermined linear system solved by least squares for all dates at once. Strength is
+only defined up to a common offset, so the minimum-norm solution is used, which makes the
+strengths of each connected group of currencies sum to zero (a basket-relative index).
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from scripts.utils import read_csv_tail, TF_MINUTES
+
+
+def pair_legs(symbols: list):
+    """Sorted currencies and the (pairs x currencies) design matrix: +1 for base, -1 for quote."""
+    currencies = sorted({s[:3] for s in symbols} | {s[3:] for s in symbols})
+    col = {c: i for i, c in enumerate(currencies)}
+    design = np.zeros((len(symbols), len(currencies)))
+    for row, symbol in enumerate(symbols):
+        design[row, col[symbol[:3]]] = 1.0
+        design[row, col[symbol[3:]]] = -1.0
+    return currencies, design
+
+
+def pair_log_returns(dates, price_data: dict, horizon_hours: float, forward: bool = True) -> pd.DataFrame:
+    """
+    Log-return of every pair in `price_data` over `horizon_hours` for each date, as a
+    (dates x pairs) frame. forward=True looks ahead from the last close at or before the date
+    to the first close at or after date + horizon (labels); forward=False looks back from the
+    last close at or before date - horizon (features, no look-ahead). NaN where out of range.
+    """
+    dates = pd.DatetimeIndex(dates)
+    query = dates.to_numpy()
+    shifted = (dates + pd.Timedelta(hours=horizon_hours if forward else -horizon_hours)).to_numpy()
+
+    returns = {}
+    for symbol, df in price_data.items():
+        times = df["time"].to_numpy()
+        log_close = np.log(df["Close"].to_numpy(dtype="float64"))
+        now_idx = np.searchsorted(times, query, side="right") - 1
+        if forward:
+            other_idx = np.searchsorted(times, shifted, side="left")
+            valid = (now_idx >= 0) & (other_idx < len(times))
+        else:
+            other_idx = np.searchsorted(times, shifted, side="right") - 1
+            valid = other_idx >= 0
+        now_idx = np.clip(now_idx, 0, len(times) - 1)
+        other_idx = np.clip(other_idx, 0, len(times) - 1)
+        move = log_close[other_idx] - log_close[now_idx]
+        returns[symbol] = np.where(valid, move if forward else -move, np.nan)
+    return pd.DataFrame(returns, index=dates)
+
+
+def solve_strength(returns: pd.DataFrame) -> pd.DataFrame:
+    """
+    Least-squares currency strengths for a (dates x pairs) log-return frame.
+    Dates are grouped by which pairs are available, so the pseudo-inverse is computed once
+    per availability pattern rather than once per date. Currencies without an available
+    pair on a date are NaN.
+    """
+    currencies, design = pair_legs(list(returns.columns))
+    values = returns.to_numpy(dtype="float64")
+    available = ~np.isnan(values)
+    strength = np.full((len(values), len(currencies)), np.nan)
+
+    patterns, inverse = np.unique(available, axis=0, return_inverse=True)
+    for p, pattern in enumerate(patterns):
+        if not pattern.any():
+            continue
+        rows = np.flatnonzero(inverse.ravel() == p)
+        sub = design[pattern]
+        covered = np.abs(sub).sum(axis=0) > 0
+        solved = values[np.ix_(rows, np.flatnonzero(pattern))] @ np.linalg.pinv(sub).T
+        solved[:, ~covered] = np.nan
+        strength[rows] = solved
+    return pd.DataFrame(strength, index=returns.index, columns=currencies)
+
+
+def strength_labels(dates, price_data: dict, horizon_hours: float = 24) -> pd.DataFrame:
+    """Forward currency strength over horizon_hours as {currency}_target label columns."""
+    strength = solve_strength(pair_log_returns(dates, price_data, horizon_hours, forward=True))
+    return strength.add_suffix("_target")
+
+
+def strength_features(dates, price_data: dict, horizon_hours: float = 24) -> pd.DataFrame:
+    """Trailing currency strength over horizon_hours as {currency}_strength feature columns."""
+    strength = solve_strength(pair_log_returns(dates, price_data, horizon_hours, forward=False))
+    return strength.add_suffix("_strength")
+
+
+def load_price_data(data_dir: str, symbols: list, tf_name: str, n_rows: int = None) -> dict:
+    """{symbol: DataFrame} for every symbol with a {symbol}_{tf}.csv; only the last n_rows if given."""
+    price_data = {}
+    for symbol in symbols:
+        path = os.path.join(data_dir, f"{symbol}_{tf_name}.csv")
+        if not os.path.exists(path):
+            continue
+        if n_rows:
+            price_data[symbol] = read_csv_tail(path, n_rows)
+        else:
+            price_data[symbol] = pd.read_csv(path, parse_dates=["time"])
+    return price_data
+
+
+def live_strength_features(data_dir: str, symbols: list, tf_name: str = "D1", horizon_hours: float = 24) -> dict:
+    """
+    Trailing strength features as of the latest bar in the data, for live meta inference.
+    Only the bars spanning the horizon are read from each CSV.
+    """
+    n_rows = int(np.ceil(horizon_hours * 60 / TF_MINUTES[tf_name])) + 2
+    price_data = load_price_data(data_dir, symbols, tf_name, n_rows)
+    if not price_data:
+        return {}
+    latest = max(df["time"].iloc[-1] for df in price_data.values())
+    return strength_features([latest], price_data, horizon_hours).iloc[0].to_dict()
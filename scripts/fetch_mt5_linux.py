@@ -10,62 +10,71 @@ def load_cfg(path):
     with open(path, "r", encoding="utf-8") as f:
         return yaml.safe_load(f)
 
-def fetch(symbol: str, tf_name: str, years: int, outdir: str, api_url: str):
-    """Fetch data from Windows MT5 API"""
+TIMEFRAME_BARS_PER_YEAR = {
+    "D1": 365,
+    "H4": 2190,
+    "H2": 4380,
+    "H1": 8760,
+    "M30": 17520,
+    "M15": 35040
+}
+
+def request_bars(symbol: str, tf_name: str, count: int, api_url: str):
+    """Requests the latest `count` bars from the Windows MT5 API as a DataFrame (None on error)"""
+    url = f"{api_url}/api/history"
+    params = {
+        "symbol": symbol,
+        "timeframe": tf_name,
+        "count": count
+    }
+    response = requests.get(url, params=params, timeout=120)
+
+    if response.status_code != 200:
+        print(f"[WARN] API error for {symbol} {tf_name}: {response.status_code}")
+        return None
+
+    data = response.json()
+
+    if data.get("status") != "ok":
+        print(f"[WARN] API error for {symbol} {tf_name}: {data.get('error', 'Unknown error')}")
+        return None
+
+    # Convert to DataFrame
+    df = pd.DataFrame(data["data"])
+    df["time"] = pd.to_datetime(df["time"])
+
+    # Rename columns to match expected format
+    # API may return different column names, handle both cases
+    rename_map = {
+        "open": "Open",
+        "high": "High",
+        "low": "Low",
+        "close": "Close",
+        "tick_volume": "Volume",
+        "volume": "Volume"
+    }
+    df = df.rename(columns={k: v for k, v in rename_map.items() if k in df.columns})
+
+    # Select only needed columns
+    return df[["time", "Open", "High", "Low", "Close", "Volume"]]
+
+def fetch(symbol: str, tf_name: str, years: int, outdir: str, api_url: str, before=None):
+    """Fetch data from Windows MT5 API; bars opening at or after `before` (still forming) are left out"""
     try:
         # Calculate approximate count from years
-        # Rough estimates: D1=365, H4=2190, H1=8760, M30=17520, M15=35040 bars per year
-        timeframe_bars_per_year = {
-            "D1": 365,
-            "H4": 2190,
-            "H2": 4380,
-            "H1": 8760,
-            "M30": 17520,
-            "M15": 35040
-        }
-        count = timeframe_bars_per_year.get(tf_name, 8760) * years
-
-        url = f"{api_url}/api/history"
-        params = {
-            "symbol": symbol,
-            "timeframe": tf_name,
-            "count": count
-        }
-        response = requests.get(url, params=params, timeout=120)
-
-        if response.status_code != 200:
-            print(f"[WARN] API error for {symbol} {tf_name}: {response.status_code}")
+        count = TIMEFRAME_BARS_PER_YEAR.get(tf_name, 8760) * years
+        df = request_bars(symbol, tf_name, count, api_url)
+        if df is None:
             return 0
+        if before is not None:
+            df = df[df["time"] < before]
 
-        data = response.json()
-
-        if data.get("status") != "ok":
-            print(f"[WARN] API error for {symbol} {tf_name}: {data.get('error', 'Unknown error')}")
-            return 0
-
-        # Convert to DataFrame
-        df = pd.DataFrame(data["data"])
-        df["time"] = pd.to_datetime(df["time"])
-
-        # Rename columns to match expected format
-        # API may return different column names, handle both cases
-        rename_map = {
-            "open": "Open",
-            "high": "High",
-            "low": "Low",
-            "close": "Close",
-            "tick_volume": "Volume",
-            "volume": "Volume"
-        }
-        df = df.rename(columns={k: v for k, v in rename_map.items() if k in df.columns})
-
-        # Select only needed columns
-        df = df[["time", "Open", "High", "Low", "Close", "Volume"]]
-
-        # Save to CSV
+        # Save to CSV via a temp file, readers share it
         os.makedirs(outdir, exist_ok=True)
         path = os.path.join(outdir, f"{symbol}_{tf_name}.csv")
-        df.to_csv(path, index=False)
+        tmp_path = path + ".tmp"
+        df.to_csv(tmp_path, index=False)
+        os.replace(tmp_path, path)
 
         print(f"[OK] Saved {path} rows={len(df)} (from Windows API)")
         return len(df)
@@ -74,6 +83,63 @@ def fetch(symbol: str, tf_name: str, years: int, outdir: str, api_url: str):
         print(f"[ERROR] Failed to fetch {symbol} {tf_name}: {e}")
         return 0
 
+def _last_line_offset(f):
+    """Byte offset of the last non-empty line in a binary file opened for reading"""
+    f.seek(0, os.SEEK_END)
+    pos = f.tell()
+    buf = b""
+    while pos > 0:
+        step = min(4096, pos)
+        pos -= step
+        f.seek(pos)
+        buf = f.read(step) + buf
+        idx = buf.rstrip(b"\r\n").rfind(b"\n")
+        if idx >= 0:
+            return pos + idx + 1
+    return 0
+
+def fetch_recent(symbol: str, tf_name: str, count: int, years: int, outdir: str, api_url: str, before=None):
+    """
+    Merges the latest `count` bars into an existing CSV. Only the last stored row is
+    rewritten, so the file head and history stay byte-for-byte the same; the result goes
+    through a temp file, so readers never see a half-written row. With `before` (the open
+    time of the bar still forming, in the CSV's clock) only closed bars are stored.
+    Falls back to a full fetch when there is no CSV yet or the gap is wider than `count`.
+    """
+    path = os.path.join(outdir, f"{symbol}_{tf_name}.csv")
+    if not os.path.exists(path):
+        return fetch(symbol, tf_name, years, outdir, api_url, before)
+    try:
+        df = request_bars(symbol, tf_name, count, api_url)
+        if df is None or df.empty:
+            return 0
+        if before is not None:
+            df = df[df["time"] < before]
+            if df.empty:
+                return 0
+
+        tmp_path = path + ".tmp"
+        with open(path, "rb") as f:
+            last_start = _last_line_offset(f)
+            f.seek(last_start)
+            last_time = pd.Timestamp(f.readline().decode("utf-8").split(",")[0])
+            if df["time"].iloc[0] > last_time:
+                print(f"[WARN] gap wider than {count} bars for {symbol} {tf_name}, refetching history")
+                return fetch(symbol, tf_name, years, outdir, api_url, before)
+
+            new_rows = df[df["time"] >= last_time]
+            f.seek(0)
+            with open(tmp_path, "wb") as out:
+                out.write(f.read(last_start))
+                out.write(new_rows.to_csv(header=False, index=False).encode("utf-8"))
+        os.replace(tmp_path, path)
+
+        return max(len(new_rows) - 1, 0)
+
+    except Exception as e:
+        print(f"[ERROR] Failed to update {symbol} {tf_name}: {e}")
+        return 0
+
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--config", required=True)
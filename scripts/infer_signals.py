@@ -11,7 +11,10 @@ import yaml
 
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from scripts.utils import make_features, build_trade
+from scripts.utils import make_features, build_trade, load_features_tail, verify_tail_features
+
+
+MODEL_TYPES = ["lstm", "gru", "attention"]
 
 
 def load_cfg(path):
@@ -19,27 +22,139 @@ def load_cfg(path):
         return yaml.safe_load(f)
 
 
-def infer_one(symbol, tf_name, prob_th, params):
+def ensemble_weights(cfg):
+    """Per-architecture weights from the ensemble section of config.yaml (equal by default)."""
+    weights = cfg.get("ensemble", {}).get("weights") or {}
+    return {m: float(weights.get(m, 1.0)) for m in MODEL_TYPES}
+
+
+_models = {}  # cache key -> (stamp of the model files, loaded model)
+
+
+def _files_stamp(paths):
+    stamp = []
+    for path in paths:
+        if os.path.exists(path):
+            st = os.stat(path)
+            stamp.append((path, st.st_mtime_ns, st.st_size))
+    return tuple(stamp)
+
+
+def _cached_model(key, paths, build):
+    """build() once per key, again only when one of `paths` is added, removed or rewritten (retrained)."""
+    stamp = _files_stamp(paths)
+    cached = _models.get(key)
+    if cached is None or cached[0] != stamp:
+        cached = (stamp, build())
+        _models[key] = cached
+    return cached[1]
+
+
+def load_ensemble(symbol, tf_name, weights):
+    """
+    Every trained architecture for a pair fused into one multi-output graph, so all members
+    run in a single forward pass. Returns (member names, fused model); the fused model is
+    cached per (symbol, tf, weights) until a member file changes.
+    """
+    model_types = [m for m in MODEL_TYPES if weights.get(m, 0) > 0]
+    paths = [f"models/{symbol}_{tf_name}_{m}.h5" for m in model_types]
+    key = (symbol, tf_name, tuple(sorted(weights.items())))
+    return _cached_model(key, paths, lambda: _fuse_ensemble(symbol, tf_name, model_types, paths))
+
+
+def _fuse_ensemble(symbol, tf_name, model_types, paths):
+    members = []
+    for model_type, path in zip(model_types, paths):
+        if not os.path.exists(path):
+            continue
+        # The attention model holds a Lambda layer; these are our own training artifacts
+        try:
+            model = tf.keras.models.load_model(path, compile=False, safe_mode=False)
+        except Exception as e:
+            print(f"[WARN] could not load {path}, leaving it out of the ensemble: {e}")
+            continue
+        if members and model.input_shape[1:] != members[0][1].input_shape[1:]:
+            print(f"[WARN] {path} expects input {model.input_shape[1:]}, not {members[0][1].input_shape[1:]} "
+                  f"like {members[0][0]}; leaving it out of the ensemble")
+            continue
+        members.append((model_type, model))
+    if not members:
+        return [], None
+
+    inputs = tf.keras.Input(shape=members[0][1].input_shape[1:])
+    # Loaded models can share a default name, which a functional graph rejects, so each one
+    # runs inside a uniquely named wrapper
+    outputs = [tf.keras.Sequential([model], name=f"{model_type}_member")(inputs, training=False)
+               for model_type, model in members]
+    fused = tf.keras.Model(inputs=inputs, outputs=outputs, name=f"{symbol}_{tf_name}_ensemble")
+    return [name for name, _ in members], fused
+
+
+def predict_ensemble(fused, names, weights, X):
+    """Weighted average of member probabilities plus the per-member breakdown."""
+    # The compiled predict function is kept on the (cached) model, so repeat calls skip tracing
+    outputs = fused.predict_on_batch(X)
+    if not isinstance(outputs, (list, tuple)):
+        outputs = [outputs]
+    member_proba = np.stack([np.asarray(o)[0] for o in outputs])
+    w = np.array([weights[name] for name in names], dtype=np.float64)
+    proba = (w / w.sum()) @ member_proba
+    members = {
+        name: {"short": float(p[0]), "no": float(p[1]), "long": float(p[2]), "weight": float(wi / w.sum())}
+        for name, p, wi in zip(names, member_proba, w)
+    }
+    return proba, members
+
+
+def infer_one(symbol, tf_name, prob_th, params, full_history=False, verify_tail=False, weights=None, before=None):
+    """
+    Signal for one pair scored on the last bar of its CSV; with `before` (the open time of the
+    bar still forming) on the last bar opening before it. None if the pair can't be scored.
+    """
     path = f"data/{symbol}_{tf_name}.csv"
     meta_path = f"data/{symbol}_{tf_name}_meta.json"
-    model_path = f"models/{symbol}_{tf_name}_lstm.h5"
-    if not (os.path.exists(path) and os.path.exists(meta_path) and os.path.exists(model_path)):
+    if weights:
+        model_paths = [f"models/{symbol}_{tf_name}_{m}.h5" for m in MODEL_TYPES if weights.get(m, 0) > 0]
+    else:
+        model_paths = [f"models/{symbol}_{tf_name}_lstm.h5"]
+    if not (os.path.exists(path) and os.path.exists(meta_path) and any(os.path.exists(p) for p in model_paths)):
         print(f"[SKIP] infer missing {symbol} {tf_name}")
         return None
 
-    df = pd.read_csv(path, parse_dates=["time"])
-    feat = make_features(df)
     with open(meta_path, "r", encoding="utf-8") as f:
         meta = json.load(f)
     cols = meta["features"]
     seq_len = meta["seq_len"]
+
+    if verify_tail:
+        mismatches = verify_tail_features(path, seq_len, cols)
+        if mismatches:
+            print(f"[WARN] tail features differ from full history for {symbol} {tf_name}: {mismatches}")
+        else:
+            print(f"[OK] tail features match full history for {symbol} {tf_name}")
+
+    if full_history:
+        feat = make_features(pd.read_csv(path, parse_dates=["time"]))
+    else:
+        # One spare row in case the last one is forming and gets dropped
+        feat = load_features_tail(path, seq_len, extra_rows=1 if before is not None else 0)
+    if before is not None:
+        feat = feat[feat["time"] < before]
     if len(feat) < seq_len + 1:
         print(f"[WARN] too short for infer {symbol} {tf_name}")
         return None
 
     X = feat[cols].values[-seq_len:].astype(np.float32)[None, ...]
-    model = tf.keras.models.load_model(model_path)
-    proba = model.predict(X, verbose=0)[0]
+    members = None
+    if weights:
+        names, fused = load_ensemble(symbol, tf_name, weights)
+        if fused is None:
+            print(f"[WARN] no loadable model for {symbol} {tf_name}, skipping")
+            return None
+        proba, members = predict_ensemble(fused, names, weights, X)
+    else:
+        model = _cached_model(model_paths[0], model_paths[:1], lambda: tf.keras.models.load_model(model_paths[0]))
+        proba = model.predict_on_batch(X)[0]
     p_short, p_no, p_long = float(proba[0]), float(proba[1]), float(proba[2])
 
     last = feat.iloc[-1]
@@ -66,7 +181,7 @@ def infer_one(symbol, tf_name, prob_th, params):
         issues.append("тренд проти сигналу")
     comment = "Фільтри пройдено, сигнал активний." if status == "ACTIVE" else "Очікуємо: " + ", ".join(issues)
 
-    return {
+    result = {
         "symbol": symbol,
         "tf": tf_name,
         "time": datetime.utcnow().isoformat() + "Z",
@@ -91,33 +206,55 @@ def infer_one(symbol, tf_name, prob_th, params):
             },
         },
     }
+    if members:
+        result["signal"]["members"] = members
+    return result
+
+
+def build_output(signals):
+    return {
+        "date": datetime.utcnow().strftime("%Y-%m-%d"),
+        "timezone": "Europe/Berlin",
+        "generated_at": datetime.utcnow().isoformat() + "Z",
+        "disclaimer": "Сигнали згенеровані LSTM-моделлю. Це не фінансова порада. Торгуйте відповідально.",
+        "signals": signals,
+    }
+
+
+def write_output(output, path):
+    """Writes signals.json via a temp file so readers never see a half-written file."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(output, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
 
 
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--config", required=True)
     ap.add_argument("--out", default="outputs/signals.json", help="Output file path (default: outputs/signals.json)")
+    ap.add_argument("--full-history", action="store_true",
+                    help="Build features from the whole CSV instead of the bounded tail")
+    ap.add_argument("--verify-tail", action="store_true",
+                    help="Check that tail-built features match the full-history ones before inferring")
+    ap.add_argument("--ensemble", action="store_true",
+                    help="Blend all trained architectures (lstm/gru/attention) with the config ensemble weights")
     args = ap.parse_args()
 
     cfg = load_cfg(args.config)
     prob_th = cfg["thresholds"]["prob"]
-    output = {
-        "date": datetime.utcnow().strftime("%Y-%m-%d"),
-        "timezone": "Europe/Berlin",
-        "generated_at": datetime.utcnow().isoformat() + "Z",
-        "disclaimer": "Сигнали згенеровані LSTM-моделлю. Це не фінансова порада. Торгуйте відповідально.",
-        "signals": [],
-    }
+    weights = ensemble_weights(cfg) if args.ensemble else None
+    signals = []
 
     for symbol in cfg["symbols"]:
         for tf_name, tf_cfg in cfg["timeframes"].items():
-            result = infer_one(symbol, tf_name, prob_th, tf_cfg)
+            result = infer_one(symbol, tf_name, prob_th, tf_cfg,
+                               full_history=args.full_history, verify_tail=args.verify_tail, weights=weights)
             if result:
-                output["signals"].append(result)
+                signals.append(result)
 
-    os.makedirs(os.path.dirname(args.out), exist_ok=True)
-    with open(args.out, "w", encoding="utf-8") as f:
-        json.dump(output, f, ensure_ascii=False, indent=2)
+    write_output(build_output(signals), args.out)
     print("[OK] wrote", args.out)
 
 
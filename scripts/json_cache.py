@@ -0,0 +1,88 @@
+"""
+Cached JSON responses for the dashboard endpoints.
+Output files are parsed and serialized once per (mtime, size) of the file, in-memory
+payloads once per version. Every response carries an ETag of its body and (for files)
+Last-Modified, so the dashboard's polls come back as empty 304s until something changes.
+"""
+import hashlib
+import json
+import os
+from email.utils import formatdate, parsedate_to_datetime
+from typing import NamedTuple, Optional
+
+from fastapi import Request, Response
+
+
+class CachedJson(NamedTuple):
+    body: bytes
+    etag: str
+    mtime: Optional[float] = None
+
+
+def cached_json(data, mtime: float = None) -> CachedJson:
+    """Serializes data the way FastAPI's JSONResponse does and tags the body."""
+    body = json.dumps(data, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+    return CachedJson(body, f'"{hashlib.sha1(body).hexdigest()[:20]}"', mtime)
+
+
+class JsonFileCache:
+    """{name: (stamp, CachedJson)}; an entry is rebuilt only when its stamp changes."""
+
+    def __init__(self):
+        self._entries = {}
+
+    def data(self, name, stamp, data) -> CachedJson:
+        """Entry for in-memory data (e.g. the meta-signal payload of a given version)."""
+        cached = self._entries.get(name)
+        if cached is None or cached[0] != stamp:
+            cached = (stamp, cached_json(data))
+            self._entries[name] = cached
+        return cached[1]
+
+    def file(self, path) -> Optional[CachedJson]:
+        """
+        Entry for a JSON file, None if it does not exist. A file caught mid-write keeps
+        serving its previous version.
+        """
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        stamp = (st.st_mtime_ns, st.st_size)
+        cached = self._entries.get(path)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = cached_json(json.load(f), st.st_mtime)
+        except json.JSONDecodeError:
+            if cached is None:
+                raise
+            return cached[1]
+        self._entries[path] = (stamp, entry)
+        return entry
+
+
+def _not_modified(request: Request, entry: CachedJson) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or entry.etag in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and entry.mtime is not None:
+        try:
+            return int(entry.mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def json_response(request: Request, entry: CachedJson) -> Response:
+    """200 with the cached body, or an empty 304 if the client already has this version."""
+    # no-cache: browsers may keep the body but must revalidate on every poll
+    headers = {"ETag": entry.etag, "Cache-Control": "no-cache"}
+    if entry.mtime is not None:
+        headers["Last-Modified"] = formatdate(entry.mtime, usegmt=True)
+    if _not_modified(request, entry):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
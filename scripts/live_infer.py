@@ -0,0 +1,110 @@
+"""
+Bar-close-driven live inference loop.
+Scores only the (symbol, tf) pairs whose bar just closed, keeps the last result for the
+rest and rewrites signals.json after every cycle that produced something new.
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.infer_signals import load_cfg, ensemble_weights, infer_one, build_output, write_output
+from scripts.fetch_mt5_linux import fetch_recent
+from scripts.utils import read_csv_tail, TF_MINUTES
+
+
+def bar_boundary(tf_name, now, utc_offset_hours=0):
+    """
+    Open time of the bar that is forming at `now` (UTC), in the broker's bar grid and server
+    clock, which is the clock of the bar times in the CSVs.
+    """
+    minutes = TF_MINUTES[tf_name]
+    server_now = now + timedelta(hours=utc_offset_hours)
+    day_start = server_now.replace(hour=0, minute=0, second=0, microsecond=0)
+    elapsed = int((server_now - day_start).total_seconds() // 60)
+    return day_start + timedelta(minutes=elapsed - elapsed % minutes)
+
+
+def last_closed_bar_time(symbol, tf_name, boundary):
+    """Open time of the last stored bar that opened before `boundary`, i.e. has closed."""
+    path = f"data/{symbol}_{tf_name}.csv"
+    if not os.path.exists(path):
+        return None
+    # Another writer may have stored the forming bar as well
+    times = read_csv_tail(path, 2)["time"]
+    closed = times[times < boundary]
+    return closed.iloc[-1] if len(closed) else None
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Live inference loop that re-scores pairs as their bars close.")
+    ap.add_argument("--config", required=True)
+    ap.add_argument("--out", default="outputs/signals.json", help="Output file path (default: outputs/signals.json)")
+    ap.add_argument("--ensemble", action="store_true",
+                    help="Blend all trained architectures (lstm/gru/attention) with the config ensemble weights")
+    ap.add_argument("--api-url", default=None,
+                    help="Windows MT5 API URL; when set, new bars are merged into data/ before scoring")
+    ap.add_argument("--fetch-bars", type=int, default=5, help="Bars requested per refresh from the MT5 API")
+    ap.add_argument("--poll", type=float, default=5.0, help="Seconds between scheduler cycles")
+    ap.add_argument("--close-delay", type=float, default=3.0, help="Seconds to wait after a bar boundary")
+    ap.add_argument("--max-wait", type=float, default=600.0,
+                    help="Seconds to keep waiting for a closed bar to appear in the data before giving up")
+    ap.add_argument("--utc-offset", type=float, default=0.0, help="Broker server time offset from UTC, hours")
+    args = ap.parse_args()
+
+    cfg = load_cfg(args.config)
+    prob_th = cfg["thresholds"]["prob"]
+    weights = ensemble_weights(cfg) if args.ensemble else None
+    pairs = [(symbol, tf_name) for symbol in cfg["symbols"] for tf_name in cfg["timeframes"]]
+
+    boundaries = {}
+    pending = {}  # (symbol, tf) -> wall-clock time the pair became due
+    cache = {}    # (symbol, tf) -> (bar time the result was computed on, signal)
+
+    print(f"[INFO] live inference for {len(pairs)} pairs, writing {args.out}")
+    while True:
+        now = datetime.utcnow()
+        for tf_name in cfg["timeframes"]:
+            boundary = bar_boundary(tf_name, now - timedelta(seconds=args.close_delay), args.utc_offset)
+            if boundaries.get(tf_name) != boundary:
+                boundaries[tf_name] = boundary
+                for symbol in cfg["symbols"]:
+                    pending[(symbol, tf_name)] = now
+
+        changed = False
+        for key in sorted(pending, key=lambda k: TF_MINUTES[k[1]]):
+            symbol, tf_name = key
+            if args.api_url:
+                count = args.fetch_bars
+                years = cfg["timeframes"][tf_name].get("years", 5)
+                fetch_recent(symbol, tf_name, count, years, "data", args.api_url, before=boundaries[tf_name])
+
+            bar_time = last_closed_bar_time(symbol, tf_name, boundaries[tf_name])
+            cached = cache.get(key)
+            if cached is not None and bar_time == cached[0]:
+                if (now - pending[key]).total_seconds() > args.max_wait:
+                    print(f"[WARN] no new bar for {symbol} {tf_name}, keeping cached signal")
+                    del pending[key]
+                continue
+
+            result = infer_one(symbol, tf_name, prob_th, cfg["timeframes"][tf_name], weights=weights,
+                               before=boundaries[tf_name])
+            del pending[key]
+            if result:
+                cache[key] = (bar_time, result)
+                changed = True
+                print(f"[OK] {symbol} {tf_name} scored on bar {bar_time}")
+
+        if changed:
+            signals = [cache[key][1] for key in pairs if key in cache]
+            write_output(build_output(signals), args.out)
+            print(f"[{datetime.utcnow().strftime('%H:%M:%S')}] wrote {args.out} ({len(signals)} signals)")
+
+        time.sleep(args.poll)
+
+
+if __name__ == "__main__":
+    main()
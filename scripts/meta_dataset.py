@@ -0,0 +1,83 @@
+"""
+Meta-model dataset: one row per date with {symbol}_{tf}_{field} signal features, trailing
+{currency}_strength features and {currency}_target labels.
+MetaFeatureMatrix fills a preallocated float32 matrix straight from store-layout signal
+frames, so backfilled signals never go through per-row dicts or an intermediate file.
+Datasets are saved as CSV or, for a .npz path, as one compressed array per column.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from scripts.currency_strength import strength_features, strength_labels
+
+SIGNAL_FIELDS = ["p_short", "p_no", "p_long", "trend_up"]
+
+
+class MetaFeatureMatrix:
+    """Date x (prefix, field) float32 feature matrix filled in place, NaN where no signal."""
+
+    def __init__(self, dates, prefixes: list):
+        self.dates = pd.DatetimeIndex(dates).normalize()
+        self.prefixes = list(prefixes)
+        self._prefix_col = {p: i * len(SIGNAL_FIELDS) for i, p in enumerate(self.prefixes)}
+        self.values = np.full((len(self.dates), len(self.prefixes) * len(SIGNAL_FIELDS)), np.nan, dtype=np.float32)
+
+    def add(self, frame: pd.DataFrame):
+        """Scatters a signal frame (signal_store layout) into the rows of its dates."""
+        if frame is None or frame.empty:
+            return
+        prefix = (frame["symbol"] + "_" + frame["tf"]).to_numpy()
+        rows = self.dates.get_indexer(pd.DatetimeIndex(frame["date"]).normalize())
+        known = np.array([p in self._prefix_col for p in prefix], dtype=bool) & (rows >= 0)
+        if not known.any():
+            return
+        cols = np.array([self._prefix_col[p] for p in prefix[known]])
+        for offset, field in enumerate(SIGNAL_FIELDS):
+            self.values[rows[known], cols + offset] = frame[field].to_numpy(dtype=np.float32)[known]
+
+    def to_frame(self) -> pd.DataFrame:
+        """Features as a DataFrame indexed by date, without dates that got no signal at all."""
+        columns = [f"{p}_{field}" for p in self.prefixes for field in SIGNAL_FIELDS]
+        has_signal = ~np.isnan(self.values).all(axis=1)
+        df = pd.DataFrame(self.values[has_signal], index=self.dates[has_signal], columns=columns)
+        df.index.name = "date"
+        return df
+
+
+def attach_labels(features: pd.DataFrame, price_data: dict, horizon_hours: float = 24, labels: pd.DataFrame = None) -> pd.DataFrame:
+    """
+    Joins trailing strength features and labels (least-squares strength unless `labels`
+    is given) onto a date-indexed feature frame, dropping dates where every label is missing.
+    """
+    if labels is None:
+        labels = strength_labels(features.index, price_data, horizon_hours)
+    dataset = features.join(strength_features(features.index, price_data, horizon_hours)).join(labels).sort_index()
+    dataset.index.name = "date"
+    # Rows with all labels missing happen at the end of the dataset
+    label_cols = [col for col in dataset.columns if "_target" in col]
+    return dataset.dropna(subset=label_cols, how="all")
+
+
+def save_meta_dataset(df: pd.DataFrame, path: str):
+    if not path.endswith(".npz"):
+        df.to_csv(path)
+        return
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez_compressed(f, __date__=df.index.to_numpy().astype("datetime64[s]"),
+                            __columns__=np.array(df.columns, dtype=str),
+                            **{c: df[c].to_numpy() for c in df.columns})
+    os.replace(tmp_path, path)
+
+
+def load_meta_dataset(path: str, columns: list = None) -> pd.DataFrame:
+    """Reads a dataset written by save_meta_dataset; with .npz only `columns` are decompressed."""
+    if not path.endswith(".npz"):
+        df = pd.read_csv(path, index_col="date", parse_dates=True)
+        return df[columns] if columns is not None else df
+    with np.load(path) as npz:
+        columns = list(columns) if columns is not None else npz["__columns__"].tolist()
+        df = pd.DataFrame({c: npz[c] for c in columns}, index=pd.DatetimeIndex(npz["__date__"], name="date"))
+    return df
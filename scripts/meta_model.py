@@ -0,0 +1,348 @@
+"""
+Uniform access to saved meta-models: native LightGBM/XGBoost boosters, the older sklearn
+wrappers, and {lgb_model, xgb_model, lgb_weight, xgb_weight} ensemble dicts.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+from datetime import datetime
+
+import joblib
+import numpy as np
+import pandas as pd
+
+
+def feature_names(model) -> list:
+    """Feature columns a meta-model was trained on, in order."""
+    if isinstance(model, dict):
+        model = model['lgb_model']
+    if hasattr(model, 'feature_names_in_'):
+        return list(model.feature_names_in_)
+    if hasattr(model, 'feature_name'):
+        return list(model.feature_name())
+    return list(model.feature_names)
+
+
+def predict_meta(model, X) -> np.ndarray:
+    """Predictions for a feature frame/matrix whose columns are in feature_names(model) order."""
+    if isinstance(model, dict):
+        return (model['lgb_weight'] * predict_meta(model['lgb_model'], X)
+                + model['xgb_weight'] * predict_meta(model['xgb_model'], X))
+    if hasattr(model, 'inplace_predict'):
+        # xgboost.Booster: predicts straight from the array without building a DMatrix
+        values = X.to_numpy(dtype=np.float32) if isinstance(X, pd.DataFrame) else X
+        return np.asarray(model.inplace_predict(values))
+    if hasattr(model, 'feature_name'):
+        # lightgbm.Booster: uses the early-stopping best iteration by default
+        values = X.to_numpy(dtype=np.float64) if isinstance(X, pd.DataFrame) else X
+        return np.asarray(model.predict(values))
+    return np.asarray(model.predict(X))
+
+
+# --- Compiled form ---------------------------------------------------------------------
+# Every tree of every currency model is flattened into shared node arrays, so a prediction
+# for all currencies is a few vectorized gathers per tree level instead of one library call
+# (and one unpickled model) per member.
+
+MISSING_NONE, MISSING_ZERO, MISSING_NAN = 0, 1, 2
+_LGB_MISSING = {"None": MISSING_NONE, "Zero": MISSING_ZERO, "NaN": MISSING_NAN}
+_ZERO_THRESHOLD = 1e-35  # LightGBM's kZeroThreshold
+
+
+class _TreeArrays:
+    def __init__(self):
+        self.nodes = {k: [] for k in ("feature", "threshold", "left", "right", "default_left",
+                                      "missing", "strict", "value")}
+        self.roots, self.weights, self.outputs = [], [], []
+
+    def add_node(self, feature=-1, threshold=0.0, left=-1, right=-1, default_left=False,
+                 missing=MISSING_NAN, strict=False, value=0.0):
+        for key, v in zip(self.nodes, (feature, threshold, left, right, default_left, missing, strict, value)):
+            self.nodes[key].append(v)
+        return len(self.nodes["feature"]) - 1
+
+    def add_lgb(self, booster, columns: dict, output: int, weight: float):
+        dump = booster.dump_model()
+        names = dump["feature_names"]
+
+        def walk(node):
+            if "leaf_value" in node:
+                return self.add_node(value=node["leaf_value"])
+            if node["decision_type"] != "<=":
+                raise ValueError("Categorical LightGBM splits cannot be compiled")
+            idx = self.add_node(feature=columns[names[node["split_feature"]]], threshold=node["threshold"],
+                                default_left=node["default_left"], missing=_LGB_MISSING[node["missing_type"]])
+            self.nodes["left"][idx] = walk(node["left_child"])
+            self.nodes["right"][idx] = walk(node["right_child"])
+            return idx
+
+        for tree in dump["tree_info"]:
+            self.roots.append(walk(tree["tree_structure"]))
+            self.weights.append(weight)
+            self.outputs.append(output)
+
+    def add_xgb(self, booster, columns: dict, output: int, weight: float):
+        learner = json.loads(booster.save_raw("json"))["learner"]
+        names = learner["feature_names"]
+        for tree in learner["gradient_booster"]["model"]["trees"]:
+            if any(tree["split_type"]):
+                raise ValueError("Categorical XGBoost splits cannot be compiled")
+            offset = len(self.nodes["feature"])
+            for i, left in enumerate(tree["left_children"]):
+                if left < 0:
+                    self.add_node(value=tree["split_conditions"][i])
+                else:
+                    self.add_node(feature=columns[names[tree["split_indices"][i]]],
+                                  # JSON holds the shortest float32 repr; restore the exact value
+                                  threshold=float(np.float32(tree["split_conditions"][i])),
+                                  left=offset + left, right=offset + tree["right_children"][i],
+                                  default_left=bool(tree["default_left"][i]), strict=True)
+            self.roots.append(offset)
+            self.weights.append(weight)
+            self.outputs.append(output)
+        return float(learner["learner_model_param"]["base_score"].strip("[]"))
+
+
+def compile_models(models: dict) -> dict:
+    """
+    Flattens {currency: meta-model} (LightGBM/XGBoost boosters or ensemble dicts) into
+    the arrays evaluated by CompiledMetaModels, over the union of their feature columns.
+    """
+    currencies = sorted(models)
+    # Pruned models may each use a different subset; evaluate them over the union
+    features = list(dict.fromkeys(name for currency in currencies for name in feature_names(models[currency])))
+    columns = {name: i for i, name in enumerate(features)}
+    trees = _TreeArrays()
+    base = np.zeros(len(currencies))
+
+    for output, currency in enumerate(currencies):
+        model = models[currency]
+        members = ([(model['lgb_model'], model['lgb_weight']), (model['xgb_model'], model['xgb_weight'])]
+                   if isinstance(model, dict) else [(model, 1.0)])
+        for member, weight in members:
+            # Older runs saved sklearn wrappers; compile their underlying boosters
+            if hasattr(member, 'booster_'):
+                member = member.booster_
+            elif hasattr(member, 'get_booster'):
+                # The wrapper predicts up to best_iteration but its booster keeps every round
+                best = getattr(member, 'best_iteration', None)
+                member = member.get_booster()
+                if best is not None:
+                    member = member[:best + 1]
+            if hasattr(member, 'save_raw'):
+                base[output] += weight * trees.add_xgb(member, columns, output, weight)
+            else:
+                trees.add_lgb(member, columns, output, weight)
+
+    compiled = {k: np.asarray(v) for k, v in trees.nodes.items()}
+    compiled.update(
+        feature=compiled["feature"].astype(np.int32), left=compiled["left"].astype(np.int32),
+        right=compiled["right"].astype(np.int32), missing=compiled["missing"].astype(np.int8),
+        default_left=compiled["default_left"].astype(bool), strict=compiled["strict"].astype(bool),
+        threshold=compiled["threshold"].astype(np.float64), value=compiled["value"].astype(np.float64),
+        roots=np.asarray(trees.roots, dtype=np.int32), tree_weight=np.asarray(trees.weights, dtype=np.float64),
+        tree_output=np.asarray(trees.outputs, dtype=np.int32), base=base,
+        currencies=np.asarray(currencies), features=np.asarray(features),
+    )
+    return compiled
+
+
+def save_compiled(compiled: dict, path: str):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(f, **compiled)
+    os.replace(tmp_path, path)
+
+
+COMPILED_NAME = "meta_compiled.npz"
+
+
+def load_meta_models(models_dir: str) -> dict:
+    """{currency: model} for every meta_model_{currency}.joblib in models_dir."""
+    models = {}
+    for filename in sorted(os.listdir(models_dir)):
+        if filename.startswith("meta_model_") and filename.endswith(".joblib"):
+            currency = filename.replace("meta_model_", "").replace(".joblib", "")
+            models[currency] = joblib.load(os.path.join(models_dir, filename))
+    return models
+
+
+def compile_dir(models_dir: str) -> str:
+    """Compiles every meta-model in models_dir into models_dir/meta_compiled.npz."""
+    path = os.path.join(models_dir, COMPILED_NAME)
+    save_compiled(compile_models(load_meta_models(models_dir)), path)
+    return path
+
+
+def compiled_is_fresh(models_dir: str) -> bool:
+    """True if meta_compiled.npz exists and no .joblib model is newer than it."""
+    path = os.path.join(models_dir, COMPILED_NAME)
+    if not os.path.exists(path):
+        return False
+    compiled_at = os.path.getmtime(path)
+    return all(os.path.getmtime(os.path.join(models_dir, f)) <= compiled_at
+               for f in os.listdir(models_dir) if f.startswith("meta_model_") and f.endswith(".joblib"))
+
+
+class CompiledMetaModels:
+    """All currency meta-models evaluated together from the arrays of compile_models."""
+
+    def __init__(self, compiled: dict):
+        for key, value in compiled.items():
+            setattr(self, key, value)
+        self.currencies = [str(c) for c in self.currencies]
+        self.features = [str(f) for f in self.features]
+        self.is_leaf = self.left < 0
+        # Tree outputs summed per currency with the ensemble weights in one product
+        self._combine = np.zeros((len(self.roots), len(self.currencies)))
+        self._combine[np.arange(len(self.roots)), self.tree_output] = self.tree_weight
+
+    @classmethod
+    def load(cls, path: str):
+        with np.load(path) as npz:
+            return cls({key: npz[key] for key in npz.files})
+
+    def predict(self, X) -> np.ndarray:
+        """(rows x currencies) predictions; X columns must be in self.features order."""
+        x64 = np.asarray(X.to_numpy() if isinstance(X, pd.DataFrame) else X, dtype=np.float64)
+        if x64.ndim == 1:
+            x64 = x64[None, :]
+        # XGBoost compares in float32 with '<'; LightGBM in float64 with '<='
+        x32 = x64.astype(np.float32).astype(np.float64)
+        rows = np.arange(len(x64))[:, None]
+        node = np.broadcast_to(self.roots, (len(x64), len(self.roots))).copy()
+
+        active = ~self.is_leaf[node]
+        while active.any():
+            feature = self.feature[node]
+            value = np.where(self.strict[node], x32[rows, feature], x64[rows, feature])
+            missing = self.missing[node]
+            is_nan = np.isnan(value)
+            # LightGBM without NaN handling treats NaN as 0.0
+            value = np.where(is_nan & (missing != MISSING_NAN), 0.0, value)
+            use_default = np.where(missing == MISSING_ZERO, np.abs(value) <= _ZERO_THRESHOLD,
+                                   is_nan & (missing == MISSING_NAN))
+            threshold = self.threshold[node]
+            go_left = np.where(self.strict[node], value < threshold, value <= threshold)
+            go_left = np.where(use_default, self.default_left[node], go_left)
+            node = np.where(active, np.where(go_left, self.left[node], self.right[node]), node)
+            active = ~self.is_leaf[node]
+
+        return self.value[node] @ self._combine + self.base
+
+
+# --- Versions --------------------------------------------------------------------------
+# Every training or update run snapshots the meta_model_*.joblib files it leaves behind into
+# MODELS_DIR/meta_versions/<version>/ with a manifest.json; CURRENT names the live one.
+
+VERSIONS_DIR = "meta_versions"
+
+
+def _model_files(models_dir: str):
+    return sorted(f for f in os.listdir(models_dir) if f.startswith("meta_model_") and f.endswith(".joblib"))
+
+
+def current_version(models_dir: str):
+    """Manifest of the live version, or None if no version was ever recorded."""
+    pointer = os.path.join(models_dir, VERSIONS_DIR, "CURRENT")
+    if not os.path.exists(pointer):
+        return None
+    with open(pointer, "r", encoding="utf-8") as f:
+        version = f.read().strip()
+    return read_manifest(models_dir, version)
+
+
+def read_manifest(models_dir: str, version: str) -> dict:
+    with open(os.path.join(models_dir, VERSIONS_DIR, version, "manifest.json"), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def list_versions(models_dir: str) -> list:
+    root = os.path.join(models_dir, VERSIONS_DIR)
+    if not os.path.isdir(root):
+        return []
+    return sorted(v for v in os.listdir(root) if os.path.exists(os.path.join(root, v, "manifest.json")))
+
+
+def _set_current(models_dir: str, version: str):
+    pointer = os.path.join(models_dir, VERSIONS_DIR, "CURRENT")
+    with open(pointer + ".tmp", "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(pointer + ".tmp", pointer)
+
+
+def snapshot_version(models_dir: str, manifest: dict, keep: int = 10) -> str:
+    """
+    Copies the live meta-models into a new version folder, records `manifest` (plus the
+    version id and its parent) and makes it CURRENT. Only the newest `keep` are kept.
+    """
+    parent = current_version(models_dir)
+    version = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+    folder = os.path.join(models_dir, VERSIONS_DIR, version)
+    os.makedirs(folder)
+    for filename in _model_files(models_dir):
+        shutil.copy2(os.path.join(models_dir, filename), folder)
+    manifest = {**manifest, "version": version, "parent": parent["version"] if parent else None,
+                "created": datetime.now().isoformat()}
+    with open(os.path.join(folder, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2, default=str)
+    _set_current(models_dir, version)
+
+    for old in list_versions(models_dir)[:-keep]:
+        shutil.rmtree(os.path.join(models_dir, VERSIONS_DIR, old))
+    return version
+
+
+def rollback(models_dir: str, version: str = None) -> str:
+    """
+    Restores a recorded version (default: the parent of the current one) as the live
+    meta-models and recompiles them. Returns the restored version id.
+    """
+    if version is None:
+        current = current_version(models_dir)
+        if current is None or not current.get("parent"):
+            raise ValueError("No previous meta-model version to roll back to")
+        version = current["parent"]
+    if version not in list_versions(models_dir):
+        raise ValueError(f"Unknown meta-model version {version}")
+
+    folder = os.path.join(models_dir, VERSIONS_DIR, version)
+    for filename in _model_files(models_dir):
+        os.remove(os.path.join(models_dir, filename))
+    for filename in _model_files(folder):
+        shutil.copy2(os.path.join(folder, filename), models_dir)
+    _set_current(models_dir, version)
+    compile_dir(models_dir)
+    return version
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Meta-model utilities.")
+    ap.add_argument("--compile", metavar="MODELS_DIR", help="Compile meta_model_*.joblib into meta_compiled.npz")
+    ap.add_argument("--versions", metavar="MODELS_DIR", help="List recorded meta-model versions")
+    ap.add_argument("--rollback", metavar="MODELS_DIR", help="Restore the previous (or --version) meta-models")
+    ap.add_argument("--version", default=None, help="Version id for --rollback")
+    args = ap.parse_args()
+
+    if args.compile:
+        path = compile_dir(args.compile)
+        compiled = CompiledMetaModels.load(path)
+        print(f"[OK] compiled {len(compiled.currencies)} meta-models ({len(compiled.roots)} trees) into {path}")
+    elif args.versions:
+        current = current_version(args.versions)
+        for version in list_versions(args.versions):
+            manifest = read_manifest(args.versions, version)
+            marker = "*" if current and current["version"] == version else " "
+            print(f"{marker} {version}  {manifest.get('mode', '?'):8}  parent={manifest.get('parent')}")
+    elif args.rollback:
+        version = rollback(args.rollback, args.version)
+        print(f"[OK] meta-models in {args.rollback} restored to version {version}")
+    else:
+        ap.print_help()
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+"""
+Resident meta-signal service.
+Keeps the meta-models in memory, reloads them when their files change and recomputes the
+meta-signal as soon as a new signals.json lands. The latest result is served from memory
+together with a version counter that increases with every recompute. Runs in-process
+(MetaSignalService(...).start(), e.g. from the web server) or as a worker:
+
+    python -m scripts.meta_service --config config.yaml
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+from datetime import datetime
+
+import pandas as pd
+import yaml
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.currency_strength import live_strength_features
+from scripts.meta_model import (COMPILED_NAME, CompiledMetaModels, compiled_is_fresh, feature_names,
+                                load_meta_models, predict_meta)
+
+
+def get_trade_levels(entry_price: float, atr: float, side: str, symbol: str) -> dict:
+    sl_distance = 1.5 * atr
+    rounder = 3 if "JPY" in symbol else 5
+    if side == "LONG":
+        sl = entry_price - sl_distance
+        tp1 = entry_price + sl_distance
+        tp2 = entry_price + 2 * sl_distance
+    else:  # SHORT
+        sl = entry_price + sl_distance
+        tp1 = entry_price - sl_distance
+        tp2 = entry_price - 2 * sl_distance
+    return {
+        "entry": round(entry_price, rounder),
+        "sl": round(sl, rounder),
+        "tp1": round(tp1, rounder),
+        "tp2": round(tp2, rounder),
+    }
+
+
+def flatten_signals(signals: list) -> dict:
+    """Flattens the list of signal objects into a single feature dictionary."""
+    flat_row = {}
+    for signal_item in signals:
+        prefix = f"{signal_item['symbol']}_{signal_item['tf']}"
+        signal_data = signal_item['signal']
+        flat_row[f"{prefix}_p_short"] = signal_data['probabilities']['short']
+        flat_row[f"{prefix}_p_no"] = signal_data['probabilities']['no']
+        flat_row[f"{prefix}_p_long"] = signal_data['probabilities']['long']
+        flat_row[f"{prefix}_trend_up"] = 1 if signal_data['trend_up'] else 0
+    return flat_row
+
+
+def models_stamp(models_dir: str) -> tuple:
+    """(name, mtime, size) of every meta-model file; changes whenever a model is retrained or rolled back."""
+    if not os.path.isdir(models_dir):
+        return ()
+    stamp = []
+    for filename in sorted(os.listdir(models_dir)):
+        if filename == COMPILED_NAME or (filename.startswith("meta_model_") and filename.endswith(".joblib")):
+            st = os.stat(os.path.join(models_dir, filename))
+            stamp.append((filename, st.st_mtime_ns, st.st_size))
+    return tuple(stamp)
+
+
+class MetaModels:
+    """The meta-models of a directory: the compiled form when it is fresh, else the joblib files."""
+
+    def __init__(self, models_dir: str):
+        self.compiled = None
+        self.models = {}
+        if compiled_is_fresh(models_dir):
+            # One array-based model for every currency; no per-model unpickling
+            self.compiled = CompiledMetaModels.load(os.path.join(models_dir, COMPILED_NAME))
+            self.features = list(self.compiled.features)
+        else:
+            self.models = load_meta_models(models_dir)
+            self.features = list(dict.fromkeys(name for model in self.models.values() for name in feature_names(model)))
+
+    def __bool__(self):
+        return self.compiled is not None or bool(self.models)
+
+    def predict(self, features: dict) -> dict:
+        """{currency: predicted strength}; raises KeyError if a model feature is missing."""
+        # Only the columns the (possibly pruned) models were trained on are fed
+        features_df = pd.DataFrame([features])[self.features]
+        if self.compiled is not None:
+            return dict(zip(self.compiled.currencies, self.compiled.predict(features_df)[0].tolist()))
+        return {currency: float(predict_meta(model, features_df[feature_names(model)])[0])
+                for currency, model in self.models.items()}
+
+
+def build_meta_signal(primary_signals: list, predictions: dict) -> dict:
+    """The meta_signal.json payload: strongest vs weakest currency and levels for the pair."""
+    sorted_predictions = sorted(predictions.items(), key=lambda item: item[1], reverse=True)
+    strongest = sorted_predictions[0]
+    weakest = sorted_predictions[-1]
+    recommended_pair = f"{strongest[0]}{weakest[0]}"
+
+    trade_levels = None
+    base_symbol_for_levels = f"{strongest[0]}USD"
+    if strongest[0] == 'JPY': base_symbol_for_levels = "USDJPY"
+
+    relevant_signal = next((s for s in primary_signals if s['symbol'] == base_symbol_for_levels and s['tf'] == 'H4'), None)
+
+    if relevant_signal:
+        trade_levels = get_trade_levels(relevant_signal['price'], relevant_signal['atr'], side="LONG", symbol=recommended_pair)
+
+    return {
+        "generated_at": datetime.now().isoformat(),
+        "strongest_currency": strongest[0],
+        "strongest_prediction": strongest[1],
+        "weakest_currency": weakest[0],
+        "weakest_prediction": weakest[1],
+        "recommended_pair": recommended_pair,
+        "trade_levels": trade_levels
+    }
+
+
+def write_meta_signal(output: dict, path: str):
+    """Writes meta_signal.json via a temp file so readers never see a half-written file."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(output, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+class MetaSignalService:
+    """
+    Watches signals_file and models_dir (by mtime, every `poll` seconds) from a daemon
+    thread. New models are loaded before anything is recomputed; a new signals file or a
+    model reload recomputes the meta-signal. latest() returns (version, payload) from memory.
+    """
+
+    def __init__(self, cfg: dict, signals_file="outputs/signals.json", models_dir="models", data_dir="data",
+                 out_path=None, poll=2.0):
+        self.cfg = cfg
+        self.signals_file = signals_file
+        self.models_dir = models_dir
+        self.data_dir = data_dir
+        self.out_path = out_path
+        self.poll = poll
+        self.models = None
+        self.version = 0
+        self.payload = {"error": "no meta-signal yet"}
+        self._models_stamp = None
+        self._signals_stamp = None
+        self._changed = threading.Condition()
+        self._thread = None
+        self._stop = threading.Event()
+
+    def latest(self):
+        with self._changed:
+            return self.version, self.payload
+
+    def wait(self, after_version: int, timeout: float = None):
+        """Blocks until a result newer than after_version exists (or timeout); returns latest()."""
+        with self._changed:
+            self._changed.wait_for(lambda: self.version > after_version, timeout)
+            return self.version, self.payload
+
+    def refresh(self) -> bool:
+        """One check of the watched files; recomputes if anything changed. True if a new result was published."""
+        stamp = models_stamp(self.models_dir)
+        reloaded = stamp != self._models_stamp
+        if reloaded:
+            self.models = MetaModels(self.models_dir)
+            self._models_stamp = stamp
+            print(f"[INFO] meta-models loaded from {self.models_dir} "
+                  f"({'compiled' if self.models.compiled is not None else f'{len(self.models.models)} joblib'})")
+
+        try:
+            st = os.stat(self.signals_file)
+        except FileNotFoundError:
+            return False
+        signals_stamp = (st.st_mtime_ns, st.st_size)
+        if not reloaded and signals_stamp == self._signals_stamp:
+            return False
+        self._signals_stamp = signals_stamp
+        return self._publish(self._compute())
+
+    def _compute(self) -> dict:
+        try:
+            with open(self.signals_file, "r", encoding="utf-8") as f:
+                primary_signals = json.load(f)["signals"]
+        except (FileNotFoundError, json.JSONDecodeError, KeyError) as e:
+            return {"error": f"Could not load or parse primary signals file: {e}"}
+        if not primary_signals:
+            return {"error": "no primary signals"}
+        if not self.models:
+            return {"error": "no meta-models found"}
+
+        features = flatten_signals(primary_signals)
+        strength_cfg = self.cfg.get("strength", {})
+        features.update(live_strength_features(self.data_dir, self.cfg["symbols"], strength_cfg.get("price_tf", "D1"),
+                                               strength_cfg.get("horizon_hours", 24)))
+        try:
+            predictions = self.models.predict(features)
+        except KeyError as e:
+            return {"error": f"Feature mismatch for meta-model (stale models?): {e}"}
+        if not predictions:
+            return {"error": "no predictions were made"}
+        return build_meta_signal(primary_signals, predictions)
+
+    def _publish(self, payload: dict) -> bool:
+        if "error" in payload:
+            print(f"[WARN] meta-signal not updated: {payload['error']}")
+            return False
+        with self._changed:
+            self.version += 1
+            self.payload = {**payload, "version": self.version}
+            self._changed.notify_all()
+        if self.out_path:
+            write_meta_signal(self.payload, self.out_path)
+        return True
+
+    def run(self):
+        while not self._stop.is_set():
+            try:
+                if self.refresh():
+                    print(f"[OK] meta-signal v{self.version}: {self.payload['recommended_pair']}")
+            except Exception as e:
+                print(f"Error in meta-signal service loop: {e}")
+            self._stop.wait(self.poll)
+
+    def start(self):
+        """Runs the watch loop on a daemon thread (for in-process use)."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run, name="meta-signal-service", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Resident meta-signal worker: recomputes meta_signal.json on new signals.")
+    ap.add_argument("--config", default="config.yaml", help="Path to config.yaml")
+    ap.add_argument("--signals-file", default="outputs/signals.json", help="Signals file to watch.")
+    ap.add_argument("--models-dir", default="models", help="Directory with the meta-models to watch.")
+    ap.add_argument("--data-dir", default="data", help="Directory with price CSVs for the strength features.")
+    ap.add_argument("--out", default="outputs/meta_signal.json", help="Where every new meta-signal is written.")
+    ap.add_argument("--poll", type=float, default=2.0, help="Seconds between file checks.")
+    args = ap.parse_args()
+
+    with open(args.config, "r", encoding="utf-8") as f:
+        cfg = yaml.safe_load(f)
+    service = MetaSignalService(cfg, args.signals_file, args.models_dir, args.data_dir, args.out, args.poll)
+    print(f"[INFO] watching {args.signals_file} and {args.models_dir}, writing {args.out}")
+    try:
+        service.run()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+Monte-Carlo block bootstrap of backtest trade logs.
+The per-trade returns are resampled in circular blocks of consecutive trades (keeping
+streaks and volatility clusters) into one (paths x trades) array, and every metric is a
+vectorized reduction along the trade axis. Confidence intervals come from the path
+quantiles; comparing two logs bootstraps the difference of each metric.
+
+    python -m scripts.monte_carlo --trades outputs/backtest_trades.csv [--baseline old_trades.csv]
+"""
+import argparse
+import json
+import sys
+
+import numpy as np
+import pandas as pd
+
+METRICS = ["total_return_pct", "sharpe_ratio", "sortino_ratio", "max_drawdown_pct", "calmar_ratio",
+           "win_rate_pct", "profit_factor", "expectancy_pct"]
+
+
+def block_bootstrap_indices(n: int, n_paths: int, block: int, rng) -> np.ndarray:
+    """(n_paths, n) trade indices made of circular blocks of `block` consecutive trades."""
+    n_blocks = -(-n // block)
+    starts = rng.integers(0, n, size=(n_paths, n_blocks, 1))
+    return ((starts + np.arange(block)) % n).reshape(n_paths, n_blocks * block)[:, :n]
+
+
+def path_metrics(returns: np.ndarray) -> dict:
+    """
+    Metrics of every row of a (paths x trades) array of per-trade fractional returns,
+    with the same definitions as evaluate_backtest (252 periods a year, sample std).
+    """
+    returns = np.atleast_2d(returns)
+    n = returns.shape[1]
+    mean = returns.mean(axis=1)
+    std = returns.std(axis=1, ddof=1)
+    # A path of one repeated trade has a rounding-noise std, not a meaningful Sharpe
+    std = np.where(std > 1e-12, std, 0.0)
+
+    losses = np.minimum(returns, 0.0)
+    is_loss = returns < 0
+    n_loss = is_loss.sum(axis=1)
+    loss_mean = losses.sum(axis=1) / np.maximum(n_loss, 1)
+    downside_std = np.sqrt(np.where(is_loss, (returns - loss_mean[:, None]) ** 2, 0.0).sum(axis=1)
+                           / np.maximum(n_loss - 1, 1))
+    downside_std = np.where(downside_std > 1e-12, downside_std, 0.0)
+
+    equity = np.cumprod(1 + returns, axis=1)
+    peak = np.maximum(np.maximum.accumulate(equity, axis=1), 1.0)
+    max_dd = np.maximum((1 - equity / peak).max(axis=1), 0.0)
+
+    gross_profit = np.maximum(returns, 0.0).sum(axis=1)
+    gross_loss = -losses.sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return {
+            "total_return_pct": 100 * (equity[:, -1] - 1),
+            "sharpe_ratio": np.where(std > 0, np.sqrt(252) * mean / std, 0.0),
+            "sortino_ratio": np.where((n_loss > 1) & (downside_std > 0), np.sqrt(252) * mean / downside_std, 0.0),
+            "max_drawdown_pct": 100 * max_dd,
+            "calmar_ratio": np.where(max_dd > 0, 252 * mean / max_dd, 0.0),
+            "win_rate_pct": 100 * (returns > 0).sum(axis=1) / n,
+            "profit_factor": np.where(gross_loss > 0, gross_profit / gross_loss,
+                                      np.where(gross_profit > 0, np.inf, 0.0)),
+            "expectancy_pct": 100 * mean,
+        }
+
+
+def _bootstrap_paths(returns, n_paths, block, rng, batch):
+    """Metric arrays over n_paths resampled paths, built `batch` paths at a time."""
+    parts = []
+    for lo in range(0, n_paths, batch):
+        idx = block_bootstrap_indices(len(returns), min(batch, n_paths - lo), block, rng)
+        parts.append(path_metrics(returns[idx]))
+    return {m: np.concatenate([p[m] for p in parts]) for m in METRICS}
+
+
+def default_block(n: int) -> int:
+    return max(1, int(round(n ** (1 / 3))))
+
+
+def _summary(point, paths, ci):
+    # Sample values rather than interpolation, which turns an infinite profit factor into NaN
+    lo = np.nanquantile(paths, (1 - ci) / 2, method="lower")
+    hi = np.nanquantile(paths, (1 + ci) / 2, method="higher")
+    finite = paths[np.isfinite(paths)]
+    return {"point": float(point), "mean": float(finite.mean()) if len(finite) else float("nan"),
+            "lo": float(lo), "hi": float(hi)}
+
+
+def bootstrap_metrics(returns, n_paths=10000, block=None, ci=0.95, seed=42, batch=1000) -> dict:
+    """
+    {metric: {point, mean, lo, hi}} for a sequence of per-trade fractional returns, where
+    [lo, hi] is the `ci` interval over n_paths block-bootstrap paths (block defaults to n^(1/3)).
+    """
+    returns = np.asarray(returns, dtype=np.float64)
+    block = block or default_block(len(returns))
+    rng = np.random.default_rng(seed)
+    point = path_metrics(returns)
+    paths = _bootstrap_paths(returns, n_paths, block, rng, batch)
+    return {m: _summary(point[m][0], paths[m], ci) for m in METRICS}
+
+
+def compare_bootstrap(returns, baseline, n_paths=10000, block=None, ci=0.95, seed=42, batch=1000) -> dict:
+    """
+    {metric: {point, mean, lo, hi, p_better}} for metric(returns) - metric(baseline), with the
+    two trade logs resampled independently. p_better is the share of paths where `returns`
+    is better (lower for drawdown); an interval excluding 0 means the change is real at `ci`.
+    """
+    returns = np.asarray(returns, dtype=np.float64)
+    baseline = np.asarray(baseline, dtype=np.float64)
+    rng = np.random.default_rng(seed)
+    point_a, point_b = path_metrics(returns), path_metrics(baseline)
+    paths_a = _bootstrap_paths(returns, n_paths, block or default_block(len(returns)), rng, batch)
+    paths_b = _bootstrap_paths(baseline, n_paths, block or default_block(len(baseline)), rng, batch)
+
+    result = {}
+    for m in METRICS:
+        with np.errstate(invalid="ignore"):
+            diff = paths_a[m] - paths_b[m]
+        better = diff < 0 if m == "max_drawdown_pct" else diff > 0
+        result[m] = {**_summary(point_a[m][0] - point_b[m][0], diff, ci), "p_better": float(better.mean())}
+    return result
+
+
+def trade_returns(trade_log: pd.DataFrame, risk_per_trade: float = 0.02) -> np.ndarray:
+    """Per-trade fractional returns of an evaluate_backtest trade log, in exit order."""
+    if "r_multiple" in trade_log:
+        return risk_per_trade * trade_log["r_multiple"].to_numpy(dtype=np.float64)
+    balance_before = trade_log["balance"] - trade_log["profit"]
+    return (trade_log["profit"] / balance_before).to_numpy(dtype=np.float64)
+
+
+def format_table(summary: dict, ci: float) -> str:
+    table = pd.DataFrame(summary).T
+    table = table.rename(columns={"lo": f"ci{ci:.0%}_lo", "hi": f"ci{ci:.0%}_hi"})
+    return table.to_string(float_format=lambda v: f"{v:.3f}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Block-bootstrap confidence intervals for backtest metrics.")
+    ap.add_argument("--trades", required=True, help="Trade log CSV written by evaluate_backtest.py")
+    ap.add_argument("--baseline", default=None, help="Trade log of the previous model, to test the change")
+    ap.add_argument("--paths", type=int, default=10000, help="Bootstrap paths")
+    ap.add_argument("--block", type=int, default=0, help="Block length in trades (0: n^(1/3))")
+    ap.add_argument("--ci", type=float, default=0.95, help="Confidence level")
+    ap.add_argument("--risk-per-trade", type=float, default=0.02, help="Risk per trade used to size R multiples")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--output", default=None, help="Save the result as JSON")
+    args = ap.parse_args()
+
+    returns = trade_returns(pd.read_csv(args.trades), args.risk_per_trade)
+    if len(returns) < 2:
+        print("[WARN] Need at least 2 trades to bootstrap.")
+        sys.exit(1)
+    if args.baseline:
+        baseline = trade_returns(pd.read_csv(args.baseline), args.risk_per_trade)
+        result = compare_bootstrap(returns, baseline, args.paths, args.block or None, args.ci, args.seed)
+        print(f"Change vs baseline ({len(returns)} vs {len(baseline)} trades, {args.paths} paths):")
+    else:
+        result = bootstrap_metrics(returns, args.paths, args.block or None, args.ci, args.seed)
+        print(f"Bootstrap of {len(returns)} trades ({args.paths} paths, block {args.block or default_block(len(returns))}):")
+    print(format_table(result, args.ci))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+        print(f"[OK] Saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Server-sent events fan-out for the dashboard.
+Publishers (the price loop, the signal watchers) hand every change to the hub once as
+JSON bytes; it becomes one SSE frame in a shared sequence that every subscriber stream
+reads from, so the cost of a change does not depend on how many browsers are open.
+A new subscriber, or one that fell behind the backlog, first gets the current state
+of every topic.
+"""
+import asyncio
+from collections import deque
+
+HEARTBEAT = 15.0  # seconds; keeps proxies from closing idle streams
+
+
+def sse_frame(event: str, body: bytes) -> bytes:
+    """One SSE message; body is single-line JSON (as serialized by json_cache.cached_json)."""
+    return b"event: " + event.encode() + b"\ndata: " + body + b"\n\n"
+
+
+class PushHub:
+    """Shared event sequence; publish() and stream() must run on the server's event loop."""
+
+    def __init__(self, backlog: int = 64):
+        self._frames = deque(maxlen=backlog)
+        self._seq = 0
+        self._state = {}
+        self._changed = asyncio.Event()
+        self.subscribers = 0
+
+    def publish(self, topic: str, body: bytes, state: bytes = None):
+        """
+        Sends body to every subscriber as a `topic` event. state is what a new subscriber
+        gets for the topic (default: body), e.g. all prices when body holds only the changed ones.
+        """
+        frame = sse_frame(topic, body)
+        self._state[topic] = frame if state is None else sse_frame(topic, state)
+        self._seq += 1
+        self._frames.append(frame)
+        # Wake everyone waiting on the current event; later waiters get a fresh one
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def snapshot(self) -> bytes:
+        return b"".join(self._state.values())
+
+    async def stream(self):
+        """Async iterator of SSE bytes for one subscriber (a StreamingResponse body)."""
+        self.subscribers += 1
+        try:
+            cursor = self._seq
+            yield b"retry: 3000\n\n" + self.snapshot()
+            while True:
+                if self._seq == cursor:
+                    try:
+                        await asyncio.wait_for(self._changed.wait(), HEARTBEAT)
+                    except asyncio.TimeoutError:
+                        yield b": ping\n\n"
+                        continue
+                missed = self._seq - cursor
+                if missed > len(self._frames):
+                    chunk = self.snapshot()
+                else:
+                    n = len(self._frames)
+                    chunk = b"".join(self._frames[i] for i in range(n - missed, n))
+                cursor = self._seq
+                yield chunk
+        finally:
+            self.subscribers -= 1
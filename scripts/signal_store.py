@@ -0,0 +1,218 @@
+"""
+Columnar store for historical signals.
+One compressed .npz partition per month (YYYY-MM.npz) with one typed array per column,
+so readers load only the months and columns they ask for.
+"""
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+SIDE_CODES = {"SHORT": -1, "LONG": 1}
+STATUS_CODES = {"WATCHLIST": 0, "ACTIVE": 1}
+
+COLUMNS = {
+    "date": "datetime64[s]",
+    "symbol": "U12",  # room for broker suffixes, e.g. EURUSD.m
+    "tf": "U3",
+    "p_short": np.float32,
+    "p_no": np.float32,
+    "p_long": np.float32,
+    "trend_up": np.int8,
+    "side": np.int8,
+    "status": np.int8,
+    "confidence": np.float32,
+    "price": np.float64,
+    "atr": np.float64,
+    "entry": np.float64,
+    "sl": np.float64,
+    "tp1": np.float64,
+    "tp2": np.float64,
+    "model_version": "U16",
+}
+KEY_COLUMNS = ["date", "symbol", "tf"]
+LEGACY_VERSION = ""  # model_version of rows migrated from the per-day JSON history
+
+
+def signals_to_frame(signals: list, model_versions: dict = None) -> pd.DataFrame:
+    """Converts signal dicts (infer_signals layout) into a typed store frame."""
+    model_versions = model_versions or {}
+    rows = []
+    for item in signals:
+        signal = item["signal"]
+        primary = signal["primary"]
+        rows.append((
+            item["time"].rstrip("Z"),
+            item["symbol"],
+            item["tf"],
+            signal["probabilities"]["short"],
+            signal["probabilities"]["no"],
+            signal["probabilities"]["long"],
+            1 if signal["trend_up"] else 0,
+            SIDE_CODES[signal["decision"]["side"]],
+            STATUS_CODES[signal["decision"]["status"]],
+            signal["decision"]["confidence"],
+            item["price"],
+            item["atr"],
+            primary["entry"],
+            primary["sl"],
+            primary["tp1"],
+            primary["tp2"],
+            model_versions.get(f"{item['symbol']}_{item['tf']}", LEGACY_VERSION),
+        ))
+    df = pd.DataFrame(rows, columns=list(COLUMNS))
+    df["date"] = pd.to_datetime(df["date"])
+    return _typed(df)
+
+
+def _typed(df: pd.DataFrame) -> pd.DataFrame:
+    for c, dtype in COLUMNS.items():
+        # Fixed-width strings would silently cut longer values and merge distinct keys
+        if isinstance(dtype, str) and dtype.startswith("U"):
+            too_long = df[c].astype(str).str.len() > int(dtype[1:])
+            if too_long.any():
+                raise ValueError(f"{c} longer than {dtype[1:]} characters: {df.loc[too_long, c].iloc[0]!r}")
+    return pd.DataFrame({c: df[c].to_numpy().astype(dtype) for c, dtype in COLUMNS.items()})
+
+
+def _partition_path(store_dir: str, month: str):
+    return os.path.join(store_dir, f"{month}.npz")
+
+
+def _read_partition(path: str, columns: list):
+    with np.load(path) as npz:
+        # NpzFile decompresses members lazily, so unrequested columns are never read
+        return pd.DataFrame({c: npz[c] for c in columns})
+
+
+def _write_partition(path: str, df: pd.DataFrame):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez_compressed(f, **{c: df[c].to_numpy().astype(dtype) for c, dtype in COLUMNS.items()})
+    os.replace(tmp_path, path)
+
+
+def list_months(store_dir: str):
+    if not os.path.isdir(store_dir):
+        return []
+    return sorted(f[:-4] for f in os.listdir(store_dir) if f.endswith(".npz"))
+
+
+def append_signals(store_dir: str, df: pd.DataFrame):
+    """
+    Upserts rows into their month partitions. A row replaces any stored row with the same
+    (date, symbol, tf), so re-running a backfill overwrites instead of duplicating.
+    """
+    if df.empty:
+        return
+    os.makedirs(store_dir, exist_ok=True)
+    df = _typed(df)
+    months = df["date"].dt.strftime("%Y-%m")
+    for month, part in df.groupby(months.to_numpy()):
+        path = _partition_path(store_dir, month)
+        if os.path.exists(path):
+            part = pd.concat([_read_partition(path, list(COLUMNS)), part], ignore_index=True)
+        part = part.drop_duplicates(subset=KEY_COLUMNS, keep="last").sort_values(KEY_COLUMNS)
+        _write_partition(path, part.reset_index(drop=True))
+
+
+def drop_stale_signals(store_dir: str, symbol: str, tf: str, version: str) -> int:
+    """
+    Deletes the (symbol, tf) rows produced by any model version other than `version`,
+    so a retrained model's history is regenerated instead of mixed with the old one.
+    Rows without a version (migrated from the per-day JSON history, model unknown) are
+    legacy and kept; a --force run of historical_generator replaces them.
+    Returns the number of rows removed.
+    """
+    removed = 0
+    for month in list_months(store_dir):
+        path = _partition_path(store_dir, month)
+        part = _read_partition(path, list(COLUMNS))
+        stale = ((part["symbol"] == symbol) & (part["tf"] == tf) & (part["model_version"] != version)
+                 & (part["model_version"] != LEGACY_VERSION)).to_numpy()
+        if stale.any():
+            removed += int(stale.sum())
+            if stale.all():
+                os.remove(path)
+            else:
+                _write_partition(path, part[~stale].reset_index(drop=True))
+    return removed
+
+
+def read_signals(store_dir: str, start=None, end=None, symbols=None, tfs=None, columns=None) -> pd.DataFrame:
+    """
+    Reads signals with start <= date <= end for the given symbols/timeframes.
+    Months outside [start, end] are never opened and only `columns` (plus the filter
+    columns) are decompressed from the ones that are.
+    """
+    columns = list(columns or COLUMNS)
+    load_cols = list(dict.fromkeys(columns + KEY_COLUMNS))
+    start = pd.Timestamp(start) if start is not None else None
+    end = pd.Timestamp(end) if end is not None else None
+
+    parts = []
+    for month in list_months(store_dir):
+        if start is not None and month < start.strftime("%Y-%m"):
+            continue
+        if end is not None and month > end.strftime("%Y-%m"):
+            continue
+        part = _read_partition(_partition_path(store_dir, month), load_cols)
+        mask = np.ones(len(part), dtype=bool)
+        if start is not None:
+            mask &= part["date"].to_numpy() >= start.to_datetime64()
+        if end is not None:
+            mask &= part["date"].to_numpy() <= end.to_datetime64()
+        if symbols is not None:
+            mask &= np.isin(part["symbol"].to_numpy(), list(symbols))
+        if tfs is not None:
+            mask &= np.isin(part["tf"].to_numpy(), list(tfs))
+        parts.append(part[mask])
+
+    if not parts:
+        return pd.DataFrame({c: np.array([], dtype=COLUMNS[c]) for c in columns})
+    return pd.concat(parts, ignore_index=True)[columns]
+
+
+def migrate_history(history_dir: str, store_dir: str):
+    """One-off conversion of outputs/history/YYYY-MM-DD/signals.json folders into the store."""
+    frames = []
+    for date_folder in sorted(os.listdir(history_dir)):
+        signal_path = os.path.join(history_dir, date_folder, "signals.json")
+        if not os.path.exists(signal_path):
+            continue
+        with open(signal_path, "r", encoding="utf-8") as f:
+            try:
+                data = json.load(f)
+            except json.JSONDecodeError:
+                print(f"[WARN] skipping unreadable {signal_path}")
+                continue
+        if data.get("signals"):
+            frames.append(signals_to_frame(data["signals"], data.get("models")))
+
+    if not frames:
+        print(f"No signals found in {history_dir}")
+        return 0
+    df = pd.concat(frames, ignore_index=True)
+    append_signals(store_dir, df)
+    return len(df)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Signal store utilities.")
+    ap.add_argument("--migrate", metavar="HISTORY_DIR", help="Convert per-day JSON folders into the store")
+    ap.add_argument("--store", default="outputs/signal_store", help="Signal store directory")
+    args = ap.parse_args()
+
+    if args.migrate:
+        rows = migrate_history(args.migrate, args.store)
+        print(f"[OK] migrated {rows} signals into {args.store} ({len(list_months(args.store))} monthly partitions)")
+    else:
+        ap.print_help()
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
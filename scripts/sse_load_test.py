@@ -0,0 +1,135 @@
+"""
+Load test of the dashboard push stream (/api/stream).
+Opens SSE subscribers in steps (e.g. 100, 200, 400), holds each level and reports the
+events delivered and the server's CPU use (read from /proc/<pid>/stat, so the server must
+run on the same Linux host). With the shared fan-out the CPU should stay flat as the
+number of clients grows.
+
+    python -m scripts.sse_load_test --url http://127.0.0.1:8000/api/stream --server-pid 1234
+"""
+import argparse
+import asyncio
+import os
+import time
+from urllib.parse import urlsplit
+
+
+def process_cpu_seconds(pid: int) -> float:
+    """User + system CPU seconds of a process (Linux /proc)."""
+    with open(f"/proc/{pid}/stat", "r") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def raise_fd_limit():
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ImportError, ValueError, OSError):
+        pass
+
+
+class Subscriber:
+    """One raw HTTP/1.1 SSE connection counting the events it receives."""
+
+    def __init__(self, host, port, path):
+        self.host, self.port, self.path = host, port, path
+        self.events = 0
+        self.connected = False
+        self.failed = None
+        self._task = None
+
+    async def run(self):
+        writer = None
+        try:
+            reader, writer = await asyncio.open_connection(self.host, self.port)
+            writer.write(f"GET {self.path} HTTP/1.1\r\nHost: {self.host}\r\n"
+                         f"Accept: text/event-stream\r\n\r\n".encode())
+            await writer.drain()
+            status = await reader.readline()
+            if b" 200 " not in status:
+                raise ConnectionError(status.decode(errors="replace").strip() or "connection closed")
+            self.connected = True
+            while True:
+                line = await reader.readline()
+                if not line:
+                    raise ConnectionError("stream closed by the server")
+                if line.startswith(b"event:"):
+                    self.events += 1
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            self.failed = str(e)
+            self.connected = False
+        finally:
+            if writer is not None:
+                writer.close()
+
+    def start(self):
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+
+
+async def run_load(url, steps, hold, settle, server_pid):
+    parts = urlsplit(url)
+    host, port, path = parts.hostname, parts.port or 80, parts.path or "/"
+    subscribers = []
+    rows = []
+    try:
+        for target in steps:
+            while len(subscribers) < target:
+                sub = Subscriber(host, port, path)
+                sub.start()
+                subscribers.append(sub)
+                if len(subscribers) % 50 == 0:
+                    await asyncio.sleep(0.05)  # don't flood the accept queue
+            await asyncio.sleep(settle)
+
+            events_before = sum(s.events for s in subscribers)
+            cpu_before = process_cpu_seconds(server_pid) if server_pid else None
+            started = time.time()
+            await asyncio.sleep(hold)
+            elapsed = time.time() - started
+            events = sum(s.events for s in subscribers) - events_before
+
+            row = {"clients": target, "connected": sum(s.connected for s in subscribers),
+                   "events_per_s": events / elapsed,
+                   "events_per_client_s": events / elapsed / max(target, 1)}
+            if server_pid:
+                row["server_cpu_pct"] = 100 * (process_cpu_seconds(server_pid) - cpu_before) / elapsed
+            rows.append(row)
+            print("  ".join(f"{k}={v:.2f}" if isinstance(v, float) else f"{k}={v}" for k, v in row.items()),
+                  flush=True)
+    finally:
+        await asyncio.gather(*(s.stop() for s in subscribers))
+    failures = [s.failed for s in subscribers if s.failed]
+    if failures:
+        print(f"[WARN] {len(failures)} subscribers failed, e.g.: {failures[0]}")
+    return rows
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Load test of the SSE push stream.")
+    ap.add_argument("--url", default="http://127.0.0.1:8000/api/stream", help="Stream URL of the running server")
+    ap.add_argument("--steps", default="100,200,400", help="Comma-separated subscriber counts")
+    ap.add_argument("--hold", type=float, default=20.0, help="Seconds measured at each step")
+    ap.add_argument("--settle", type=float, default=3.0, help="Seconds to wait after connecting a step")
+    ap.add_argument("--server-pid", type=int, default=0, help="PID of the server process for CPU sampling")
+    args = ap.parse_args()
+
+    raise_fd_limit()
+    steps = [int(x) for x in args.steps.split(",")]
+    print(f"[INFO] {args.url}: steps {steps}, {args.hold:g}s each")
+    rows = asyncio.run(run_load(args.url, steps, args.hold, args.settle, args.server_pid))
+    if args.server_pid and len(rows) > 1:
+        cpu = [r["server_cpu_pct"] for r in rows]
+        print(f"[OK] server CPU {cpu[0]:.1f}% at {rows[0]['clients']} clients, "
+              f"{cpu[-1]:.1f}% at {rows[-1]['clients']} clients")
+
+
+if __name__ == "__main__":
+    main()
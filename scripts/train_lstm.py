@@ -143,35 +143,25 @@ def augment_data(X, y, num_augmented=2):
     return np.array(X_aug, dtype=np.float32), np.array(y_aug)
 
 
-def train_one(symbol, tf_name, tf_cfg, model_type="lstm", use_focal_loss=True, augment=True):
-    ds_path = f"data/{symbol}_{tf_name}_dataset.npz"
-    meta_path = f"data/{symbol}_{tf_name}_meta.json"
-    if not (os.path.exists(ds_path) and os.path.exists(meta_path)):
-        print(f"[SKIP] no dataset/meta for {symbol} {tf_name}")
-        return
-
-    ds = np.load(ds_path, allow_pickle=True)
-    with open(meta_path, "r", encoding="utf-8") as f:
-        meta = json.load(f)
-
-    X_train, y_train = ds["X_train"], ds["y_train"]
-    if len(X_train) == 0:
-        print(f"[SKIP] not enough training data for {symbol} {tf_name}")
-        return
-
+def fit_model(X_train, y_train, X_val, y_val, seq_len, feature_count, model_type="lstm", use_focal_loss=True,
+              augment=True, model=None, epochs=100, verbose=2):
+    """
+    Compiles and fits a classifier on (samples, seq_len, features) windows labelled -1/0/1.
+    Passing `model` continues training that network (warm start) instead of building one.
+    Returns (model, history).
+    """
     # Data augmentation
     if augment and len(X_train) > 0:
         print(f"[INFO] Applying data augmentation...")
         X_train, y_train = augment_data(X_train, y_train, num_augmented=1)
 
     ytr = to_categorical(y_train)
-    X_val, y_val = ds["X_val"], ds["y_val"]
     has_val = len(X_val) > 0
     if has_val:
         yva = to_categorical(y_val)
     else:
         yva = None
-        print(f"[WARN] no validation split for {symbol} {tf_name}; training without validation data")
+        print(f"[WARN] no validation split; training without validation data")
 
     # Compute class weights
     unique_classes = np.unique(y_train)
@@ -180,8 +170,9 @@ def train_one(symbol, tf_name, tf_cfg, model_type="lstm", use_focal_loss=True, a
     class_weights = {mapping[int(cls)]: weight for cls, weight in zip(unique_classes, class_weights_array)}
     print(f"[INFO] Class weights: {class_weights}")
 
-    # Build model
-    model = build_model(meta["seq_len"], len(meta["features"]), model_type=model_type)
+    # Build model (or continue the given one)
+    if model is None:
+        model = build_model(seq_len, feature_count, model_type=model_type)
 
     # Optimizer з weight decay (AdamW)
     optimizer = tf.keras.optimizers.Adam(
@@ -216,17 +207,40 @@ def train_one(symbol, tf_name, tf_cfg, model_type="lstm", use_focal_loss=True, a
     ]
 
     fit_kwargs = {
-        "epochs": 100,  # Більше епох з early stopping
+        "epochs": epochs,  # Більше епох з early stopping
         "batch_size": 128,  # Менший batch для кращої генералізації
         "callbacks": callbacks,
-        "verbose": 2,
+        "verbose": verbose,
         "class_weight": class_weights,
     }
     if has_val:
         fit_kwargs["validation_data"] = (X_val, yva)
 
-    print(f"[INFO] Training {model_type} model for {symbol} {tf_name}...")
     history = model.fit(X_train, ytr, **fit_kwargs)
+    return model, history
+
+
+def train_one(symbol, tf_name, tf_cfg, model_type="lstm", use_focal_loss=True, augment=True):
+    ds_path = f"data/{symbol}_{tf_name}_dataset.npz"
+    meta_path = f"data/{symbol}_{tf_name}_meta.json"
+    if not (os.path.exists(ds_path) and os.path.exists(meta_path)):
+        print(f"[SKIP] no dataset/meta for {symbol} {tf_name}")
+        return
+
+    ds = np.load(ds_path, allow_pickle=True)
+    with open(meta_path, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+
+    X_train, y_train = ds["X_train"], ds["y_train"]
+    if len(X_train) == 0:
+        print(f"[SKIP] not enough training data for {symbol} {tf_name}")
+        return
+
+    X_val, y_val = ds["X_val"], ds["y_val"]
+    has_val = len(X_val) > 0
+    print(f"[INFO] Training {model_type} model for {symbol} {tf_name}...")
+    model, history = fit_model(X_train, y_train, X_val, y_val, meta["seq_len"], len(meta["features"]),
+                               model_type, use_focal_loss, augment)
 
     # Зберігаємо модель
     os.makedirs("models", exist_ok=True)
@@ -243,6 +257,7 @@ def train_one(symbol, tf_name, tf_cfg, model_type="lstm", use_focal_loss=True, a
 
     # Evaluation metrics
     if has_val:
+        yva = to_categorical(y_val)
         val_loss, val_acc, val_prec, val_rec = model.evaluate(X_val, yva, verbose=0)
         f1 = 2 * (val_prec * val_rec) / (val_prec + val_rec + 1e-9)
         print(f"[EVAL] Val Loss: {val_loss:.4f}, Acc: {val_acc:.4f}, Precision: {val_prec:.4f}, Recall: {val_rec:.4f}, F1: {f1:.4f}")
@@ -1,6 +1,27 @@
+import io
+import json
+import math
+import os
+
 import numpy as np
 import pandas as pd
 
+# Longest rolling-window chain in make_features: Volatility50 is a 50-bar std of
+# RET1 (itself one bar of lag), ADX is a 14-bar mean of DX built from 14-bar means.
+FEATURE_LOOKBACK = 51
+# Longest EMA span in make_features (EMA100); drives the tail warm-up margin.
+FEATURE_MAX_EMA_SPAN = 100
+
+# Bar length of each configured timeframe
+TF_MINUTES = {
+    "D1": 1440,
+    "H4": 240,
+    "H2": 120,
+    "H1": 60,
+    "M30": 30,
+    "M15": 15,
+}
+
 
 def ema(s: pd.Series, n: int):
     return s.ewm(span=n, adjust=False).mean()
@@ -154,6 +175,132 @@ def make_features(df: pd.DataFrame):
     return out.dropna().reset_index(drop=True)
 
 
+def ema_warmup(span: int, tol: float = 1e-6):
+    """Bars after which an EMA seeded mid-series is within tol of the full-history one."""
+    alpha = 2 / (span + 1)
+    return int(math.ceil(math.log(tol) / math.log(1 - alpha)))
+
+
+def tail_size(seq_len: int, tol: float = 1e-6):
+    """Raw bars needed for make_features to reproduce the last seq_len + 1 rows."""
+    return seq_len + 1 + FEATURE_LOOKBACK + ema_warmup(FEATURE_MAX_EMA_SPAN, tol)
+
+
+def read_csv_tail(path: str, n_rows: int, block_size: int = 1 << 16):
+    """Reads the header and the last n_rows lines of a CSV by seeking from the end."""
+    with open(path, "rb") as f:
+        header = f.readline()
+        data_start = f.tell()
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        buf = b""
+        lines = []
+        while pos > data_start:
+            step = min(block_size, pos - data_start)
+            pos -= step
+            f.seek(pos)
+            buf = f.read(step) + buf
+            lines = [line for line in buf.splitlines() if line.strip()]
+            # The first line of the buffer may be cut mid-row, so keep one spare
+            if len(lines) > n_rows:
+                break
+    body = b"\n".join(lines[-n_rows:]) if n_rows > 0 else b""
+    return pd.read_csv(io.BytesIO(header + body + b"\n"), parse_dates=["time"])
+
+
+def _csv_head_line(path: str):
+    with open(path, "rb") as f:
+        f.readline()
+        return f.readline().decode("utf-8").strip()
+
+
+def _obv_checkpoint_path(path: str):
+    return os.path.splitext(path)[0] + "_obv.json"
+
+
+def _write_obv_checkpoint(path: str, head: str, feat: pd.DataFrame):
+    # Anchor on the last closed bar: the final row may still be forming and get rewritten
+    last = feat.iloc[-2] if len(feat) > 1 else feat.iloc[-1]
+    ckpt_path = _obv_checkpoint_path(path)
+    tmp_path = ckpt_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"head": head, "time": last["time"].isoformat(), "obv": float(last["OBV"])}, f)
+    os.replace(tmp_path, ckpt_path)
+
+
+def _full_features(path: str, head: str):
+    feat = make_features(pd.read_csv(path, parse_dates=["time"]))
+    if len(feat):
+        _write_obv_checkpoint(path, head, feat)
+    return feat
+
+
+def _tail_features(path: str, head: str, n_rows: int):
+    """Tail-built features with OBV re-anchored on the checkpoint, or None if unusable."""
+    ckpt_path = _obv_checkpoint_path(path)
+    if not os.path.exists(ckpt_path):
+        return None
+    try:
+        with open(ckpt_path, "r", encoding="utf-8") as f:
+            ckpt = json.load(f)
+    except json.JSONDecodeError:
+        # Left behind by an interrupted write; the full rebuild replaces it
+        return None
+    if ckpt.get("head") != head:
+        return None
+
+    raw = read_csv_tail(path, n_rows)
+    feat = make_features(raw)
+    feat.attrs["tail"] = len(raw) >= n_rows
+    anchor = feat.index[feat["time"] == pd.Timestamp(ckpt["time"])]
+    if len(anchor) == 0:
+        return None
+    # OBV is a running sum and EMA is affine, so a constant offset fixes both columns
+    offset = ckpt["obv"] - float(feat.at[anchor[0], "OBV"])
+    feat["OBV"] = feat["OBV"] + offset
+    feat["OBV_EMA"] = feat["OBV_EMA"] + offset
+    if len(feat) > 1 and feat["time"].iloc[-2] != pd.Timestamp(ckpt["time"]):
+        _write_obv_checkpoint(path, head, feat)
+    return feat
+
+
+def load_features_tail(path: str, seq_len: int, tol: float = 1e-6, extra_rows: int = 0):
+    """
+    Features for live inference computed from only the last tail_size(seq_len) + extra_rows
+    bars. OBV depends on the whole file, so it is anchored on a checkpoint left by the previous
+    call; if the file was rewritten or the checkpoint is too old, falls back to a full read.
+    feat.attrs["tail"] is True when the result was built from a tail, i.e. its first
+    ema_warmup() rows have not converged yet.
+    """
+    head = _csv_head_line(path)
+    n_rows = tail_size(seq_len, tol) + extra_rows
+    feat = _tail_features(path, head, n_rows)
+    if feat is None:
+        feat = _full_features(path, head)
+        feat.attrs["tail"] = False
+    return feat
+
+
+def verify_tail_features(path: str, seq_len: int, cols: list, tol: float = 1e-6, rtol: float = 1e-5, atol: float = 1e-8):
+    """
+    Compares tail-built features against a full-history build over the last seq_len bars.
+    Returns {column: max abs error} for columns outside tolerance; empty means they match.
+    """
+    head = _csv_head_line(path)
+    full = _full_features(path, head).tail(seq_len).reset_index(drop=True)
+    tail = _tail_features(path, head, tail_size(seq_len, tol))
+    if tail is None:
+        return {"time": float("inf")}
+    tail = tail.tail(seq_len).reset_index(drop=True)
+    if len(tail) != len(full) or not (tail["time"] == full["time"]).all():
+        return {"time": float("inf")}
+
+    a = full[cols].to_numpy(dtype=np.float64)
+    b = tail[cols].to_numpy(dtype=np.float64)
+    bad = ~np.isclose(b, a, rtol=rtol, atol=atol)
+    return {c: float(np.abs(a[:, i] - b[:, i]).max()) for i, c in enumerate(cols) if bad[:, i].any()}
+
+
 def make_targets(df: pd.DataFrame, horizon: int, atr_mult: float):
     f = df.copy()
     f["ATR14"] = f["ATR14"].ffill()
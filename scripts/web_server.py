@@ -1,26 +1,45 @@
 from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import HTMLResponse
-import json
-import os
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import HTMLResponse, StreamingResponse
 import asyncio
 from datetime import datetime
 import MetaTrader5 as mt5
 import yaml
 
+from scripts.json_cache import JsonFileCache, cached_json, json_response
+from scripts.meta_service import MetaSignalService
+from scripts.push_hub import PushHub
+
 # --- Globals and Configuration ---
 
 app = FastAPI()
 g_prices = {}
 
-def load_symbols():
-    """Loads symbols from config.yaml"""
+def load_config():
     try:
         with open("config.yaml", "r", encoding="utf-8") as f:
-            cfg = yaml.safe_load(f)
-            return cfg.get("symbols", [])
+            return yaml.safe_load(f) or {}
     except FileNotFoundError:
-        print("[WARN] config.yaml not found. No symbols to fetch prices for.")
-        return []
+        print("[WARN] config.yaml not found.")
+        return {}
+
+def load_symbols():
+    """Loads symbols from config.yaml"""
+    symbols = load_config().get("symbols", [])
+    if not symbols:
+        print("[WARN] No symbols to fetch prices for.")
+    return symbols
+
+# Meta-models stay in memory and the meta-signal is recomputed whenever signals.json changes
+meta_service = MetaSignalService(load_config())
+# Parsed and serialized once per file version; the dashboard polls get 304 until it changes
+json_cache = JsonFileCache()
+
+# One fan-out of price ticks and new signal versions to every open dashboard
+push_hub = PushHub()
+
+SIGNALS_FILE = "outputs/signals.json"
+META_SIGNAL_FILE = "outputs/meta_signal.json"
 
 # --- Background Task for Price Updates ---
 
@@ -40,29 +59,65 @@ async def price_updater():
     print(f"Subscribing to price updates for: {', '.join(symbols)}")
     while True:
         try:
+            changed = {}
             for symbol in symbols:
                 tick = mt5.symbol_info_tick(symbol)
                 if tick:
-                    g_prices[symbol] = {
+                    quote = {
                         "bid": tick.bid,
                         "ask": tick.ask,
                         "time": datetime.fromtimestamp(tick.time).isoformat(),
                     }
+                    if g_prices.get(symbol) != quote:
+                        g_prices[symbol] = changed[symbol] = quote
+            if changed:
+                # Subscribers get only the changed ticks; a new one starts from all prices
+                push_hub.publish("prices", cached_json(changed).body, state=cached_json(g_prices).body)
             await asyncio.sleep(1)  # Update every second
         except Exception as e:
             print(f"Error in price updater loop: {e}")
             await asyncio.sleep(10) # Wait longer after an error
 
+# --- Background Task for Signal Pushes ---
+
+def latest_signals():
+    entry = json_cache.file(SIGNALS_FILE)
+    return entry or cached_json({"error": "no signals yet", "signals": []})
+
+def latest_meta_signal():
+    version, payload = meta_service.latest()
+    if version:
+        return json_cache.data("meta-signal", version, payload)
+    return json_cache.file(META_SIGNAL_FILE) or cached_json({"error": "no meta-signal yet"})
+
+async def signal_pusher():
+    """Checks for a new signals.json / meta-signal every 2 s and pushes each new version once."""
+    etags = {}
+    while True:
+        try:
+            for topic, latest in (("signals", latest_signals), ("meta-signal", latest_meta_signal)):
+                entry = await run_in_threadpool(latest)
+                if etags.get(topic) != entry.etag:
+                    etags[topic] = entry.etag
+                    push_hub.publish(topic, entry.body)
+        except Exception as e:
+            print(f"Error in signal pusher loop: {e}")
+        await asyncio.sleep(2)
+
 @app.on_event("startup")
 async def startup_event():
-    """On server startup, create the background price updater task."""
+    """On server startup, create the background price updater and signal pusher tasks."""
     asyncio.create_task(price_updater())
+    asyncio.create_task(signal_pusher())
+    if meta_service.cfg.get("symbols"):
+        meta_service.start()
 
 @app.on_event("shutdown")
 def shutdown_event():
     """On server shutdown, disconnect from MT5."""
     print("Shutting down MT5 connection.")
     mt5.shutdown()
+    meta_service.stop()
 
 # --- API Endpoints ---
 
@@ -72,22 +127,20 @@ def api_prices():
     return g_prices
 
 @app.get("/api/signals")
-def api_signals():
+async def api_signals(request: Request):
     """Returns the latest generated trading signals."""
-    path = "outputs/signals.json"
-    if not os.path.exists(path):
-        return {"error": "no signals yet", "signals": []}
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
+    return json_response(request, await run_in_threadpool(latest_signals))
 
 @app.get("/api/meta-signal")
-def api_meta_signal():
-    """Returns the latest generated meta-signal."""
-    path = "outputs/meta_signal.json"
-    if not os.path.exists(path):
-        return {"error": "no meta-signal yet"}
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
+async def api_meta_signal(request: Request):
+    """Returns the latest meta-signal (from memory once the service has computed one)."""
+    return json_response(request, await run_in_threadpool(latest_meta_signal))
+
+@app.get("/api/stream")
+def api_stream():
+    """Server-sent events: prices (changed ticks), signals and meta-signal (each new version)."""
+    return StreamingResponse(push_hub.stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @app.get("/api/history/{symbol}/{timeframe}")
 def api_history(symbol: str, timeframe: str, years: int = 5):
@@ -167,9 +220,7 @@ def index():
       return filters.join(', ');
     }
 
-    async function loadMetaSignal() {
-        const response = await fetch('/api/meta-signal');
-        const meta = await response.json();
+    function renderMetaSignal(meta) {
         const container = document.getElementById('meta-signal-summary');
         let html = `<h2>Головний Сигнал</h2>`;
         
@@ -189,9 +240,7 @@ def index():
         container.innerHTML = html;
     }
 
-    async function loadSignals() {
-      const response = await fetch('/api/signals');
-      const payload = await response.json();
+    function renderSignals(payload) {
       const container = document.getElementById('signals');
       const generatedAt = document.getElementById('generated_at');
       
@@ -226,9 +275,9 @@ def index():
       }
     }
 
-    async function loadPrices() {
-        const response = await fetch('/api/prices');
-        const prices = await response.json();
+    const prices = {};
+
+    function renderPrices() {
         const tableBody = document.getElementById('price-table-body');
         tableBody.innerHTML = '';
         for (const symbol in prices) {
@@ -238,7 +287,19 @@ def index():
         }
     }
     
+    const loadMetaSignal = async () => renderMetaSignal(await (await fetch('/api/meta-signal')).json());
+    const loadSignals = async () => renderSignals(await (await fetch('/api/signals')).json());
+    const loadPrices = async () => { Object.assign(prices, await (await fetch('/api/prices')).json()); renderPrices(); };
+
     window.addEventListener('load', () => {
+        if (window.EventSource) {
+            // The server pushes changed ticks and every new signal version; EventSource reconnects by itself
+            const stream = new EventSource('/api/stream');
+            stream.addEventListener('prices', (e) => { Object.assign(prices, JSON.parse(e.data)); renderPrices(); });
+            stream.addEventListener('signals', (e) => renderSignals(JSON.parse(e.data)));
+            stream.addEventListener('meta-signal', (e) => renderMetaSignal(JSON.parse(e.data)));
+            return;
+        }
         loadMetaSignal();
         loadSignals();
         loadPrices();
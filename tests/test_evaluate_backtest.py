@@ -0,0 +1,78 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from evaluate_backtest import _sweep_legs, compute_metrics, rank_sweep, simulate_exits, sweep_metrics
+from scripts.monte_carlo import bootstrap_metrics, trade_returns
+from scripts.signal_store import SIDE_CODES
+
+
+def hourly_bars(rows):
+    """Bars opening every hour from 00:00; rows are (open, high, low, close)."""
+    o, h, l, c = (np.array(col, dtype=np.float64) for col in zip(*rows))
+    time = pd.date_range("2024-01-01", periods=len(rows), freq="h").to_numpy()
+    return {"time": time, "open": o, "high": h, "low": l, "close": c}
+
+
+def close_stamped_long():
+    # Scored on the 00:00 bar and stamped with its close (01:00), entry at that close
+    return pd.DataFrame({
+        "date": [np.datetime64("2024-01-01T01:00")],
+        "side": [SIDE_CODES["LONG"]],
+        "entry": [1.0], "sl": [0.99], "tp1": [1.01], "tp2": [1.02],
+        "price": [1.0], "atr": [0.01],
+    })
+
+
+# The 01:00 bar trades through the stop; later bars run to both targets
+BARS = hourly_bars([
+    (0.995, 1.000, 0.994, 1.000),
+    (1.000, 1.001, 0.985, 0.990),
+    (0.990, 1.030, 0.990, 1.025),
+    (1.025, 1.030, 1.020, 1.025),
+])
+
+
+def test_stop_in_first_bar_after_close_stamp():
+    exits = simulate_exits(BARS, close_stamped_long(), max_bars=10)
+    assert exits["reason"].iloc[0] == "sl"
+    assert exits["r_multiple"].iloc[0] == -1.0
+    assert exits["exit_time"].iloc[0] == pd.Timestamp("2024-01-01T01:00")
+
+
+def test_sweep_stop_in_first_bar_after_close_stamp():
+    r_multiple, exit_idx = _sweep_legs(BARS, close_stamped_long(), 1.0, [1.0, 2.0], max_bars=10)
+    np.testing.assert_allclose(r_multiple[0], [-1.0, -1.0])
+    np.testing.assert_array_equal(exit_idx[0], [1, 1])
+
+
+def test_report_metrics_match_bootstrap_point():
+    rng = np.random.default_rng(0)
+    r_multiple = rng.choice([-1.0, 0.5, 1.5, 2.0], size=400, p=[0.45, 0.15, 0.25, 0.15])
+    # Compounded as simulate_trades does
+    balance = 10000 * np.cumprod(1 + 0.02 * r_multiple)
+    trade_log = pd.DataFrame({"r_multiple": r_multiple, "balance": balance,
+                              "profit": np.diff(balance, prepend=10000)})
+
+    report = compute_metrics(trade_log, 10000, 0.02)
+    bootstrap = bootstrap_metrics(trade_returns(trade_log, 0.02), n_paths=10)
+    for metric in ["total_return_pct", "sharpe_ratio", "sortino_ratio", "max_drawdown_pct", "calmar_ratio",
+                   "win_rate_pct", "profit_factor"]:
+        np.testing.assert_allclose(report[metric], bootstrap[metric]["point"], rtol=1e-9, err_msg=metric)
+
+
+def test_sweep_ranks_grid_points_with_too_few_trades():
+    rows = [{"tf": "ALL", "prob": prob, "sl_mult": 1.0, "tp1_mult": 1.0, "tp2_mult": 2.0,
+             **sweep_metrics(np.array([1.5] * n))} for prob, n in [(0.6, 1), (0.7, 0)]]
+    table = rank_sweep(rows)
+    assert table["sharpe_ratio"].isna().all() and table["rank_score"].isna().all()
+
+
+def test_sweep_skips_signals_without_atr():
+    signals = pd.concat([close_stamped_long(), close_stamped_long().assign(atr=0.0)], ignore_index=True)
+    r_multiple, _ = _sweep_legs(BARS, signals, 1.0, [1.0, 2.0], max_bars=10)
+    np.testing.assert_allclose(r_multiple[0], [-1.0, -1.0])
+    assert np.isnan(r_multiple[1]).all()
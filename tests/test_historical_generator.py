@@ -0,0 +1,113 @@
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import tensorflow as tf
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from evaluate_backtest import simulate_exits
+from historical_generator import backfill_bar_signals, backfill_signals, closed_bar_ends
+from scripts.signal_store import SIDE_CODES
+from scripts.utils import make_features
+
+
+def daily_bars(rows):
+    """D1 bars opening at 00:00 from 2024-01-01; rows are (open, high, low, close)."""
+    o, h, l, c = (np.array(col, dtype=np.float64) for col in zip(*rows))
+    time = pd.date_range("2024-01-01", periods=len(rows), freq="D").to_numpy()
+    return {"time": time, "open": o, "high": h, "low": l, "close": c}
+
+
+# The Jan 2 bar wicks down to 0.98 and closes back at 1.00; Jan 3 runs to both targets
+WICK_BARS = daily_bars([
+    (1.000, 1.001, 0.999, 1.000),
+    (1.000, 1.001, 0.980, 1.000),
+    (1.000, 1.030, 0.999, 1.025),
+    (1.025, 1.030, 1.020, 1.025),
+])
+
+
+def test_daily_store_scores_only_closed_bars():
+    dates = np.array(["2024-01-02", "2024-01-03"], dtype="datetime64[s]")
+    # The bar opening at 00:00 is still forming then
+    np.testing.assert_array_equal(closed_bar_ends(WICK_BARS["time"], "D1", dates), [0, 1])
+
+
+def test_daily_store_signal_ignores_the_wick_of_its_scored_bar():
+    date = np.datetime64("2024-01-03T00:00")
+    end = closed_bar_ends(WICK_BARS["time"], "D1", [date])[0]
+    entry = WICK_BARS["close"][end]
+    signal = pd.DataFrame({"date": [date], "side": [SIDE_CODES["LONG"]], "entry": [entry],
+                           "sl": [entry - 0.01], "tp1": [entry + 0.01], "tp2": [entry + 0.02]})
+    exits = simulate_exits(WICK_BARS, signal, max_bars=10)
+    assert exits["reason"].iloc[0] == "tp1+tp2"
+    assert exits["r_multiple"].iloc[0] > 0
+
+
+SEQ_LEN = 8
+FEATURES = ["RET1", "RET5", "LogRet", "BB_pct", "MACD_hist", "ATR_pct"]
+PARAMS = {"sl_mult": 1.5, "tp1_mult": 1.0, "tp2_mult": 2.0}
+
+
+def write_pair(root):
+    """data/ and models/ of an H4 EURUSD pair: a random walk with a weekend gap and a tiny model."""
+    rng = np.random.default_rng(0)
+    time = pd.date_range("2024-01-01", periods=420, freq="4h")
+    time = time[(time.dayofweek < 5)]
+    close = 1.1 * np.exp(np.cumsum(rng.normal(0, 0.002, len(time))))
+    open_ = np.concatenate([[1.1], close[:-1]])
+    spread = np.abs(rng.normal(0, 0.001, len(time)))
+    os.makedirs(root / "data")
+    os.makedirs(root / "models")
+    pd.DataFrame({"time": time, "Open": open_, "High": np.maximum(open_, close) + spread,
+                  "Low": np.minimum(open_, close) - spread, "Close": close,
+                  "Volume": rng.integers(100, 1000, len(time))}).to_csv(root / "data/EURUSD_H4.csv", index=False)
+    with open(root / "data/EURUSD_H4_meta.json", "w", encoding="utf-8") as f:
+        json.dump({"features": FEATURES, "seq_len": SEQ_LEN}, f)
+    tf.keras.utils.set_random_seed(0)
+    model = tf.keras.Sequential([tf.keras.Input((SEQ_LEN, len(FEATURES))), tf.keras.layers.LSTM(4),
+                                 tf.keras.layers.Dense(3, activation="softmax")])
+    model.save(root / "models/EURUSD_H4_lstm.h5")
+
+
+def loop_signal(df, model, stamp):
+    """The old per-date loop: features of the bars closed by `stamp`, one predict on the last window."""
+    feat = make_features(df[df["time"] + pd.Timedelta(hours=4) <= stamp])
+    if len(feat) < SEQ_LEN + 1:
+        return None
+    proba = model.predict(feat[FEATURES].values[-SEQ_LEN:].astype(np.float32)[None, ...], verbose=0)[0]
+    last = feat.iloc[-1]
+    return proba, last["Close"], last["ATR14"], int(last["TrendUp"])
+
+
+def assert_matches_loop(frame, df, model):
+    for row in frame.itertuples():
+        proba, price, atr, trend_up = loop_signal(df, model, row.date)
+        np.testing.assert_allclose([row.p_short, row.p_no, row.p_long], proba, atol=1e-5)
+        assert row.price == round(price, 5) and row.atr == round(atr, 5) and row.trend_up == trend_up
+        side = SIDE_CODES["LONG"] if proba[2] >= proba[0] else SIDE_CODES["SHORT"]
+        if abs(proba[2] - proba[0]) > 1e-5:
+            assert row.side == side
+        assert row.sl == round(price - np.sign(row.side) * PARAMS["sl_mult"] * atr, 5)
+
+
+def test_backfill_matches_the_per_date_loop(tmp_path, monkeypatch):
+    write_pair(tmp_path)
+    monkeypatch.chdir(tmp_path)
+    df = pd.read_csv("data/EURUSD_H4.csv", parse_dates=["time"])
+    model = tf.keras.models.load_model("models/EURUSD_H4_lstm.h5")
+
+    # Daily stamps, including weekend days that fall in the gap
+    dates = list(pd.date_range("2024-01-10", "2024-03-08", freq="D"))
+    frame = backfill_signals("EURUSD", "H4", 0.5, PARAMS, df, dates)
+    expected = [d for d in dates if loop_signal(df, model, d) is not None]
+    assert frame["date"].tolist() == expected
+    assert_matches_loop(frame, df, model)
+
+    # One signal per closed bar, stamped with its close; the last (forming) bar is never scored
+    frame = backfill_bar_signals("EURUSD", "H4", 0.5, PARAMS, df, "2024-02-20")
+    closes = df["time"] + pd.Timedelta(hours=4)
+    assert frame["date"].tolist() == closes[(closes >= "2024-02-20")].iloc[:-1].tolist()
+    assert_matches_loop(frame, df, model)
@@ -0,0 +1,60 @@
+import os
+import sys
+
+import lightgbm as lgb
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.meta_model import CompiledMetaModels, compile_models, predict_meta, save_compiled
+
+FEATURES = [f"f{i}" for i in range(6)]
+
+
+def feature_frame(n, seed):
+    rng = np.random.default_rng(seed)
+    X = pd.DataFrame(rng.normal(size=(n, len(FEATURES))), columns=FEATURES)
+    # Missing values, exact zeros and values on a coarse grid so rows land on split thresholds
+    X = X.mask(rng.random(X.shape) < 0.15)
+    X["f1"] = np.round(X["f1"], 1)
+    X.loc[X.index[::7], "f2"] = 0.0
+    return X
+
+
+def target(X):
+    return np.nan_to_num(X["f0"]) - 0.5 * np.nan_to_num(X["f1"]) * (X["f2"].fillna(1.0) > 0) + 0.1 * X["f3"].isna()
+
+
+def lgb_booster(X, y, **params):
+    params = {"objective": "regression", "num_leaves": 15, "min_data_in_leaf": 5, "verbose": -1, "seed": 0, **params}
+    return lgb.train(params, lgb.Dataset(X, y), num_boost_round=30)
+
+
+def xgb_booster(X, y):
+    dtrain = xgb.DMatrix(X.to_numpy(dtype=np.float32), y, feature_names=list(X.columns))
+    return xgb.train({"max_depth": 4, "eta": 0.2, "seed": 0}, dtrain, num_boost_round=30)
+
+
+def test_compiled_trees_match_booster_predict(tmp_path):
+    X_train, X_test = feature_frame(600, 0), feature_frame(300, 1)
+    y = target(X_train)
+    pruned = ["f3", "f0", "f5", "f1"]
+    models = {
+        "EUR": lgb_booster(X_train, y),
+        "GBP": lgb_booster(X_train, y, zero_as_missing=True),
+        "JPY": lgb_booster(X_train, y, use_missing=False),
+        "USD": xgb_booster(X_train[pruned], y),
+        "CHF": {"lgb_model": lgb_booster(X_train, y), "xgb_model": xgb_booster(X_train, y),
+                "lgb_weight": 0.6, "xgb_weight": 0.4},
+    }
+    path = str(tmp_path / "meta_compiled.npz")
+    save_compiled(compile_models(models), path)
+    compiled = CompiledMetaModels.load(path)
+
+    pred = pd.DataFrame(compiled.predict(X_test[compiled.features]), columns=compiled.currencies)
+    for currency, model in models.items():
+        X = X_test[pruned] if currency == "USD" else X_test
+        # XGBoost sums its trees in float32; a wrong branch would be off by a whole leaf value
+        atol = 1e-5 if currency in ("USD", "CHF") else 1e-12
+        np.testing.assert_allclose(pred[currency], predict_meta(model, X), rtol=0, atol=atol, err_msg=currency)
@@ -0,0 +1,38 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from portfolio_backtest import run_portfolio
+from scripts.signal_store import SIDE_CODES, STATUS_CODES
+
+
+def write_bars(data_dir, name, time, low):
+    n = len(time)
+    pd.DataFrame({"time": time, "Open": np.ones(n), "High": np.full(n, 1.001), "Low": low,
+                  "Close": np.ones(n)}).to_csv(os.path.join(data_dir, f"{name}.csv"), index=False)
+
+
+def long_signal(date, tf, sl):
+    return {"date": pd.Timestamp(date), "symbol": "EURUSD", "tf": tf, "side": SIDE_CODES["LONG"],
+            "status": STATUS_CODES["ACTIVE"], "confidence": 0.9, "entry": 1.0, "sl": sl, "tp1": 1.05, "tp2": 1.1}
+
+
+def test_d1_exit_is_booked_at_the_bar_close(tmp_path):
+    # The Jan 2 D1 bar trades through the stop; that is only known at its close (Jan 3 00:00)
+    write_bars(tmp_path, "EURUSD_D1", pd.date_range("2024-01-01", periods=4, freq="D"), [0.999, 0.98, 0.999, 0.999])
+    m15 = pd.date_range("2024-01-02", periods=192, freq="15min")
+    write_bars(tmp_path, "EURUSD_M15", m15, np.full(len(m15), 0.999))
+    signals = pd.DataFrame([long_signal("2024-01-02", "D1", 0.99), long_signal("2024-01-02 12:00", "M15", 0.9)])
+
+    report, trade_log, curve = run_portfolio(signals, data_dir=str(tmp_path), max_bars=10, max_per_symbol=1)
+
+    # The D1 position still holds the symbol when the M15 signal arrives at noon
+    assert report["trades"] == 1 and report["skipped"]["max_per_symbol"] == 1
+    assert trade_log["exit_time"].iloc[0] == pd.Timestamp("2024-01-03")
+    # Intraday equity is marked at the D1 close only, so the loss doesn't appear during Jan 2
+    intraday = curve[(curve["time"] > pd.Timestamp("2024-01-02")) & (curve["time"] < pd.Timestamp("2024-01-03"))]
+    assert (intraday["equity"] == 10000).all()
+    assert curve.loc[curve["time"] == pd.Timestamp("2024-01-03"), "equity"].iloc[0] < 10000
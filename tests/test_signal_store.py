@@ -0,0 +1,81 @@
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from historical_generator import current_rows
+from scripts.signal_store import (COLUMNS, append_signals, drop_stale_signals, list_months, migrate_history,
+                                  read_signals, signals_to_frame)
+
+
+def history_signal(time, symbol="EURUSD", tf="D1"):
+    """One signal in the infer_signals / old per-day JSON layout."""
+    trade = {"side": "LONG", "entry": 1.1, "sl": 1.09, "tp1": 1.11, "tp2": 1.12, "confidence": 0.6}
+    return {"symbol": symbol, "tf": tf, "time": time + "Z", "price": 1.1, "atr": 0.005,
+            "signal": {"decision": {"side": "LONG", "status": "ACTIVE", "confidence": 0.6},
+                       "primary": trade, "trend_up": True,
+                       "probabilities": {"short": 0.2, "no": 0.2, "long": 0.6}}}
+
+
+def write_history(history_dir, days):
+    for day in days:
+        os.makedirs(os.path.join(history_dir, day))
+        with open(os.path.join(history_dir, day, "signals.json"), "w", encoding="utf-8") as f:
+            json.dump({"date": day, "signals": [history_signal(f"{day}T00:00:00")]}, f)
+
+
+def store_rows(dates, symbol="EURUSD", tf="H4"):
+    rows = signals_to_frame([history_signal(d, symbol, tf) for d in dates], {f"{symbol}_{tf}": "0123456789abcdef"})
+    rows["confidence"] = np.linspace(0.5, 0.9, len(rows))
+    return rows
+
+
+def test_store_round_trip(tmp_path):
+    store = str(tmp_path)
+    rows = store_rows(["2024-01-31T20:00:00", "2024-02-01T00:00:00", "2024-02-01T04:00:00"])
+    append_signals(store, rows)
+    assert list_months(store) == ["2024-01", "2024-02"]
+
+    back = read_signals(store)
+    assert list(back.columns) == list(COLUMNS)
+    for c, dtype in COLUMNS.items():
+        assert back[c].to_numpy().astype(dtype).tolist() == rows[c].to_numpy().astype(dtype).tolist(), c
+
+    # Filters only open the months they cover; re-appending a key replaces the stored row
+    assert read_signals(store, start="2024-02-01", columns=["date", "confidence"]).shape == (2, 2)
+    append_signals(store, rows.iloc[[0]].assign(confidence=0.25))
+    back = read_signals(store)
+    assert len(back) == 3 and back["confidence"].iloc[0] == np.float32(0.25)
+
+
+def test_store_keeps_long_symbols_and_rejects_longer_ones(tmp_path):
+    store = str(tmp_path)
+    append_signals(store, store_rows(["2024-01-02T00:00:00"], symbol="EURUSD.m"))
+    append_signals(store, store_rows(["2024-01-02T00:00:00"], symbol="EURUSD"))
+    assert sorted(read_signals(store)["symbol"]) == ["EURUSD", "EURUSD.m"]
+    with pytest.raises(ValueError, match="symbol"):
+        append_signals(store, store_rows(["2024-01-02T00:00:00"], symbol="EURUSD.verylong"))
+    assert len(read_signals(store)) == 2
+
+
+def test_migrated_history_survives_an_incremental_run(tmp_path):
+    store = str(tmp_path / "store")
+    write_history(str(tmp_path / "history"), ["2024-01-02", "2024-01-03"])
+    assert migrate_history(str(tmp_path / "history"), store) == 2
+
+    # The next incremental run: the pair's model is at a version the JSON history never recorded
+    versions = {"EURUSD_D1": "0123456789abcdef"}
+    assert current_rows(read_signals(store), versions).all()
+    assert drop_stale_signals(store, "EURUSD", "D1", versions["EURUSD_D1"]) == 0
+    assert len(read_signals(store)) == 2
+
+    # Rows of an older recorded version are still dropped
+    old = read_signals(store).iloc[:1].assign(date=pd.Timestamp("2024-01-04"), model_version="fedcba9876543210")
+    append_signals(store, old)
+    assert not current_rows(read_signals(store), versions)[-1]
+    assert drop_stale_signals(store, "EURUSD", "D1", versions["EURUSD_D1"]) == 1
+    assert read_signals(store)["date"].tolist() == [pd.Timestamp("2024-01-02"), pd.Timestamp("2024-01-03")]
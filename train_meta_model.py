@@ -1,85 +1,151 @@
 
 import argparse
+import contextlib
+import hashlib
+import io
+import json
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import pandas as pd
 import lightgbm as lgb
 import xgboost as xgb
 import joblib
 import os
+import sys
 import numpy as np
 from sklearn.model_selection import TimeSeriesSplit
 from sklearn.metrics import mean_squared_error, mean_absolute_error, r2_score
 
-def train_lgb_model(X_train, y_train, X_val=None, y_val=None):
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from scripts.meta_dataset import load_meta_dataset
+from scripts.meta_model import compile_dir, current_version, feature_names, predict_meta, snapshot_version
+
+LGB_PARAMS = {
+    'objective': 'regression',
+    'learning_rate': 0.03,
+    'num_leaves': 31,
+    'max_depth': 8,
+    'min_child_samples': 20,
+    'subsample': 0.8,
+    'colsample_bytree': 0.8,
+    'reg_alpha': 0.1,
+    'reg_lambda': 0.1,
+    'verbose': -1,
+}
+LGB_DATASET_PARAMS = {'max_bin': 255, 'feature_pre_filter': False, 'verbose': -1}
+
+XGB_PARAMS = {
+    'objective': 'reg:squarederror',
+    'tree_method': 'hist',
+    'learning_rate': 0.03,
+    'max_depth': 6,
+    'min_child_weight': 3,
+    'subsample': 0.8,
+    'colsample_bytree': 0.8,
+    'reg_alpha': 0.1,
+    'reg_lambda': 0.1,
+    'verbosity': 0,
+}
+N_ESTIMATORS = 500
+
+
+class BinnedFeatures:
+    """
+    The feature matrix binned once and shared by every target, CV fold and final fit.
+    LightGBM row subsets are cut from one constructed Dataset without re-binning (the
+    binary is cached in cache_dir, keyed by the matrix contents); XGBoost matrices reuse
+    the cut points of one QuantileDMatrix sketched over all rows.
+    """
+
+    def __init__(self, X: np.ndarray, feature_cols: list, cache_dir: str = None, n_jobs: int = -1):
+        self.X = np.ascontiguousarray(X, dtype=np.float32)
+        self.feature_cols = list(feature_cols)
+        self.n_jobs = n_jobs
+        self._xgb_ref = None
+
+        params = {**LGB_DATASET_PARAMS, 'num_threads': n_jobs}
+        cache_path = None
+        if cache_dir:
+            key = hashlib.sha1(self.X.tobytes())
+            key.update("\n".join(self.feature_cols).encode("utf-8"))
+            key.update(json.dumps(LGB_DATASET_PARAMS, sort_keys=True).encode("utf-8"))
+            cache_path = os.path.join(cache_dir, f"meta_{key.hexdigest()[:16]}.bin")
+
+        if cache_path and os.path.exists(cache_path):
+            self.lgb_base = lgb.Dataset(cache_path, params=params, free_raw_data=False).construct()
+        else:
+            # Labels are per target; the base only needs a placeholder
+            self.lgb_base = lgb.Dataset(self.X, label=np.zeros(len(self.X)), feature_name=self.feature_cols,
+                                        params=params, free_raw_data=False).construct()
+            if cache_path:
+                os.makedirs(cache_dir, exist_ok=True)
+                tmp_path = cache_path + ".tmp"
+                self.lgb_base.save_binary(tmp_path)
+                os.replace(tmp_path, cache_path)
+
+    def lgb_dataset(self, rows, label) -> lgb.Dataset:
+        subset = self.lgb_base.subset(rows).construct()
+        subset.set_label(np.asarray(label, dtype=np.float64))
+        return subset
+
+    def xgb_matrix(self, rows, label, ref=None) -> xgb.QuantileDMatrix:
+        """Quantized rows; `ref` defaults to the all-rows sketch (xgboost wants the train matrix for evals)."""
+        if self._xgb_ref is None:
+            self._xgb_ref = xgb.QuantileDMatrix(self.X, feature_names=self.feature_cols, nthread=self.n_jobs)
+        return xgb.QuantileDMatrix(self.X[rows], label=np.asarray(label), ref=ref or self._xgb_ref,
+                                   feature_names=self.feature_cols, nthread=self.n_jobs)
+
+
+def train_lgb_model(binned, train_rows, y_train, val_rows=None, y_val=None, n_jobs=-1, seed=42):
     """Train LightGBM model з покращеними параметрами"""
-    params = {
-        'random_state': 42,
-        'n_estimators': 500,
-        'learning_rate': 0.03,
-        'num_leaves': 31,
-        'max_depth': 8,
-        'min_child_samples': 20,
-        'subsample': 0.8,
-        'colsample_bytree': 0.8,
-        'reg_alpha': 0.1,
-        'reg_lambda': 0.1,
-        'verbose': -1,
-    }
+    params = {**LGB_PARAMS, 'seed': seed, 'num_threads': n_jobs}
+    train_set = binned.lgb_dataset(train_rows, y_train)
 
-    if X_val is not None and y_val is not None:
-        model = lgb.LGBMRegressor(**params)
-        model.fit(
-            X_train, y_train,
-            eval_set=[(X_val, y_val)],
+    if val_rows is not None and y_val is not None:
+        model = lgb.train(
+            params, train_set, num_boost_round=N_ESTIMATORS,
+            valid_sets=[binned.lgb_dataset(val_rows, y_val)],
             callbacks=[lgb.early_stopping(stopping_rounds=50, verbose=False)]
         )
+        # Drop the rounds after the best one, so continued training starts from the model that predicts
+        model = lgb.Booster(model_str=model.model_to_string(num_iteration=model.best_iteration))
     else:
-        model = lgb.LGBMRegressor(**params)
-        model.fit(X_train, y_train)
+        model = lgb.train(params, train_set, num_boost_round=N_ESTIMATORS)
 
     return model
 
 
-def train_xgb_model(X_train, y_train, X_val=None, y_val=None):
+def train_xgb_model(binned, train_rows, y_train, val_rows=None, y_val=None, n_jobs=-1, seed=42):
     """Train XGBoost model для ensemble"""
-    params = {
-        'random_state': 42,
-        'n_estimators': 500,
-        'learning_rate': 0.03,
-        'max_depth': 6,
-        'min_child_weight': 3,
-        'subsample': 0.8,
-        'colsample_bytree': 0.8,
-        'reg_alpha': 0.1,
-        'reg_lambda': 0.1,
-        'verbosity': 0,
-    }
-
-    if X_val is not None and y_val is not None:
-        model = xgb.XGBRegressor(**params)
-        model.fit(
-            X_train, y_train,
-            eval_set=[(X_val, y_val)],
-            early_stopping_rounds=50,
-            verbose=False
+    params = {**XGB_PARAMS, 'seed': seed, 'nthread': n_jobs}
+    dtrain = binned.xgb_matrix(train_rows, y_train)
+
+    if val_rows is not None and y_val is not None:
+        model = xgb.train(
+            params, dtrain, num_boost_round=N_ESTIMATORS,
+            evals=[(binned.xgb_matrix(val_rows, y_val, ref=dtrain), 'val')],
+            early_stopping_rounds=50, verbose_eval=False
         )
+        # Keep only the trees up to the best round, as the sklearn wrapper used to predict with
+        model = model[:model.best_iteration + 1]
     else:
-        model = xgb.XGBRegressor(**params)
-        model.fit(X_train, y_train)
+        model = xgb.train(params, dtrain, num_boost_round=N_ESTIMATORS)
 
     return model
 
 
-def create_ensemble_model(X_train, y_train, X_val, y_val):
+def create_ensemble_model(binned, train_rows, y_train, val_rows, y_val, n_jobs=-1, seed=42):
     """Створює ensemble з LightGBM та XGBoost"""
     print("[INFO] Training LightGBM model...")
-    lgb_model = train_lgb_model(X_train, y_train, X_val, y_val)
+    lgb_model = train_lgb_model(binned, train_rows, y_train, val_rows, y_val, n_jobs, seed)
 
     print("[INFO] Training XGBoost model...")
-    xgb_model = train_xgb_model(X_train, y_train, X_val, y_val)
+    xgb_model = train_xgb_model(binned, train_rows, y_train, val_rows, y_val, n_jobs, seed)
 
     # Evaluate both models
-    lgb_pred = lgb_model.predict(X_val)
-    xgb_pred = xgb_model.predict(X_val)
+    lgb_pred = predict_meta(lgb_model, binned.X[val_rows])
+    xgb_pred = predict_meta(xgb_model, binned.X[val_rows])
 
     lgb_mse = mean_squared_error(y_val, lgb_pred)
     xgb_mse = mean_squared_error(y_val, xgb_pred)
@@ -100,16 +166,338 @@ def create_ensemble_model(X_train, y_train, X_val, y_val):
     }
 
 
+def train_target(binned, target, outdir, ensemble=False, n_jobs=-1, seed=42):
+    """
+    Trains, evaluates and saves the meta-model for one *_target column (`target`, aligned
+    with the rows of `binned`). Returns a report row (None if the target was skipped).
+    """
+    started = time.time()
+    currency = target.name.replace('_target', '')
+    print(f"\n{'='*60}\n--- Training Meta-Model for: {currency} ---\n{'='*60}")
+
+    # Rows of the shared binned matrix where this target is known
+    rows = np.flatnonzero(target.notna().to_numpy())
+
+    if len(rows) < 100:
+        print(f"Skipping {currency} due to insufficient data (less than 100 samples).")
+        return None
+
+    y = target.to_numpy(dtype=np.float64)[rows]
+
+    # Time-series split for validation
+    split_idx = int(len(rows) * 0.8)
+    train_rows, val_rows = rows[:split_idx], rows[split_idx:]
+    y_train, y_val = y[:split_idx], y[split_idx:]
+
+    print(f"Training samples: {len(train_rows)}, Validation samples: {len(val_rows)}")
+
+    if ensemble:
+        # Train ensemble model
+        model = create_ensemble_model(binned, train_rows, y_train, val_rows, y_val, n_jobs, seed)
+        label = "Ensemble - "
+    else:
+        # Train single LightGBM model
+        model = train_lgb_model(binned, train_rows, y_train, val_rows, y_val, n_jobs, seed)
+        label = ""
+    y_pred = predict_meta(model, binned.X[val_rows])
+
+    mse = mean_squared_error(y_val, y_pred)
+    mae = mean_absolute_error(y_val, y_pred)
+    r2 = r2_score(y_val, y_pred)
+
+    print(f"[EVAL] {label}MSE: {mse:.6f}, MAE: {mae:.6f}, R2: {r2:.4f}")
+
+    if not ensemble:
+        # Feature importance
+        feature_importance = pd.DataFrame({
+            'feature': binned.feature_cols,
+            'importance': model.feature_importance()
+        }).sort_values('importance', ascending=False)
+
+        print(f"\n[INFO] Top 10 important features:")
+        print(feature_importance.head(10).to_string(index=False))
+
+    # Save model
+    model_path = os.path.join(outdir, f"meta_model_{currency}.joblib")
+    joblib.dump(model, model_path)
+    print(f"[OK] Saved trained model to {model_path}")
+
+    report = {
+        'currency': currency, 'train_samples': len(train_rows), 'val_samples': len(val_rows),
+        'mse': mse, 'mae': mae, 'r2': r2, 'model_path': model_path,
+        'trained_until': str(target.index[train_rows[-1]]),
+    }
+
+    report['seconds'] = time.time() - started
+    return report
+
+
+def continue_model(model, binned, train_rows, y_train, rounds, n_jobs=-1, seed=42):
+    """Adds `rounds` boosting rounds on train_rows to a fitted booster (or to both ensemble members)."""
+    if isinstance(model, dict):
+        return {**model,
+                'lgb_model': continue_model(model['lgb_model'], binned, train_rows, y_train, rounds, n_jobs, seed),
+                'xgb_model': continue_model(model['xgb_model'], binned, train_rows, y_train, rounds, n_jobs, seed)}
+    if isinstance(model, lgb.Booster):
+        # init_model scores the raw rows, which subsets of the cached binary don't keep
+        train_set = lgb.Dataset(binned.X[train_rows], label=y_train, reference=binned.lgb_base,
+                                feature_name=binned.feature_cols, params={**LGB_DATASET_PARAMS, 'num_threads': n_jobs},
+                                free_raw_data=False)
+        return lgb.train({**LGB_PARAMS, 'seed': seed, 'num_threads': n_jobs}, train_set,
+                         num_boost_round=rounds, init_model=model)
+    if isinstance(model, xgb.Booster):
+        return xgb.train({**XGB_PARAMS, 'seed': seed, 'nthread': n_jobs}, binned.xgb_matrix(train_rows, y_train),
+                         num_boost_round=rounds, xgb_model=model)
+    raise TypeError(f"Cannot continue training a {type(model).__name__}; run a full retrain first")
+
+
+def update_target(target, outdir, previous, holdout_rows=60, window=500, rounds=50, tolerance=0.0,
+                  retrain=False, ensemble=False, n_jobs=-1, seed=42):
+    """
+    Continues the saved meta-model for one *_target column on the rows that arrived since
+    it was trained (padded to `window` recent rows), leaving the newest `holdout_rows` out.
+    The update is kept only if its holdout MSE is within `tolerance` of the old model's;
+    with `retrain` a from-scratch fit on the same rows also competes and the best one wins.
+    `previous` is the target's entry in the current version manifest.
+    """
+    started = time.time()
+    currency = target.name.replace('_target', '')
+    model_path = os.path.join(outdir, f"meta_model_{currency}.joblib")
+    model = joblib.load(model_path)
+    if isinstance(model, dict) != bool(ensemble):
+        raise ValueError(f"{model_path} is {'an ensemble' if isinstance(model, dict) else 'a LightGBM model'}; "
+                         f"{'drop' if ensemble else 'pass'} --ensemble to update it.")
+    binned = binned_for(feature_names(model))
+
+    rows = np.flatnonzero(target.notna().to_numpy())
+    y = target.to_numpy(dtype=np.float64)
+    fit_rows, holdout = rows[:-holdout_rows], rows[-holdout_rows:]
+    dates = target.index[fit_rows]
+    n_new = int((dates > pd.Timestamp(previous['trained_until'])).sum())
+    report = {'currency': currency, 'train_samples': 0, 'val_samples': len(holdout), 'model_path': model_path,
+              'trained_until': previous['trained_until']}
+
+    X_hold, y_hold = binned.X[holdout], y[holdout]
+    report['mse_before'] = report['mse'] = mean_squared_error(y_hold, predict_meta(model, X_hold))
+    candidates, trained_until = {}, {}
+    if n_new:
+        train_rows = fit_rows[-max(window, n_new):]
+        candidates['updated'] = continue_model(model, binned, train_rows, y[train_rows], rounds, n_jobs, seed)
+        report['train_samples'] = len(train_rows)
+        trained_until['updated'] = str(dates[-1])
+    if retrain:
+        split_idx = int(len(fit_rows) * 0.8)
+        train_rows, val_rows = fit_rows[:split_idx], fit_rows[split_idx:]
+        fit = create_ensemble_model if ensemble else train_lgb_model
+        with contextlib.redirect_stdout(io.StringIO()):
+            candidates['retrained'] = fit(binned, train_rows, y[train_rows], val_rows, y[val_rows], n_jobs, seed)
+        trained_until['retrained'] = str(dates[split_idx - 1])
+
+    status = 'unchanged'
+    for name, candidate in candidates.items():
+        mse = report[f'mse_{name}'] = mean_squared_error(y_hold, predict_meta(candidate, X_hold))
+        # An update may cost up to `tolerance` of holdout error; a retrain has to beat what is kept
+        if name == 'updated' and mse > report['mse_before'] * (1 + tolerance):
+            status = 'rejected'
+        elif name == 'updated' or mse < report['mse']:
+            model, status, report['mse'] = candidate, name, mse
+
+    if status in ('updated', 'retrained'):
+        joblib.dump(model, model_path)
+        report['trained_until'] = trained_until[status]
+    report['status'] = status
+    print(f"[UPDATE] {currency}: {n_new} new rows, holdout MSE {report['mse_before']:.6f} -> "
+          f"{report['mse']:.6f} ({status})")
+    report['seconds'] = time.time() - started
+    return report
+
+
+def cv_splits(target, cv_folds, purge_gap=1):
+    """
+    (fold, train_rows, val_rows) for TimeSeriesSplit over the rows where `target` is known,
+    with `purge_gap` rows dropped between train and validation so labels whose horizon
+    reaches into the validation period never train the fold.
+    """
+    rows = np.flatnonzero(target.notna().to_numpy())
+    if len(rows) < 100:
+        return []
+    tscv = TimeSeriesSplit(n_splits=cv_folds, gap=purge_gap)
+    return [(fold, rows[train_idx], rows[val_idx]) for fold, (train_idx, val_idx) in enumerate(tscv.split(rows), 1)]
+
+
+def cv_fold(binned, target, fold, train_rows, val_rows, ensemble=False, n_jobs=-1, seed=42):
+    """
+    Fits one CV fold and scores it on its validation rows. In ensemble mode both members
+    are scored and blended with inverse-MSE weights, as create_ensemble_model does.
+    """
+    started = time.time()
+    y = target.to_numpy(dtype=np.float64)
+    y_train, y_val = y[train_rows], y[val_rows]
+    X_val = binned.X[val_rows]
+
+    lgb_pred = predict_meta(train_lgb_model(binned, train_rows, y_train, n_jobs=n_jobs, seed=seed), X_val)
+    result = {'currency': target.name.replace('_target', ''), 'fold': fold,
+              'train_samples': len(train_rows), 'val_samples': len(val_rows),
+              'lgb_mse': mean_squared_error(y_val, lgb_pred)}
+    if ensemble:
+        xgb_pred = predict_meta(train_xgb_model(binned, train_rows, y_train, n_jobs=n_jobs, seed=seed), X_val)
+        result['xgb_mse'] = mean_squared_error(y_val, xgb_pred)
+        lgb_weight = (1 / result['lgb_mse']) / ((1 / result['lgb_mse']) + (1 / result['xgb_mse']))
+        result['mse'] = mean_squared_error(y_val, lgb_weight * lgb_pred + (1 - lgb_weight) * xgb_pred)
+    else:
+        result['mse'] = result['lgb_mse']
+    result['seconds'] = time.time() - started
+    return result
+
+
+def importance_fold(binned, target, fold, train_rows, val_rows, n_jobs=-1, seed=42):
+    """Normalized LightGBM gain importance of every feature, fitted on one CV fold."""
+    y = target.to_numpy(dtype=np.float64)
+    model = train_lgb_model(binned, train_rows, y[train_rows], val_rows, y[val_rows], n_jobs, seed)
+    gain = model.feature_importance(importance_type='gain')
+    return {'currency': target.name.replace('_target', ''), 'fold': fold,
+            'gain': gain / gain.sum() if gain.sum() > 0 else gain}
+
+
+def select_features(gains, feature_cols, coverage=0.95, min_features=8):
+    """
+    Smallest set of features whose mean normalized gain reaches `coverage` of the total
+    (at least min_features), returned in dataset column order.
+    """
+    mean_gain = np.mean(gains, axis=0)
+    order = np.argsort(-mean_gain, kind='stable')
+    keep = int(np.searchsorted(np.cumsum(mean_gain[order]), coverage * mean_gain.sum())) + 1
+    keep = min(len(feature_cols), max(keep, min_features))
+    chosen = set(order[:keep].tolist())
+    return [col for i, col in enumerate(feature_cols) if i in chosen]
+
+
+# Per-process training state: the dataset, and one BinnedFeatures per feature schema
+_state = {}
+
+def init_state(df, cache_dir, n_jobs):
+    _state.update(df=df, cache_dir=cache_dir, n_jobs=n_jobs, binned={})
+
+
+def init_worker(dataset_path, cache_dir, n_jobs):
+    """Loads the dataset once per worker process instead of once per task."""
+    init_state(load_meta_dataset(dataset_path), cache_dir, n_jobs)
+
+
+def binned_for(feature_cols):
+    """BinnedFeatures for a feature schema, built (or loaded from the cache) once per process."""
+    key = tuple(feature_cols)
+    if key not in _state['binned']:
+        X = _state['df'][list(feature_cols)].to_numpy(dtype=np.float32)
+        _state['binned'][key] = BinnedFeatures(X, feature_cols, _state['cache_dir'], _state['n_jobs'])
+    return _state['binned'][key]
+
+
+def fit_task(target_col, feature_cols, outdir, ensemble, n_jobs, seed):
+    """train_target as a task; its log is returned so parallel targets don't interleave."""
+    log = io.StringIO()
+    with contextlib.redirect_stdout(log):
+        report = train_target(binned_for(feature_cols), _state['df'][target_col], outdir, ensemble, n_jobs, seed)
+    if report is not None:
+        report['features'] = len(feature_cols)
+    return 'fit', report, log.getvalue()
+
+
+def update_task(target_col, outdir, previous, holdout_rows, window, rounds, tolerance, retrain, ensemble,
+                n_jobs, seed):
+    log = io.StringIO()
+    with contextlib.redirect_stdout(log):
+        report = update_target(_state['df'][target_col], outdir, previous, holdout_rows, window, rounds,
+                               tolerance, retrain, ensemble, n_jobs, seed)
+    return 'fit', report, log.getvalue()
+
+
+def cv_task(target_col, feature_cols, fold, train_rows, val_rows, ensemble, n_jobs, seed):
+    return 'cv', cv_fold(binned_for(feature_cols), _state['df'][target_col], fold, train_rows, val_rows,
+                         ensemble, n_jobs, seed), ""
+
+
+def importance_task(target_col, feature_cols, fold, train_rows, val_rows, n_jobs, seed):
+    return 'importance', importance_fold(binned_for(feature_cols), _state['df'][target_col], fold,
+                                         train_rows, val_rows, n_jobs, seed), ""
+
+
+def run_tasks(pool, tasks):
+    """Yields the results of (function, args) tasks, from the pool if there is one."""
+    if pool is None:
+        for fn, fn_args in tasks:
+            yield fn(*fn_args)
+        return
+    for future in as_completed([pool.submit(fn, *fn_args) for fn, fn_args in tasks]):
+        yield future.result()
+
+
+def print_report(reports, folds, wall_seconds, path):
+    """
+    Prints one table with every target's evaluation (plus per-fold CV results, if any)
+    and saves it as JSON next to the models.
+    """
+    rows = [r for r in reports if r is not None]
+    if not rows:
+        return
+    table = pd.DataFrame(rows).set_index('currency').sort_index()
+    if folds:
+        fold_table = pd.DataFrame(folds).sort_values(['currency', 'fold'])
+        print(f"\n{'='*60}\n--- Time-Series CV Folds ---\n{'='*60}")
+        print(fold_table.to_string(index=False, float_format=lambda v: f"{v:.6f}"))
+        cv = fold_table.groupby('currency')['mse'].agg(['mean', 'std'])
+        table['cv_mse'] = cv['mean']
+        table['cv_mse_std'] = cv['std']
+    cols = [c for c in ['status', 'features', 'train_samples', 'val_samples', 'mse_before', 'mse', 'mae', 'r2',
+                        'cv_mse', 'seconds'] if c in table]
+    print(f"\n{'='*60}\n--- Meta-Model Evaluation Report ---\n{'='*60}")
+    print(table[cols].to_string(float_format=lambda v: f"{v:.6f}"))
+    task_seconds = table['seconds'].sum() + sum(f['seconds'] for f in folds)
+    print(f"\nWall time: {wall_seconds:.1f}s (sum of tasks: {task_seconds:.1f}s)")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'wall_seconds': wall_seconds, 'targets': table.reset_index().to_dict(orient='records'),
+                   'folds': folds}, f, ensure_ascii=False, indent=2, default=float)
+    print(f"[OK] Report saved to {path}")
+
+
 def main():
     parser = argparse.ArgumentParser(description="Train a meta-model on the generated dataset.")
-    parser.add_argument("--dataset", default="meta_dataset.csv", help="Path to the input dataset CSV file.")
+    parser.add_argument("--dataset", default="meta_dataset.csv", help="Path to the input dataset (.csv or columnar .npz).")
     parser.add_argument("--outdir", default="models", help="Directory to save the trained meta-models.")
-    parser.add_argument("--ensemble", action="store_true", help="Train ensemble of LightGBM + XGBoost")
+    parser.add_argument("--ensemble", action="store_true", default=None,
+                        help="Train ensemble of LightGBM + XGBoost (--update takes it from the current version)")
     parser.add_argument("--cv-folds", type=int, default=0, help="Number of time-series CV folds (0 to disable)")
+    parser.add_argument("--purge-gap", type=int, default=1,
+                        help="Rows dropped between CV train and validation (>= label horizon in rows).")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Worker processes; each currency fit and each CV fold is one task.")
+    parser.add_argument("--threads", type=int, default=0,
+                        help="Total thread budget split between workers (default: CPU count).")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed for every model.")
+    parser.add_argument("--prune", choices=["none", "global", "per-currency"], default="none",
+                        help="Keep only the features that carry most of the gain importance.")
+    parser.add_argument("--prune-folds", type=int, default=3, help="CV folds used to rank features for --prune.")
+    parser.add_argument("--prune-coverage", type=float, default=0.95,
+                        help="Share of total gain importance the kept features must cover.")
+    parser.add_argument("--min-features", type=int, default=8, help="Never prune below this many features.")
+    parser.add_argument("--cache-dir", default="outputs/meta_cache",
+                        help="Where the binned LightGBM dataset is cached between runs ('' to disable).")
+    parser.add_argument("--update", action="store_true",
+                        help="Continue the current meta-models on new rows instead of retraining from scratch.")
+    parser.add_argument("--update-rounds", type=int, default=50, help="Boosting rounds added by --update.")
+    parser.add_argument("--update-window", type=int, default=500,
+                        help="Recent rows --update trains on (at least every row added since the last run).")
+    parser.add_argument("--holdout-rows", type=int, default=60,
+                        help="Newest rows --update keeps out of training to accept or reject the update.")
+    parser.add_argument("--tolerance", type=float, default=0.0,
+                        help="Relative holdout MSE increase an update may cause and still be kept.")
+    parser.add_argument("--full-every", type=int, default=7,
+                        help="Every N-th --update also retrains from scratch and keeps the better model (0 to disable).")
+    parser.add_argument("--keep-versions", type=int, default=10, help="Model versions kept for rollback.")
     args = parser.parse_args()
 
     print(f"Loading dataset from {args.dataset}...")
-    df = pd.read_csv(args.dataset, index_col='date', parse_dates=True)
+    df = load_meta_dataset(args.dataset)
 
     # Identify feature and target columns
     feature_cols = [col for col in df.columns if not '_target' in col]
@@ -121,95 +509,140 @@ def main():
     print(f"Found {len(feature_cols)} features and {len(target_cols)} targets.")
 
     os.makedirs(args.outdir, exist_ok=True)
-
-    # Train a separate model for each target currency
-    for target_col in target_cols:
-        currency = target_col.replace('_target', '')
-        print(f"\n{'='*60}\n--- Training Meta-Model for: {currency} ---\n{'='*60}")
-
-        # Create a clean dataset for this target, dropping rows where the target is NaN
-        train_df = df[[*feature_cols, target_col]].dropna(subset=[target_col])
-
-        if len(train_df) < 100:
-            print(f"Skipping {currency} due to insufficient data (less than 100 samples).")
-            continue
-
-        X = train_df[feature_cols]
-        y = train_df[target_col]
-
-        # Time-series split for validation
-        split_idx = int(len(X) * 0.8)
-        X_train, X_val = X.iloc[:split_idx], X.iloc[split_idx:]
-        y_train, y_val = y.iloc[:split_idx], y.iloc[split_idx:]
-
-        print(f"Training samples: {len(X_train)}, Validation samples: {len(X_val)}")
-
-        if args.ensemble:
-            # Train ensemble model
-            ensemble = create_ensemble_model(X_train, y_train, X_val, y_val)
-
-            # Evaluate ensemble
-            lgb_pred = ensemble['lgb_model'].predict(X_val)
-            xgb_pred = ensemble['xgb_model'].predict(X_val)
-            ensemble_pred = (ensemble['lgb_weight'] * lgb_pred + ensemble['xgb_weight'] * xgb_pred)
-
-            mse = mean_squared_error(y_val, ensemble_pred)
-            mae = mean_absolute_error(y_val, ensemble_pred)
-            r2 = r2_score(y_val, ensemble_pred)
-
-            print(f"[EVAL] Ensemble - MSE: {mse:.6f}, MAE: {mae:.6f}, R2: {r2:.4f}")
-
-            # Save ensemble
-            model_path = os.path.join(args.outdir, f"meta_model_{currency}.joblib")
-            joblib.dump(ensemble, model_path)
-
-        else:
-            # Train single LightGBM model
-            model = train_lgb_model(X_train, y_train, X_val, y_val)
-
-            # Evaluate
-            y_pred = model.predict(X_val)
-            mse = mean_squared_error(y_val, y_pred)
-            mae = mean_absolute_error(y_val, y_pred)
-            r2 = r2_score(y_val, y_pred)
-
-            print(f"[EVAL] MSE: {mse:.6f}, MAE: {mae:.6f}, R2: {r2:.4f}")
-
-            # Feature importance
-            feature_importance = pd.DataFrame({
-                'feature': feature_cols,
-                'importance': model.feature_importances_
-            }).sort_values('importance', ascending=False)
-
-            print(f"\n[INFO] Top 10 important features:")
-            print(feature_importance.head(10).to_string(index=False))
-
-            # Save model
-            model_path = os.path.join(args.outdir, f"meta_model_{currency}.joblib")
-            joblib.dump(model, model_path)
-
-        print(f"[OK] Saved trained model to {model_path}")
-
-        # Time-series cross-validation if requested
+    if args.update:
+        update(df, target_cols, args)
+        return
+
+    # Explicit per-model threads, so workers x threads never oversubscribes the cores
+    n_tasks = len(target_cols) * (1 + max(args.cv_folds, args.prune_folds if args.prune != 'none' else 0))
+    workers = max(1, min(args.workers, n_tasks))
+    n_jobs = max(1, (args.threads or os.cpu_count() or 1) // workers)
+    started = time.time()
+    reports, folds = [], []
+
+    init_state(df, args.cache_dir, n_jobs)
+    if args.cache_dir:
+        # Binned once here; workers load the cached binary instead of re-binning
+        binned_for(feature_cols)
+
+    pool = None
+    if workers > 1:
+        print(f"[INFO] Running up to {n_tasks} tasks on {workers} workers x {n_jobs} threads...")
+        # spawn: LightGBM/XGBoost OpenMP pools are not fork-safe
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=init_worker, initargs=(args.dataset, args.cache_dir, n_jobs))
+    try:
+        schemas = {target_col: feature_cols for target_col in target_cols}
+        if args.prune != 'none':
+            # Gain importance on every (target, fold) in parallel, then a compact schema
+            print(f"\n[INFO] Ranking features by gain over {args.prune_folds} folds per target...")
+            gains = {}
+            tasks = [(importance_task, (target_col, feature_cols, *split, n_jobs, args.seed))
+                     for target_col in target_cols
+                     for split in cv_splits(df[target_col], args.prune_folds, args.purge_gap)]
+            for _, result, _ in run_tasks(pool, tasks):
+                gains.setdefault(result['currency'], []).append(result['gain'])
+            for target_col in target_cols:
+                currency = target_col.replace('_target', '')
+                if args.prune == 'global':
+                    currency_gains = [g for fold_gains in gains.values() for g in fold_gains]
+                else:
+                    currency_gains = gains.get(currency)
+                if currency_gains:
+                    schemas[target_col] = select_features(currency_gains, feature_cols,
+                                                          args.prune_coverage, args.min_features)
+                print(f"[PRUNE] {currency}: {len(schemas[target_col])}/{len(feature_cols)} features")
+            if args.cache_dir:
+                for schema in {tuple(cols) for cols in schemas.values()}:
+                    binned_for(list(schema))
+
+        # Every final fit and every CV fold is an independent task
+        tasks = [(fit_task, (target_col, schemas[target_col], args.outdir, args.ensemble, n_jobs, args.seed))
+                 for target_col in target_cols]
         if args.cv_folds > 0:
-            print(f"\n[INFO] Running {args.cv_folds}-fold time-series cross-validation...")
-            tscv = TimeSeriesSplit(n_splits=args.cv_folds)
-            cv_scores = []
-
-            for fold, (train_idx, val_idx) in enumerate(tscv.split(X), 1):
-                X_cv_train, X_cv_val = X.iloc[train_idx], X.iloc[val_idx]
-                y_cv_train, y_cv_val = y.iloc[train_idx], y.iloc[val_idx]
-
-                cv_model = train_lgb_model(X_cv_train, y_cv_train)
-                cv_pred = cv_model.predict(X_cv_val)
-                cv_mse = mean_squared_error(y_cv_val, cv_pred)
-                cv_scores.append(cv_mse)
-
-                print(f"  Fold {fold}: MSE = {cv_mse:.6f}")
+            tasks += [(cv_task, (target_col, schemas[target_col], *split, args.ensemble, n_jobs, args.seed))
+                      for target_col in target_cols
+                      for split in cv_splits(df[target_col], args.cv_folds, args.purge_gap)]
+
+        for kind, result, log in run_tasks(pool, tasks):
+            print(log, end="")
+            if kind == 'fit':
+                reports.append(result)
+            else:
+                folds.append(result)
+                print(f"[CV] {result['currency']} fold {result['fold']}: MSE = {result['mse']:.6f} "
+                      f"({result['seconds']:.1f}s)")
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    # The feature schema each model was fitted on (also stored in the boosters themselves)
+    schema_path = os.path.join(args.outdir, "meta_feature_schema.json")
+    with open(schema_path, 'w', encoding='utf-8') as f:
+        json.dump({'prune': args.prune, 'coverage': args.prune_coverage,
+                   'features': {r['currency']: schemas[f"{r['currency']}_target"] for r in reports if r}},
+                  f, ensure_ascii=False, indent=2)
+
+    print_report(reports, folds, time.time() - started, os.path.join(args.outdir, "meta_training_report.json"))
+
+    if any(reports):
+        compiled_path = compile_dir(args.outdir)
+        print(f"[OK] Compiled meta-models for inference saved to {compiled_path}")
+        version = snapshot_version(args.outdir, {'mode': 'full', 'updates_since_full': 0,
+                                                 'ensemble': bool(args.ensemble),
+                                                 'targets': version_targets(reports)}, args.keep_versions)
+        print(f"[OK] Recorded meta-model version {version}")
+    print("\n[DONE] All meta-models have been trained and saved.")
 
-            print(f"[CV] Average MSE: {np.mean(cv_scores):.6f} ± {np.std(cv_scores):.6f}")
 
-    print("\n[DONE] All meta-models have been trained and saved.")
+def version_targets(reports):
+    return {r['currency']: {'trained_until': r['trained_until'], 'holdout_mse': r['mse']} for r in reports if r}
+
+
+def update(df, target_cols, args):
+    """--update: continues every current meta-model on the new rows, then records a version."""
+    current = current_version(args.outdir)
+    if current is None:
+        raise ValueError(f"No recorded meta-model version in {args.outdir}; run a full training first.")
+    # The architecture is the current version's; versions recorded before it was stored take the flag
+    ensemble = current.get('ensemble')
+    if ensemble is None:
+        ensemble = bool(args.ensemble)
+    elif args.ensemble and not ensemble:
+        raise ValueError(f"Version {current['version']} holds LightGBM meta-models; "
+                         f"--ensemble would continue them as LightGBM + XGBoost ensembles.")
+    retrain = args.full_every > 0 and current.get('updates_since_full', 0) + 1 >= args.full_every
+    print(f"[INFO] Updating version {current['version']}"
+          f"{' (scheduled from-scratch comparison)' if retrain else ''}...")
+
+    started = time.time()
+    n_jobs = args.threads or os.cpu_count() or 1
+    init_state(df, args.cache_dir, n_jobs)
+    tasks = [(update_task, (target_col, args.outdir, current['targets'][target_col.replace('_target', '')],
+                            args.holdout_rows, args.update_window, args.update_rounds, args.tolerance,
+                            retrain, ensemble, n_jobs, args.seed))
+             for target_col in target_cols if target_col.replace('_target', '') in current['targets']]
+    reports = []
+    for _, report, log in run_tasks(None, tasks):
+        print(log, end="")
+        reports.append(report)
+    print_report(reports, [], time.time() - started, os.path.join(args.outdir, "meta_training_report.json"))
+
+    changed = any(r['status'] in ('updated', 'retrained') for r in reports)
+    if not changed and not retrain:
+        print("\n[DONE] No meta-model changed; keeping version " + current['version'])
+        return
+    if changed:
+        compiled_path = compile_dir(args.outdir)
+        print(f"[OK] Compiled meta-models for inference saved to {compiled_path}")
+    # A scheduled comparison resets the count whichever model won it, so it is recorded
+    # even when every current model was kept
+    manifest = {'mode': 'update', 'updates_since_full': 0 if retrain else current.get('updates_since_full', 0) + 1,
+                'ensemble': ensemble,
+                'targets': {**current['targets'], **version_targets(reports)}}
+    version = snapshot_version(args.outdir, manifest, args.keep_versions)
+    print(f"[OK] Recorded meta-model version {version} "
+          f"(roll back with: python -m scripts.meta_model --rollback {args.outdir})")
 
 if __name__ == "__main__":
     main()
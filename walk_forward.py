@@ -0,0 +1,314 @@
+"""
+Walk-forward backtest of the base models.
+History is carved into rolling folds: every fold trains a model (or warm-starts the previous
+fold's) on the train_days before its test window and scores each bar of the test_days
+window out of sample, so test_days is the retraining cadence being measured. The
+out-of-sample signals go straight into the OHLC trade simulator of evaluate_backtest.
+Features are cached per data file and fold models per fold configuration, so re-running
+an unchanged fold reuses its model.
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+import tensorflow as tf
+import yaml
+from numpy.lib.stride_tricks import sliding_window_view
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from evaluate_backtest import SAME_BAR_RULES, simulate_trades, sweep_metrics
+from historical_generator import init_worker, signals_frame
+from scripts.signal_store import append_signals
+from scripts.train_lstm import fit_model, set_global_seed
+from scripts.utils import make_features, make_targets, TF_MINUTES
+
+FEATURE_CACHE_VERSION = 1
+MIN_TRAIN_ROWS = 200
+
+
+def load_cfg(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return yaml.safe_load(f)
+
+
+def _digest(*parts) -> str:
+    h = hashlib.sha1()
+    for part in parts:
+        h.update(part if isinstance(part, bytes) else json.dumps(part, sort_keys=True, default=str).encode("utf-8"))
+    return h.hexdigest()[:16]
+
+
+def load_pair(symbol, tf_name, tf_cfg, data_dir, cache_dir):
+    """
+    Features and targets of data/{symbol}_{tf}.csv as arrays (None if there is no data),
+    computed once per version of the file and target settings and cached as .npz.
+    """
+    path = os.path.join(data_dir, f"{symbol}_{tf_name}.csv")
+    if not os.path.exists(path):
+        return None
+    st = os.stat(path)
+    key = _digest([FEATURE_CACHE_VERSION, st.st_size, st.st_mtime_ns, tf_cfg["horizon"], tf_cfg["atr_mult"]])
+    cache_path = os.path.join(cache_dir, "features", f"{symbol}_{tf_name}_{key}.npz")
+    if os.path.exists(cache_path):
+        with np.load(cache_path) as npz:
+            return {k: npz[k] for k in npz.files}
+
+    df = make_targets(make_features(pd.read_csv(path, parse_dates=["time"])),
+                      horizon=tf_cfg["horizon"], atr_mult=tf_cfg["atr_mult"])
+    # Same feature columns as make_dataset
+    features = [c for c in df.columns if c not in ["time", "y"]]
+    pair = {
+        "time": df["time"].to_numpy(dtype="datetime64[ns]"),
+        "values": df[features].to_numpy(dtype=np.float32),
+        "features": np.array(features),
+        "y": df["y"].to_numpy(dtype=np.int8),
+        "close": df["Close"].to_numpy(dtype=np.float64),
+        "atr": df["ATR14"].to_numpy(dtype=np.float64),
+        "trend_up": df["TrendUp"].to_numpy(dtype=np.int8),
+    }
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    tmp_path = cache_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(f, **pair)
+    os.replace(tmp_path, cache_path)
+    return pair
+
+
+def make_folds(end, n_folds, train_days, test_days, anchored=False, start=None):
+    """
+    Consecutive test windows of test_days ending at `end`, oldest first, each with the
+    train_days before it as training period (everything since `start` if anchored).
+    """
+    end = np.datetime64(pd.Timestamp(end), "ns")
+    test = np.timedelta64(int(test_days * 86400), "s")
+    train = np.timedelta64(int(train_days * 86400), "s")
+    folds = []
+    for k in range(n_folds):
+        test_end = end - (n_folds - 1 - k) * test
+        test_start = test_end - test
+        train_start = np.datetime64(pd.Timestamp(start), "ns") if anchored else test_start - train
+        folds.append({"fold": k + 1, "train_start": train_start, "test_start": test_start, "test_end": test_end})
+    return folds
+
+
+def fold_rows(pair, fold, seq_len, horizon):
+    """
+    Label rows of the training period and window ends of the test period. A training window
+    is the seq_len bars before its label row (as make_dataset); rows whose label horizon
+    reaches into the test window are purged.
+    """
+    times = pair["time"]
+    first_test = np.searchsorted(times, fold["test_start"], side="left")
+    last_test = np.searchsorted(times, fold["test_end"], side="left")
+    # The final bar of the data can still be forming, so it is never scored
+    ends = np.arange(max(first_test, seq_len - 1), min(last_test, len(times) - 1))
+    train_from = max(np.searchsorted(times, fold["train_start"], side="left"), seq_len)
+    labels = np.arange(train_from, max(train_from, first_test - horizon))
+    return labels, ends
+
+
+def _load_model(path):
+    # The attention model holds a Lambda layer; these are our own training artifacts
+    return tf.keras.models.load_model(path, compile=False, safe_mode=False)
+
+
+def run_folds(symbol, tf_name, tf_cfg, prob_th, folds, settings):
+    """
+    Trains (or reuses) and scores the given folds of one pair in order, warm-starting each
+    from the previous one if settings['warm_start']. Safe to run in a worker process.
+    Returns (symbol, tf, fold results, out-of-sample signals frame).
+    """
+    pair = load_pair(symbol, tf_name, tf_cfg, settings["data_dir"], settings["cache_dir"])
+    seq_len, horizon = tf_cfg["seq_len"], tf_cfg["horizon"]
+    windows = sliding_window_view(pair["values"], seq_len, axis=0)  # (bars - seq_len + 1, features, seq_len)
+    model_dir = os.path.join(settings["cache_dir"], "models")
+    os.makedirs(model_dir, exist_ok=True)
+
+    results, frames, parent = [], [], None
+    for fold in folds:
+        started = time.time()
+        labels, ends = fold_rows(pair, fold, seq_len, horizon)
+        result = {"symbol": symbol, "tf": tf_name, "fold": fold["fold"], "train_rows": len(labels),
+                  "test_bars": len(ends)}
+        if len(labels) < MIN_TRAIN_ROWS or len(ends) == 0:
+            results.append({**result, "status": "skipped", "seconds": time.time() - started})
+            parent = None
+            continue
+
+        # Everything the fitted model depends on; an identical fold reuses the cached model
+        key = _digest({"symbol": symbol, "tf": tf_name, "seq_len": seq_len, "horizon": horizon,
+                       "atr_mult": tf_cfg["atr_mult"], "features": pair["features"].tolist(),
+                       "model": {k: settings[k] for k in ("model_type", "focal_loss", "augment", "seed")},
+                       "epochs": settings["warm_epochs"] if parent else settings["epochs"], "parent": parent},
+                      pair["values"][labels[0] - seq_len:labels[-1]].tobytes(), pair["y"][labels].tobytes())
+        model_path = os.path.join(model_dir, f"{symbol}_{tf_name}_{key}.h5")
+        if os.path.exists(model_path):
+            model, status = _load_model(model_path), "cached"
+        else:
+            set_global_seed(settings["seed"])
+            init = _load_model(os.path.join(model_dir, f"{symbol}_{tf_name}_{parent}.h5")) if parent else None
+            X = windows[labels - seq_len].transpose(0, 2, 1)
+            y = pair["y"][labels]
+            n_train = int(len(labels) * 0.85)
+            model, _ = fit_model(X[:n_train], y[:n_train], X[n_train:], y[n_train:], seq_len, X.shape[2],
+                                 settings["model_type"], settings["focal_loss"], settings["augment"], model=init,
+                                 epochs=settings["warm_epochs"] if init else settings["epochs"], verbose=0)
+            tmp_path = model_path[:-3] + ".tmp.h5"
+            model.save(tmp_path)
+            os.replace(tmp_path, model_path)
+            status = "warm" if init else "trained"
+
+        proba = model.predict(windows[ends - seq_len + 1].transpose(0, 2, 1), batch_size=1024, verbose=0)
+        # Stamped with the bar close time, as backfilled bar signals are: the next bar's open,
+        # which is the first bar simulate_trades trades the signal in (evaluate_backtest.entry_bars)
+        stamps = (pair["time"][ends] + np.timedelta64(TF_MINUTES[tf_name], "m")).astype("datetime64[s]")
+        frames.append(signals_frame(symbol, tf_name, prob_th, tf_cfg, proba, pair["close"][ends],
+                                    pair["atr"][ends], pair["trend_up"][ends], stamps, key))
+        results.append({**result, "status": status, "model_version": key, "seconds": time.time() - started})
+        parent = key if settings["warm_start"] else None
+
+    frame = pd.concat(frames, ignore_index=True) if frames else None
+    return symbol, tf_name, results, frame
+
+
+def fold_report(trade_log, folds, fold_of_version, risk_per_trade):
+    """Metrics of the out-of-sample trades per fold and overall."""
+    rows = []
+    fold_ids = trade_log["model_version"].map(fold_of_version)
+    for fold in folds:
+        trades = trade_log[(fold_ids == fold["fold"]).to_numpy()]
+        rows.append({"fold": fold["fold"], "test_start": str(pd.Timestamp(fold["test_start"]).date()),
+                     "test_end": str(pd.Timestamp(fold["test_end"]).date()),
+                     **sweep_metrics(trades["r_multiple"].to_numpy(), risk_per_trade)})
+    rows.append({"fold": "ALL", **sweep_metrics(trade_log["r_multiple"].to_numpy(), risk_per_trade)})
+    return pd.DataFrame(rows)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Walk-forward backtest with per-fold retraining of the base models.")
+    ap.add_argument("--config", required=True, help="Path to config.yaml")
+    ap.add_argument("--folds", type=int, default=6, help="Number of consecutive test windows")
+    ap.add_argument("--train-days", type=float, default=730, help="Training period before each test window")
+    ap.add_argument("--test-days", type=float, default=30, help="Test window length = retraining cadence")
+    ap.add_argument("--anchored", action="store_true", help="Train on all history up to each test window")
+    ap.add_argument("--end", default=None, help="End of the last test window (default: last bar in the data)")
+    ap.add_argument("--timeframes", default=None, help="Comma-separated timeframes (default: all in config)")
+    ap.add_argument("--model-type", default="lstm", choices=["lstm", "gru", "attention"])
+    ap.add_argument("--epochs", type=int, default=100, help="Max epochs of a from-scratch fold (early stopping)")
+    ap.add_argument("--warm-start", action="store_true",
+                    help="Continue each fold from the previous fold's model instead of training from scratch")
+    ap.add_argument("--warm-epochs", type=int, default=20, help="Max epochs of a warm-started fold")
+    ap.add_argument("--no-focal-loss", action="store_true")
+    ap.add_argument("--no-augment", action="store_true")
+    ap.add_argument("--workers", type=int, default=1,
+                    help="Worker processes; a task is one fold (a whole pair with --warm-start)")
+    ap.add_argument("--tf-threads", type=int, default=0,
+                    help="TensorFlow threads per worker (default: CPU count / workers).")
+    ap.add_argument("--data-dir", default="data", help="Directory with {symbol}_{tf}.csv price bars")
+    ap.add_argument("--cache-dir", default="outputs/walk_forward", help="Feature, model and report directory")
+    ap.add_argument("--initial-balance", type=float, default=10000)
+    ap.add_argument("--risk-per-trade", type=float, default=0.02)
+    ap.add_argument("--max-bars", type=int, default=500, help="Bars a trade may stay open before it is closed")
+    ap.add_argument("--same-bar", choices=SAME_BAR_RULES, default="sl",
+                    help="Bar touching both SL and a TP: sl (pessimistic), tp (optimistic), open (nearer level first)")
+    args = ap.parse_args()
+
+    cfg = load_cfg(args.config)
+    prob_th = cfg["thresholds"]["prob"]
+    timeframes = args.timeframes.split(",") if args.timeframes else list(cfg["timeframes"])
+    settings = {"data_dir": args.data_dir, "cache_dir": args.cache_dir, "model_type": args.model_type,
+                "focal_loss": not args.no_focal_loss, "augment": not args.no_augment, "epochs": args.epochs,
+                "warm_epochs": args.warm_epochs, "warm_start": args.warm_start, "seed": int(cfg.get("seed", 42))}
+
+    # Features once per pair, before any worker starts; workers load them from the cache
+    pairs, first_bar, last_bar = [], [], []
+    for symbol in cfg["symbols"]:
+        for tf_name in timeframes:
+            pair = load_pair(symbol, tf_name, cfg["timeframes"][tf_name], args.data_dir, args.cache_dir)
+            if pair is not None and len(pair["time"]):
+                pairs.append((symbol, tf_name))
+                first_bar.append(pair["time"][0])
+                last_bar.append(pair["time"][-1])
+    if not pairs:
+        print("[WARN] No price data found.")
+        return
+
+    folds = make_folds(args.end or max(last_bar), args.folds, args.train_days, args.test_days,
+                       args.anchored, min(first_bar))
+    print(f"[INFO] {len(folds)} folds of {args.test_days:g} days "
+          f"({pd.Timestamp(folds[0]['test_start']).date()} .. {pd.Timestamp(folds[-1]['test_end']).date()}), "
+          f"{len(pairs)} pairs, {'warm-started' if args.warm_start else 'trained from scratch'}")
+
+    # Warm starts chain the folds of a pair; otherwise every (pair, fold) is independent
+    tasks = []
+    for symbol, tf_name in pairs:
+        chains = [folds] if args.warm_start else [[fold] for fold in folds]
+        tasks += [dict(symbol=symbol, tf_name=tf_name, tf_cfg=cfg["timeframes"][tf_name], prob_th=prob_th,
+                       folds=chain, settings=settings) for chain in chains]
+
+    workers = max(1, min(args.workers, len(tasks)))
+    tf_threads = args.tf_threads or max(1, (os.cpu_count() or 1) // workers)
+    started = time.time()
+    results, frames = [], []
+    pool = None
+    try:
+        if workers > 1:
+            # spawn: TensorFlow is not fork-safe, and it matches the Windows default
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                       initializer=init_worker, initargs=(tf_threads,))
+            completed = (f.result() for f in as_completed([pool.submit(run_folds, **task) for task in tasks]))
+        else:
+            init_worker(tf_threads)
+            completed = (run_folds(**task) for task in tasks)
+        for finished, (symbol, tf_name, fold_results, frame) in enumerate(completed, 1):
+            results += fold_results
+            if frame is not None:
+                frames.append(frame)
+            for r in fold_results:
+                print(f"[{finished}/{len(tasks)}] {symbol} {tf_name} fold {r['fold']}: {r['status']}, "
+                      f"{r['train_rows']} train rows, {r['test_bars']} test bars ({r['seconds']:.1f}s)")
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+    print(f"[INFO] Folds done in {timedelta(seconds=int(time.time() - started))}")
+
+    if not frames:
+        print("[WARN] No fold produced out-of-sample signals.")
+        return
+    signals = pd.concat(frames, ignore_index=True)
+    store = os.path.join(args.cache_dir, "signal_store")
+    append_signals(store, signals)
+
+    _, _, trade_log = simulate_trades(signals, args.initial_balance, args.risk_per_trade, args.data_dir,
+                                      args.max_bars, args.same_bar)
+    if len(trade_log) == 0:
+        print("[WARN] No out-of-sample trades.")
+        return
+    fold_of_version = {r["model_version"]: r["fold"] for r in results if "model_version" in r}
+    table = fold_report(trade_log, folds, fold_of_version, args.risk_per_trade)
+
+    print(f"\n{'='*60}\nWALK-FORWARD OUT-OF-SAMPLE RESULTS\n{'='*60}")
+    print(table.to_string(index=False, float_format=lambda v: f"{v:.3f}"))
+
+    trades_path = os.path.join(args.cache_dir, "walk_forward_trades.csv")
+    report_path = os.path.join(args.cache_dir, "walk_forward_report.json")
+    trade_log.to_csv(trades_path, index=False)
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump({"settings": {**vars(args)}, "folds": table.to_dict(orient="records"), "runs": results},
+                  f, ensure_ascii=False, indent=2, default=str)
+    print(f"\n[OK] Report saved to {report_path}, {len(trade_log)} trades to {trades_path}, signals in {store}")
+
+
+if __name__ == "__main__":
+    # This is a long-running script, suppress TensorFlow warnings for cleaner output
+    os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
+    tf.get_logger().setLevel('ERROR')
+    main()